@@ -0,0 +1,396 @@
+"""
+Admission control for Happy2Align
+A global cap on concurrent orchestrations with strict priority classes (interactive, prefetch, batch),
+weighted fair queuing between users inside a class, and deadline-based load shedding
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agents.config import (
+    ADMISSION_ENABLED, ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_BATCH,
+    ADMISSION_MAX_WAIT_INTERACTIVE, ADMISSION_MAX_WAIT_PREFETCH, ADMISSION_USER_WEIGHTS
+)
+
+logger = logging.getLogger(__name__)
+
+# Prioriteitsklassen, van hoog naar laag
+INTERACTIVE, PREFETCH, BATCH = "interactive", "prefetch", "batch"
+PRIORITIES = (INTERACTIVE, PREFETCH, BATCH)
+
+# Standaard maximale wachttijd per klasse (seconden)
+DEFAULT_MAX_WAIT = {INTERACTIVE: 30.0, PREFETCH: 5.0, BATCH: 600.0}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed because it would (or did) miss its deadline, or the queue is full"""
+
+    def __init__(self, reason: str, priority: str, queue_position: Optional[int] = None,
+                 estimated_wait: Optional[float] = None):
+        super().__init__(f"{priority} request shed ({reason})")
+        self.reason = reason
+        self.priority = priority
+        self.queue_position = queue_position
+        self.estimated_wait = estimated_wait
+
+
+@dataclass
+class Ticket:
+    """One request waiting for, or holding, a slot"""
+    user_id: str
+    priority: str
+    deadline: float  # time.monotonic()
+    start_tag: float = 0.0
+    seq: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted_at: Optional[float] = None
+    abandoned: bool = False
+    wake: Optional[Callable[[], None]] = field(default=None, repr=False)
+    # Wordt aangeroepen met (positie, geschatte wachttijd) zolang de ticket wacht
+    on_position: Optional[Callable[[int, Optional[float]], None]] = field(default=None, repr=False)
+
+    @property
+    def granted(self) -> bool:
+        return self.granted_at is not None
+
+
+class AdmissionController:
+    """
+    Admit at most max_concurrent orchestrations at a time
+
+    Waiting requests are served strictly by priority class. Within a class,
+    users are served by start-time fair queuing: each request gets a virtual
+    start tag max(class virtual time, the user's previous finish tag), and a
+    user's finish tag advances by 1 / weight per request. One user who sends
+    many requests therefore only delays their own requests.
+
+    A request is shed up front when the estimated wait (from the queue position
+    and the mean service time) exceeds its deadline, and again when the deadline
+    passes while it waits.
+    """
+
+    def __init__(self,
+                 max_concurrent: int = 16,
+                 max_wait: Optional[Dict[str, float]] = None,
+                 weights: Optional[Dict[str, float]] = None,
+                 default_weight: float = 1.0,
+                 max_queue: int = 1000,
+                 enabled: bool = True):
+        """
+        Initialize the controller
+
+        Args:
+            max_concurrent: Orchestrations running at the same time
+            max_wait: Default seconds a request of each priority class may wait
+            weights: Fair-queuing weight per user id (higher = larger share)
+            default_weight: Weight of users without an explicit weight
+            max_queue: Waiting requests before new ones are shed immediately
+            enabled: Enforce the limits (otherwise every request is admitted at once, but still counted)
+        """
+        self.max_concurrent = max_concurrent
+        self.max_wait = {**DEFAULT_MAX_WAIT, **(max_wait or {})}
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.max_queue = max_queue
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._queues: Dict[str, List[Tuple[float, int, Ticket]]] = {priority: [] for priority in PRIORITIES}
+        self._waiting = 0
+        self._running = 0
+        self._virtual_time = {priority: 0.0 for priority in PRIORITIES}
+        self._finish_tags: Dict[Tuple[str, str], float] = {}
+        self._seq = itertools.count()
+        # Gemiddelde bezettingsduur van een slot (EWMA), voor de wachttijdschatting
+        self._service_seconds: Optional[float] = None
+        self._stats = {priority: {"admitted": 0, "queued": 0, "shed_estimate": 0, "shed_deadline": 0,
+                                  "shed_full": 0, "wait_seconds": 0.0} for priority in PRIORITIES}
+
+    # ------------------------------------------------------------------
+    # Wachtrij
+    # ------------------------------------------------------------------
+
+    def _weight(self, user_id: str) -> float:
+        return max(self.weights.get(user_id, self.default_weight), 1e-6)
+
+    def _ordered(self) -> List[Ticket]:
+        """Waiting tickets in the order they will be served (caller holds the lock)"""
+        ordered = []
+        for priority in PRIORITIES:
+            ordered.extend(ticket for _, _, ticket in sorted(self._queues[priority]) if not ticket.abandoned)
+        return ordered
+
+    def _estimate(self, position: int) -> Optional[float]:
+        """Expected wait for the request at `position` (0 = next in line)"""
+        if self._service_seconds is None:
+            return None
+        return (position // self.max_concurrent + 1) * self._service_seconds
+
+    def _enqueue(self, user_id: str, priority: str, max_wait: Optional[float],
+                 on_position: Optional[Callable[[int, Optional[float]], None]]) -> Ticket:
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority!r}")
+        now = time.monotonic()
+        wait = self.max_wait[priority] if max_wait is None else max_wait
+        ticket = Ticket(user_id=user_id, priority=priority, deadline=now + wait, on_position=on_position)
+        stats = self._stats[priority]
+        with self._lock:
+            if not self.enabled:
+                self._grant(ticket, now)
+                return ticket
+            # Alleen direct toelaten als niemand met dezelfde of hogere prioriteit wacht
+            ahead = any(not waiting.abandoned for p in PRIORITIES[:PRIORITIES.index(priority) + 1]
+                        for _, _, waiting in self._queues[p])
+            if self._running < self.max_concurrent and not ahead:
+                self._grant(ticket, now)
+                return ticket
+            if self._waiting >= self.max_queue:
+                stats["shed_full"] += 1
+                raise AdmissionRejected("queue full", priority, self._waiting, self._estimate(self._waiting))
+
+            key = (priority, user_id)
+            ticket.start_tag = max(self._virtual_time[priority], self._finish_tags.get(key, 0.0))
+            self._finish_tags[key] = ticket.start_tag + 1.0 / self._weight(user_id)
+            ticket.seq = next(self._seq)
+            heapq.heappush(self._queues[priority], (ticket.start_tag, ticket.seq, ticket))
+            self._waiting += 1
+
+            ordered = self._ordered()
+            position = ordered.index(ticket)
+            estimate = self._estimate(position)
+            if estimate is not None and estimate > wait:
+                # Zou de deadline toch missen: meteen afwijzen i.p.v. eerst te laten wachten
+                ticket.abandoned = True
+                self._waiting -= 1
+                self._finish_tags[key] -= 1.0 / self._weight(user_id)
+                stats["shed_estimate"] += 1
+                raise AdmissionRejected("would miss deadline", priority, position, estimate)
+            stats["queued"] += 1
+        if on_position is not None:
+            on_position(position, estimate)
+        return ticket
+
+    def _grant(self, ticket: Ticket, now: float) -> None:
+        """Give the ticket a slot (caller holds the lock)"""
+        ticket.granted_at = now
+        self._running += 1
+        stats = self._stats[ticket.priority]
+        stats["admitted"] += 1
+        stats["wait_seconds"] += now - ticket.enqueued_at
+
+    def _dispatch(self) -> List[Ticket]:
+        """Hand free slots to the next tickets; returns the tickets to wake (caller holds the lock)"""
+        woken = []
+        now = time.monotonic()
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._running < self.max_concurrent:
+                start_tag, _, ticket = heapq.heappop(queue)
+                if ticket.abandoned:
+                    continue
+                self._waiting -= 1
+                if ticket.deadline <= now:
+                    # Deadline al verstreken: de wachtende kant gooit AdmissionRejected
+                    ticket.abandoned = True
+                    self._stats[priority]["shed_deadline"] += 1
+                    woken.append(ticket)
+                    continue
+                self._virtual_time[priority] = start_tag
+                self._grant(ticket, now)
+                woken.append(ticket)
+        if woken:
+            self._prune_finish_tags()
+        return woken
+
+    def _prune_finish_tags(self) -> None:
+        """
+        Forget finish tags the virtual time has passed (caller holds the lock)
+
+        Such a tag no longer affects a start tag (max(virtual time, tag) is the
+        virtual time), so without pruning the dict would keep one entry per user since boot.
+        """
+        stale = [key for key, tag in self._finish_tags.items() if tag <= self._virtual_time[key[0]]]
+        for key in stale:
+            del self._finish_tags[key]
+
+    def _notify(self, woken: List[Ticket]) -> None:
+        """Wake granted tickets and send fresh positions to the ones still waiting (outside the lock)"""
+        for ticket in woken:
+            if ticket.wake is not None:
+                ticket.wake()
+        with self._lock:
+            updates = [(ticket, position, self._estimate(position)) for position, ticket in enumerate(self._ordered())
+                       if ticket.on_position is not None]
+        for ticket, position, estimate in updates:
+            ticket.on_position(position, estimate)
+
+    def release(self, ticket: Ticket) -> None:
+        """Return a slot"""
+        with self._lock:
+            if not ticket.granted or ticket.abandoned:
+                return
+            ticket.abandoned = True  # Dubbel vrijgeven telt niet
+            self._running -= 1
+            served = time.monotonic() - ticket.granted_at
+            self._service_seconds = served if self._service_seconds is None else \
+                0.8 * self._service_seconds + 0.2 * served
+            woken = self._dispatch()
+        self._notify(woken)
+
+    def _abandon(self, ticket: Ticket) -> bool:
+        """
+        Give up waiting (deadline passed or caller cancelled)
+
+        Returns:
+            True when the ticket was granted in the meantime (the caller owns the slot)
+        """
+        with self._lock:
+            if ticket.granted:
+                return True
+            if not ticket.abandoned:
+                ticket.abandoned = True
+                self._waiting -= 1
+                self._stats[ticket.priority]["shed_deadline"] += 1
+            woken = self._dispatch()
+        self._notify(woken)
+        return False
+
+    def _rejected(self, ticket: Ticket) -> AdmissionRejected:
+        with self._lock:
+            position = len(self._ordered())
+        return AdmissionRejected("deadline passed", ticket.priority, position, self._estimate(position))
+
+    # ------------------------------------------------------------------
+    # Publieke API
+    # ------------------------------------------------------------------
+
+    def acquire(self, user_id: str, priority: str = INTERACTIVE, max_wait: Optional[float] = None,
+                on_position: Optional[Callable[[int, Optional[float]], None]] = None) -> Ticket:
+        """
+        Block until a slot is free
+
+        Args:
+            user_id: Key of the fair queue (the Flask session's user, or the session id)
+            priority: INTERACTIVE, PREFETCH or BATCH
+            max_wait: Seconds this request may wait (None = class default)
+            on_position: Called with (queue position, estimated wait) while the request waits
+
+        Returns:
+            The granted ticket; pass it to release()
+
+        Raises:
+            AdmissionRejected: When the request is shed
+        """
+        granted = threading.Event()
+        ticket = self._enqueue(user_id, priority, max_wait, on_position)
+        if ticket.granted:
+            return ticket
+        ticket.wake = granted.set
+        # Granted tussen _enqueue en het zetten van wake
+        if ticket.granted or ticket.abandoned:
+            granted.set()
+        if granted.wait(max(0.0, ticket.deadline - time.monotonic())) and ticket.granted:
+            return ticket
+        if self._abandon(ticket):
+            return ticket
+        raise self._rejected(ticket)
+
+    async def acquire_async(self, user_id: str, priority: str = INTERACTIVE, max_wait: Optional[float] = None,
+                            on_position: Optional[Callable[[int, Optional[float]], None]] = None) -> Ticket:
+        """Async variant of acquire(); waits without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        ticket = self._enqueue(user_id, priority, max_wait, on_position)
+        if ticket.granted:
+            return ticket
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        ticket.wake = wake
+        if ticket.granted or ticket.abandoned:
+            wake()
+        try:
+            await asyncio.wait_for(granted, max(0.0, ticket.deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._abandon(ticket):
+                self.release(ticket)
+            raise
+        if ticket.granted or self._abandon(ticket):
+            return ticket
+        raise self._rejected(ticket)
+
+    @contextmanager
+    def admit(self, user_id: str, priority: str = INTERACTIVE, max_wait: Optional[float] = None,
+              on_position: Optional[Callable[[int, Optional[float]], None]] = None):
+        """Hold a slot for the duration of the with-block"""
+        ticket = self.acquire(user_id, priority, max_wait, on_position)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def admit_async(self, user_id: str, priority: str = INTERACTIVE, max_wait: Optional[float] = None):
+        """Async variant of admit()"""
+        ticket = await self.acquire_async(user_id, priority, max_wait)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        """Slots, queue lengths and per-class counters"""
+        with self._lock:
+            classes = {priority: dict(counts) for priority, counts in self._stats.items()}
+            queued = {priority: sum(1 for _, _, t in queue if not t.abandoned) for priority, queue in self._queues.items()}
+            stats = {
+                "max_concurrent": self.max_concurrent,
+                "running": self._running,
+                "waiting": self._waiting,
+                "mean_service_seconds": self._service_seconds,
+            }
+        for priority, counts in classes.items():
+            wait_seconds = counts.pop("wait_seconds")
+            counts["waiting"] = queued[priority]
+            counts["mean_wait_seconds"] = wait_seconds / counts["admitted"] if counts["admitted"] else None
+        stats["classes"] = classes
+        return stats
+
+    def position(self, user_id: str, priority: str = INTERACTIVE) -> Tuple[int, Optional[float]]:
+        """
+        Queue position and estimated wait a new request of this user would get right now
+
+        Follows the fair-queuing order: the user's finish tag decides where the
+        request lands among the waiting requests of its class. 0 with no estimate
+        when it would be admitted at once.
+        """
+        with self._lock:
+            ahead = [ticket for p in PRIORITIES[:PRIORITIES.index(priority) + 1]
+                     for _, _, ticket in self._queues[p] if not ticket.abandoned]
+            if not self.enabled or (self._running < self.max_concurrent and not ahead):
+                return 0, None
+            start_tag = max(self._virtual_time[priority], self._finish_tags.get((priority, user_id), 0.0))
+            # Een nieuwe ticket krijgt het hoogste volgnummer: gelijke start tags gaan voor
+            position = sum(1 for ticket in ahead if ticket.priority != priority or ticket.start_tag <= start_tag)
+            return position, self._estimate(position)
+
+
+# Singleton instance
+admission = AdmissionController(
+    max_concurrent=ADMISSION_MAX_CONCURRENT,
+    max_wait={INTERACTIVE: ADMISSION_MAX_WAIT_INTERACTIVE, PREFETCH: ADMISSION_MAX_WAIT_PREFETCH,
+              BATCH: ADMISSION_MAX_WAIT_BATCH},
+    weights=ADMISSION_USER_WEIGHTS,
+    max_queue=ADMISSION_MAX_QUEUE,
+    enabled=ADMISSION_ENABLED
+)
@@ -0,0 +1,103 @@
+"""
+Batch processing for Happy2Align
+Runs many (session_id, message) items through a bounded pool: items of one session run in order,
+different sessions run in parallel, and results are yielded in completion order
+"""
+
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DONE, FAILED, SKIPPED = "done", "failed", "skipped"
+
+
+@dataclass
+class BatchItem:
+    """One message of a batch"""
+    index: int
+    session_id: str
+    message: str
+    id: Optional[Any] = None  # Vrij te kiezen kenmerk van de client, komt terug in het resultaat
+
+
+def _line(item: BatchItem, status: str, **fields: Any) -> Dict[str, Any]:
+    line = {"index": item.index, "session_id": item.session_id, "status": status}
+    if item.id is not None:
+        line["id"] = item.id
+    line.update(fields)
+    return line
+
+
+def run_batch(items: List[BatchItem],
+              work: Callable[[BatchItem], Any],
+              concurrency: int = 4,
+              describe_error: Optional[Callable[[Exception], Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Process a batch and yield one result per item as soon as it finishes
+
+    Items are grouped per session; each session is one chain that runs its items
+    in the order they were given. At most `concurrency` chains run at a time.
+    When an item fails, the later items of the same session are skipped (they
+    would run against a conversation that is missing a turn). The last value is
+    a summary with the counts per status.
+
+    Closing the iterator early (client disconnect) stops chains before their
+    next item and drops chains that have not started.
+
+    Args:
+        items: The items, in request order
+        work: Called with each item on a pool thread; returns the item's result
+        concurrency: Sessions processed at the same time
+        describe_error: Turns an exception into the fields of a failed result (default: its message)
+
+    Yields:
+        {"index", "session_id", "status", "result" | error fields} per item, then {"summary": {...}}
+    """
+    describe_error = describe_error or (lambda error: {"error": str(error)})
+    chains: "OrderedDict[str, List[BatchItem]]" = OrderedDict()
+    for item in items:
+        chains.setdefault(item.session_id, []).append(item)
+
+    results: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+    stop = threading.Event()
+
+    def run_chain(chain: List[BatchItem]) -> None:
+        for position, item in enumerate(chain):
+            if stop.is_set():
+                return
+            try:
+                results.put(_line(item, DONE, result=work(item)))
+            except Exception as e:
+                logger.warning(f"Batch item {item.index} ({item.session_id}) failed: {e}")
+                try:
+                    fields = describe_error(e)
+                except Exception:
+                    fields = {"error": str(e)}
+                results.put(_line(item, FAILED, **fields))
+                for skipped in chain[position + 1:]:
+                    results.put(_line(skipped, SKIPPED, error=f"Eerder bericht {item.index} van deze sessie is mislukt"))
+                return
+
+    start = time.perf_counter()
+    counts = {DONE: 0, FAILED: 0, SKIPPED: 0}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chains))),
+                                                     thread_name_prefix="batch")
+    try:
+        for chain in chains.values():
+            executor.submit(run_chain, chain)
+        for _ in range(len(items)):
+            line = results.get()
+            counts[line["status"]] += 1
+            yield line
+        yield {"summary": {**counts, "items": len(items), "sessions": len(chains),
+                           "elapsed_seconds": time.perf_counter() - start}}
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,149 @@
+"""
+Circuit breaker for Happy2Align
+Tracks the health of a model and short-circuits calls while it is failing
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is short-circuited because the model's breaker is open"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit breaker for {name} is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker tripped by failure rate and slow calls"""
+
+    def __init__(self,
+                 name: str,
+                 failure_rate_threshold: float = 0.5,
+                 slow_call_seconds: Optional[float] = None,
+                 window_size: int = 20,
+                 min_calls: int = 5,
+                 open_seconds: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
+        Initialize the breaker
+
+        Args:
+            name: Name of the guarded model
+            failure_rate_threshold: Fraction of failed (or slow) calls in the window that opens the breaker
+            slow_call_seconds: Calls slower than this count as failures (None disables)
+            window_size: Number of most recent calls in the rolling window
+            min_calls: Minimum calls in the window before the breaker can open
+            open_seconds: Time the breaker stays open before allowing a trial call
+            half_open_max_calls: Concurrent trial calls allowed while half-open
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = CLOSED
+        self._window: Deque[bool] = deque(maxlen=window_size)  # True = mislukt of traag
+        self._opened_at = 0.0
+        self._half_open_inflight = 0
+        self._lock = threading.Lock()
+        self._stats = {"successes": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        """Current state (open turns into half-open once the cool-down has passed)"""
+        with self._lock:
+            self._maybe_half_open(time.time())
+            return self._state
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_inflight = 0
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a call may go to the model
+
+        A True answer while half-open reserves a trial slot; the caller must
+        report the outcome with record_success, record_failure or release.
+        """
+        with self._lock:
+            self._maybe_half_open(time.time())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_inflight < self.half_open_max_calls:
+                self._half_open_inflight += 1
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self, latency: float) -> None:
+        """Report a successful call and its latency"""
+        slow = self.slow_call_seconds is not None and latency > self.slow_call_seconds
+        with self._lock:
+            self._stats["successes"] += 1
+            if slow:
+                self._stats["slow_calls"] += 1
+            if self._state == HALF_OPEN:
+                self._half_open_inflight = max(0, self._half_open_inflight - 1)
+                if slow:
+                    self._open()
+                else:
+                    self._state = CLOSED
+                    self._window.clear()
+                return
+            self._record(slow)
+
+    def record_failure(self) -> None:
+        """Report a failed or timed-out call"""
+        with self._lock:
+            self._stats["failures"] += 1
+            if self._state == HALF_OPEN:
+                self._half_open_inflight = max(0, self._half_open_inflight - 1)
+                self._open()
+                return
+            self._record(True)
+
+    def release(self) -> None:
+        """Give back a half-open trial slot without an outcome (e.g. a cancelled call)"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_inflight = max(0, self._half_open_inflight - 1)
+
+    def _record(self, failed: bool) -> None:
+        self._window.append(failed)
+        if self._state == CLOSED and len(self._window) >= self.min_calls:
+            failure_rate = sum(self._window) / len(self._window)
+            if failure_rate >= self.failure_rate_threshold:
+                self._open()
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.time()
+        self._window.clear()
+        self._stats["opened"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return state and counters"""
+        with self._lock:
+            now = time.time()
+            self._maybe_half_open(now)
+            window = list(self._window)
+            return {
+                "state": self._state,
+                "failure_rate": sum(window) / len(window) if window else 0.0,
+                "window_calls": len(window),
+                "open_for": now - self._opened_at if self._state != CLOSED else 0.0,
+                **self._stats,
+            }
@@ -25,10 +25,170 @@ MODEL_TIMEOUT = int(os.getenv("MODEL_TIMEOUT", "30"))  # 30 seconden voor primar
 FALLBACK_TIMEOUT = int(os.getenv("FALLBACK_TIMEOUT", "10"))  # 10 seconden voor fallback
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "45"))  # Totale request timeout
 
+# HTTP connection pool configuratie (één gedeelde pool voor alle OpenAI verkeer)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_POOL_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))  # seconden
+
+# Hedging configuratie: start de fallback al na een korte delay i.p.v. na MODEL_TIMEOUT
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY")) if os.getenv("HEDGE_DELAY") else None  # Vaste delay, anders p95
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "8"))  # Delay zolang er te weinig metingen zijn
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", str(MODEL_TIMEOUT)))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # Metingen nodig voor een p95-schatting
+
+# Circuit breaker configuratie per model
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5"))  # Fractie mislukte/trage calls
+CIRCUIT_BREAKER_SLOW_CALL = float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL", "20"))  # Trager dan dit telt als fout (s)
+CIRCUIT_BREAKER_WINDOW = int(os.getenv("CIRCUIT_BREAKER_WINDOW", "20"))  # Aantal recente calls in het venster
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "5"))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "30"))  # Cool-down voor half-open
+CIRCUIT_BREAKER_PROBE_INTERVAL = float(os.getenv("CIRCUIT_BREAKER_PROBE_INTERVAL", "10"))  # Interval achtergrond-probes
+
+# Rate limiting configuratie (client-side token buckets per model, gedeeld tussen workers)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")  # sqlite (gedeeld tussen processen) of memory
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "instance/rate_limits.db")
+RATE_LIMIT_DEFAULT_RPM = int(os.getenv("RATE_LIMIT_DEFAULT_RPM", "500"))  # requests per minuut
+RATE_LIMIT_DEFAULT_TPM = int(os.getenv("RATE_LIMIT_DEFAULT_TPM", "200000"))  # tokens per minuut
+# Limieten per model, formaat: "gpt-4.1-2025-04-14=500:30000,o4-mini-2025-04-16=1000:200000"
+RATE_LIMITS = {
+    model.strip(): tuple(int(part) for part in limits.split(":", 1))
+    for model, limits in (
+        item.split("=", 1)
+        for item in os.getenv("RATE_LIMITS", "").split(",")
+        if "=" in item
+    )
+}
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "20"))  # Max wachttijd op capaciteit (s)
+RATE_LIMIT_RETRY_BUDGET = float(os.getenv("RATE_LIMIT_RETRY_BUDGET", "5"))  # Wacht op Retry-After i.p.v. fallback tot zoveel seconden
+RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv("RATE_LIMIT_COMPLETION_TOKENS", "500"))  # Geschatte output tokens per call
+
+# Embedding batch configuratie
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "2048"))  # Max inputs per request
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "250000"))  # Max (geschatte) tokens per request
+EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", "4"))  # Gelijktijdige requests
+
+# Embedding cache configuratie (persistente vectoren, gedeeld tussen worker processen)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "instance/embedding_cache")
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # float32 of float16 (halve opslag)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # Compactie boven deze grootte
+EMBEDDING_CACHE_READ_ONLY = os.getenv("EMBEDDING_CACHE_READ_ONLY", "false").lower() == "true"  # Workers die alleen lezen
+
+# Orchestratie configuratie
+ORCHESTRATOR_SPECULATION = os.getenv("ORCHESTRATOR_SPECULATION", "true").lower() == "true"  # Start decompositie/ToM al tijdens het routeren
+TURN_ANALYSIS_FUSED = os.getenv("TURN_ANALYSIS_FUSED", "false").lower() == "true"  # Router + expertise + sentiment in één JSON-call
+QUESTION_PREFETCH_ENABLED = os.getenv("QUESTION_PREFETCH_ENABLED", "true").lower() == "true"  # Verfijn de volgende vraag al op de achtergrond
+QUESTION_PREFETCH_WORKERS = int(os.getenv("QUESTION_PREFETCH_WORKERS", "4"))
+
+# Gespreksgeheugen (laatste berichten letterlijk + doorlopende samenvatting van oudere beurten)
+MEMORY_SUMMARY_ENABLED = os.getenv("MEMORY_SUMMARY_ENABLED", "true").lower() == "true"
+MEMORY_KEEP_MESSAGES = int(os.getenv("MEMORY_KEEP_MESSAGES", "8"))  # Altijd letterlijk meegestuurd
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))  # Max tokens gespreksgeschiedenis per prompt
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+MEMORY_SUMMARY_BATCH = int(os.getenv("MEMORY_SUMMARY_BATCH", "4"))  # Samenvatten per zoveel verouderde berichten
+MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", "1024"))
+
+# Lokale router classifier (TF-IDF + logistic regression vóór de LLM router)
+ROUTER_CLASSIFIER_ENABLED = os.getenv("ROUTER_CLASSIFIER_ENABLED", "true").lower() == "true"
+ROUTER_MODEL_DIR = os.getenv("ROUTER_MODEL_DIR", "instance/models/router")
+ROUTER_MODEL_VERSION = os.getenv("ROUTER_MODEL_VERSION", "latest")  # Versienummer of "latest"
+# Gekalibreerd met 5-fold cross-validatie op evaluation/data (130 berichten): bij 0.7 wordt ~75% lokaal
+# beantwoord zonder fouten, bij 0.85 ~28%. `python -m agents.router_classifier train` toont de tabel opnieuw
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.7"))  # Lager = LLM beslist
+ROUTER_DECISION_LOG = os.getenv("ROUTER_DECISION_LOG", "instance/router_decisions.jsonl")  # Leeg = niet loggen
+ROUTER_LOG_TEXT = os.getenv("ROUTER_LOG_TEXT", "false").lower() == "true"  # Anders alleen hash + lengte in de log
+
+# Lokale ToM-schatter (lexicale features + gekalibreerde classifier vóór de expertise/sentiment prompts)
+TOM_ESTIMATOR_ENABLED = os.getenv("TOM_ESTIMATOR_ENABLED", "true").lower() == "true"
+TOM_MODEL_DIR = os.getenv("TOM_MODEL_DIR", "instance/models/tom")
+TOM_MODEL_VERSION = os.getenv("TOM_MODEL_VERSION", "latest")  # Versienummer of "latest"
+# Gekalibreerd met 5-fold cross-validatie op evaluation/data: expertise bij 0.6 ~55% lokaal (93% juist),
+# sentiment bij 0.7 ~58% lokaal (95% juist). `python -m agents.tom_estimator train` toont de tabellen opnieuw
+TOM_EXPERTISE_THRESHOLD = float(os.getenv("TOM_EXPERTISE_THRESHOLD", "0.6"))  # Lager = LLM beslist
+TOM_SENTIMENT_THRESHOLD = float(os.getenv("TOM_SENTIMENT_THRESHOLD", "0.7"))
+TOM_DECISION_LOG = os.getenv("TOM_DECISION_LOG", "instance/tom_decisions.jsonl")  # Leeg = niet loggen
+TOM_LOG_TEXT = os.getenv("TOM_LOG_TEXT", "false").lower() == "true"  # Anders alleen hash + lengte in de log
+
+# Workflow verfijning via edit-operaties (insert/delete/replace) i.p.v. de hele workflow opnieuw genereren
+WORKFLOW_PATCH_ENABLED = os.getenv("WORKFLOW_PATCH_ENABLED", "true").lower() == "true"
+WORKFLOW_PATCH_MIN_STEPS = int(os.getenv("WORKFLOW_PATCH_MIN_STEPS", "6"))  # Kortere workflows: volledig opnieuw
+
+# Sessie state opslag (vervangt de session_states dict in routes/api.py)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite")  # memory, sqlite (gedeeld tussen processen), redis of tiered
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "instance/sessions.db")
+SESSION_STORE_REDIS_URL = os.getenv("SESSION_STORE_REDIS_URL", "redis://localhost:6379/0")
+SESSION_STORE_TTL = float(os.getenv("SESSION_STORE_TTL", "86400"))  # seconden na de laatste beurt; 0 = nooit
+SESSION_STORE_MAX_ENTRIES = int(os.getenv("SESSION_STORE_MAX_ENTRIES", "10000"))  # memory: LRU-grootte, tiered: max hot sessies
+# Tiered backend: actieve sessies in geheugen, inactieve gecomprimeerd naar lokale schijf
+SESSION_COLD_PATH = os.getenv("SESSION_COLD_PATH", "instance/sessions_cold.db")
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "900"))  # inactief langer dan dit => naar schijf
+SESSION_COLD_TTL = float(os.getenv("SESSION_COLD_TTL", str(30 * 86400)))  # bewaartermijn op schijf; 0 = altijd
+
+# Asynchrone job mode voor /api/process (job id direct terug, beurt in een begrensde worker pool)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))  # Gelijktijdige beurten
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))  # Meer openstaande jobs => 503
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))  # Seconden dat een resultaat op te halen is
+JOB_MAX_EVENTS = int(os.getenv("JOB_MAX_EVENTS", "500"))  # Events per job voor nieuwe SSE-abonnees; oudere vervallen
+
+# Batch endpoint (/api/process/batch): veel berichten in één request, resultaten als NDJSON
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # Standaard aantal sessies tegelijk
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))  # Bovengrens voor "concurrency" in het request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))  # Meer items per request => 400
+
+# Admission control: globale limiet op gelijktijdige orchestraties, eerlijke wachtrij per gebruiker
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))  # Gelijktijdige orchestraties per proces
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "1000"))  # Meer wachtenden => direct afwijzen
+# Maximale wachttijd per prioriteitsklasse (s); wie de deadline zou missen wordt afgewezen
+ADMISSION_MAX_WAIT_INTERACTIVE = float(os.getenv("ADMISSION_MAX_WAIT_INTERACTIVE", "30"))
+ADMISSION_MAX_WAIT_PREFETCH = float(os.getenv("ADMISSION_MAX_WAIT_PREFETCH", "5"))
+ADMISSION_MAX_WAIT_BATCH = float(os.getenv("ADMISSION_MAX_WAIT_BATCH", "600"))
+# Gewicht per gebruiker in de eerlijke wachtrij, formaat: "user:42=2,user:7=0.5" (standaard 1)
+ADMISSION_USER_WEIGHTS = {
+    user.strip(): float(weight)
+    for user, weight in (
+        item.rsplit("=", 1)
+        for item in os.getenv("ADMISSION_USER_WEIGHTS", "").split(",")
+        if "=" in item
+    )
+}
+
 # Agent configuratie
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "2000"))
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 
+# Response cache configuratie (exact-match cache voor LLM antwoorden)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "instance/response_cache.db")  # Leeg = alleen geheugen
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconden
+RESPONSE_CACHE_MAX_MEMORY = int(os.getenv("RESPONSE_CACHE_MAX_MEMORY", "1000"))  # entries in geheugen
+RESPONSE_CACHE_MAX_DISK = int(os.getenv("RESPONSE_CACHE_MAX_DISK", "50000"))  # entries op schijf
+
+# Semantic cache configuratie (embedding-similarity cache voor bijna-identieke prompts)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "512"))  # entries per prompt-soort
+SEMANTIC_CACHE_EMBEDDING_MODEL = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "text-embedding-ada-002")
+SEMANTIC_CACHE_DEFAULT_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_DEFAULT_THRESHOLD", "0.95"))
+# Prompt-soorten die de cache gebruiken. "route" staat standaard uit: ada-002 geeft vragen over hetzelfde
+# onderwerp met tegengestelde bedoeling al >0.93, en goedkope routering doet de lokale router al
+SEMANTIC_CACHE_KINDS = {
+    kind.strip() for kind in os.getenv("SEMANTIC_CACHE_KINDS", "decompose").split(",") if kind.strip()
+}
+# Drempel per prompt-soort, formaat: "route=0.97,decompose=0.96"
+SEMANTIC_CACHE_THRESHOLDS = {
+    kind.strip(): float(value)
+    for kind, value in (
+        item.split("=", 1)
+        for item in os.getenv("SEMANTIC_CACHE_THRESHOLDS", "decompose=0.96").split(",")
+        if "=" in item
+    )
+}
+
 # Systeem prompts
 ROUTER_SYSTEM_PROMPT = """Je bent een Router agent die berichten analyseert en doorstuurt naar de juiste agent.
 Analyseer het bericht en bepaal of het gaat om:
@@ -0,0 +1,227 @@
+"""
+Conversation memory for Happy2Align
+Keeps the last turns verbatim plus a rolling summary of older turns, so prompts stay within a token budget
+"""
+
+import concurrent.futures
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langchain.schema import HumanMessage
+
+from agents.event_loop import event_loop
+from agents.config import (
+    MEMORY_SUMMARY_ENABLED, MEMORY_KEEP_MESSAGES, MEMORY_TOKEN_BUDGET,
+    MEMORY_SUMMARY_TOKENS, MEMORY_SUMMARY_BATCH, MEMORY_CACHE_SIZE
+)
+from agents.llm_client import llm_client
+from agents.prompts import CONVERSATION_SUMMARY_PROMPT
+from agents.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+def format_messages(messages: List[Dict]) -> str:
+    """Render messages the way the prompts expect them ("role: content" per line)"""
+    return "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+
+
+def _truncate(text: str, tokens: int) -> str:
+    """Cut text so RateLimiter.estimate_tokens stays within `tokens` (empty when nothing fits)"""
+    if RateLimiter.estimate_tokens(text) <= tokens:
+        return text
+    return text[:max(0, tokens - 1) * 4]
+
+
+def _prefix_keys(history: List[Dict]) -> List[str]:
+    """Rolling hash of every prefix: keys[n] identifies history[:n]"""
+    digest = hashlib.sha256()
+    keys = [digest.hexdigest()]
+    for msg in history:
+        digest.update(f"{msg['role']}\x00{msg['content']}\x1e".encode("utf-8"))
+        keys.append(digest.copy().hexdigest())
+    return keys
+
+
+class ConversationMemory:
+    """
+    Rolling summary memory shared by all conversations
+
+    Summaries are keyed by a hash of the messages they cover, so the memory needs
+    no session id: any history that starts with a summarized prefix reuses it.
+    A summary is extended incrementally (previous summary + the next batch of
+    messages) on a background worker; until it is ready, prompts fall back to
+    the older summary plus as many verbatim messages as the budget allows.
+    """
+
+    def __init__(self,
+                 client=None,
+                 enabled: bool = MEMORY_SUMMARY_ENABLED,
+                 keep_messages: int = MEMORY_KEEP_MESSAGES,
+                 token_budget: int = MEMORY_TOKEN_BUDGET,
+                 summary_tokens: int = MEMORY_SUMMARY_TOKENS,
+                 batch: int = MEMORY_SUMMARY_BATCH,
+                 cache_size: int = MEMORY_CACHE_SIZE):
+        """
+        Initialize the memory
+
+        Args:
+            client: LLM client used for summarization (defaults to the shared llm_client)
+            enabled: Summarize older turns (otherwise only the token budget is enforced)
+            keep_messages: Most recent messages that are always kept verbatim
+            token_budget: Default token budget of a rendered conversation
+            summary_tokens: Target length of the summary
+            batch: Summarize once this many messages fell out of the verbatim window
+            cache_size: Summaries kept in memory (LRU)
+        """
+        self.client = client or llm_client
+        self.enabled = enabled
+        self.keep_messages = keep_messages
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.batch = max(1, batch)
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[str, tuple]" = OrderedDict()  # prefix key -> (messages covered, summary)
+        self._pending: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"renders": 0, "summary_hits": 0, "summaries": 0, "errors": 0,
+                       "trimmed_messages": 0, "tokens_saved": 0}
+
+    def _latest_summary(self, keys: List[str], limit: int) -> tuple:
+        """Longest summarized prefix of at most `limit` messages: (messages covered, summary)"""
+        with self._lock:
+            for n in range(limit, 0, -1):
+                entry = self._summaries.get(keys[n])
+                if entry is not None:
+                    self._summaries.move_to_end(keys[n])
+                    return entry
+        return 0, ""
+
+    def render(self, history: List[Dict], token_budget: Optional[int] = None, refresh: bool = True) -> str:
+        """
+        Render a conversation for a prompt within a token budget
+
+        Args:
+            history: Full conversation
+            token_budget: Maximum tokens of the rendered text (defaults to the memory's budget)
+            refresh: Schedule a background summary update when enough turns aged out
+
+        Returns:
+            Summary of older turns followed by the most recent messages verbatim
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        full_text = format_messages(history)
+        with self._lock:
+            self._stats["renders"] += 1
+        if RateLimiter.estimate_tokens(full_text) <= budget:
+            return full_text
+
+        keys = _prefix_keys(history)
+        window_start = max(0, len(history) - self.keep_messages)
+        covered, summary = (0, "")
+        if self.enabled:
+            covered, summary = self._latest_summary(keys, window_start)
+            if refresh and window_start - covered >= self.batch:
+                self._schedule(history[:window_start], keys[window_start], covered, summary)
+        if summary:
+            with self._lock:
+                self._stats["summary_hits"] += 1
+
+        # Het laatste bericht gaat altijd mee (zo nodig ingekort), de samenvatting krijgt wat daarna over is
+        messages = [f"{msg['role']}: {msg['content']}" for msg in history[covered:]]
+        # Ruimte voor de "[n earlier messages omitted]" regel
+        remaining = budget - RateLimiter.estimate_tokens(f"[{len(history)} earlier messages omitted]\n")
+        lines = []
+        if messages:
+            lines.append(_truncate(messages[-1], remaining))
+            remaining -= RateLimiter.estimate_tokens(lines[0])
+        header = ""
+        if summary:
+            prefix = "Summary of the earlier conversation:\n"
+            summary = _truncate(summary, remaining - RateLimiter.estimate_tokens(prefix + "\n\n"))
+            if summary:
+                header = f"{prefix}{summary}\n\n"
+                remaining -= RateLimiter.estimate_tokens(header)
+
+        # Overige verbatim berichten van nieuw naar oud toevoegen tot het budget op is
+        for line in reversed(messages[:-1]):
+            cost = RateLimiter.estimate_tokens(line)
+            if cost > remaining:
+                break
+            lines.append(line)
+            remaining -= cost
+        omitted = len(history) - covered - len(lines)
+        if omitted:
+            header += f"[{omitted} earlier messages omitted]\n"
+
+        text = header + "\n".join(reversed(lines))
+        with self._lock:
+            self._stats["trimmed_messages"] += omitted
+            self._stats["tokens_saved"] += RateLimiter.estimate_tokens(full_text) - RateLimiter.estimate_tokens(text)
+        return text
+
+    def _schedule(self, messages: List[Dict], key: str, covered: int, summary: str) -> None:
+        with self._lock:
+            if key in self._pending or key in self._summaries:
+                return
+            self._pending[key] = event_loop.submit(self._summarize_background(list(messages), key, covered, summary))
+
+    async def _summarize_background(self, messages: List[Dict], key: str, covered: int, summary: str) -> None:
+        try:
+            await self.summarize(messages, key, covered, summary)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.warning(f"Conversation summary failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    async def summarize(self, messages: List[Dict], key: Optional[str] = None,
+                        covered: int = 0, summary: str = "") -> str:
+        """
+        Extend a summary with the messages after `covered` and store it
+
+        Args:
+            messages: The prefix of the conversation the new summary covers
+            key: Prefix key of `messages` (computed when omitted)
+            covered: Messages already covered by `summary`
+            summary: Previous summary
+
+        Returns:
+            The new summary
+        """
+        prompt = CONVERSATION_SUMMARY_PROMPT.format(
+            summary=summary or "(none)",
+            messages=format_messages(messages[covered:]),
+            max_words=int(self.summary_tokens * 0.75)
+        )
+        new_summary = (await self.client.call_async([HumanMessage(content=prompt)])).strip()
+        if key is None:
+            key = _prefix_keys(messages)[-1]
+        with self._lock:
+            self._summaries[key] = (len(messages), new_summary)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+            self._stats["summaries"] += 1
+        return new_summary
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Wait for pending background summaries (used by tests and benchmarks)"""
+        with self._lock:
+            pending = list(self._pending.values())
+        concurrent.futures.wait(pending, timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return render and summarization counters"""
+        with self._lock:
+            return {**self._stats, "cached_summaries": len(self._summaries), "pending": len(self._pending),
+                    "token_budget": self.token_budget, "keep_messages": self.keep_messages}
+
+
+# Singleton instance
+conversation_memory = ConversationMemory()
@@ -0,0 +1,351 @@
+"""
+Persistent embedding cache for Happy2Align
+Vectors live in an append-only memory-mapped file, indexed by (model, sha256(text)) in SQLite
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Embedding cache shared by all worker processes on a host
+
+    Readers map the vector file read-only, so every process shares the same
+    page-cache pages instead of holding its own copy. Writers append under the
+    SQLite write lock; compaction rewrites the file under a new generation so
+    existing mappings in other processes stay valid. A write that pushes the
+    file past max_bytes starts compaction in a background thread instead of
+    rewriting the file inline.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 dtype: str = "float32",
+                 max_bytes: int = 512 * 1024 * 1024,
+                 read_only: bool = False):
+        """
+        Initialize the cache
+
+        Args:
+            directory: Directory holding index.db and the vector files
+            dtype: Storage precision ("float32" or "float16")
+            max_bytes: Vector file size that triggers compaction
+            read_only: Never write (for worker processes that only consume the cache)
+        """
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+
+        self._local = threading.local()
+        self._map_lock = threading.Lock()
+        self._mm: Optional[mmap.mmap] = None
+        self._mm_generation: Optional[int] = None
+        # Last-used tijden die nog naar SQLite moeten (onder _map_lock: lookups komen uit meerdere threads)
+        self._touched: Dict[str, float] = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "compactions": 0}
+        self._compacting = threading.Event()
+
+        self._db_path = os.path.join(directory, "index.db")
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+            self._init_db()
+
+    def _init_db(self) -> None:
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, "
+            "offset INTEGER NOT NULL, "
+            "dim INTEGER NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', '0')")
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dtype', ?)", (self.dtype.name,))
+        self._load_dtype(conn)
+
+    def _load_dtype(self, conn: sqlite3.Connection) -> None:
+        """The precision is fixed when the cache is created; follow what is on disk"""
+        stored = conn.execute("SELECT value FROM meta WHERE key = 'dtype'").fetchone()[0]
+        if stored != self.dtype.name:
+            if not self.read_only:
+                logger.warning(f"Embedding cache stores {stored}, ignoring configured {self.dtype.name}")
+            self.dtype = np.dtype(stored)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """One connection per thread (autocommit, explicit transactions)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                if not os.path.exists(self._db_path):
+                    return None
+                conn = sqlite3.connect(f"file:{self._db_path}?mode=ro", uri=True, timeout=5,
+                                       isolation_level=None)
+                self._load_dtype(conn)
+            else:
+                conn = sqlite3.connect(self._db_path, timeout=5, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Cache key for a (model, text) pair"""
+        return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _vector_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"vectors-{generation}.{self.dtype.name}.bin")
+
+    def _read(self, generation: int, offset: int, dim: int) -> Optional[np.ndarray]:
+        """Return a read-only view on a stored vector"""
+        end = offset + dim * self.dtype.itemsize
+        with self._map_lock:
+            if self._mm is None or self._mm_generation != generation or len(self._mm) < end:
+                try:
+                    with open(self._vector_path(generation), "rb") as f:
+                        # Oude mapping niet sluiten: bestaande views verwijzen er nog naar
+                        self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        self._mm_generation = generation
+                except (FileNotFoundError, ValueError):
+                    return None
+            if len(self._mm) < end:
+                return None
+            return np.frombuffer(self._mm, dtype=self.dtype, count=dim, offset=offset)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """
+        Look up an embedding
+
+        Args:
+            model: Embedding model
+            text: Embedded text
+
+        Returns:
+            Read-only vector or None on a miss
+        """
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Look up embeddings for many texts (None for every miss)"""
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        conn = self._connection()
+        if conn is None or not texts:
+            self._count(misses=len(texts))
+            return results
+
+        keys = [self.make_key(model, text) for text in texts]
+        rows = {}
+        try:
+            # Generatie en offsets uit één snapshot: een compactie ertussen zou anders oude offsets
+            # op het nieuwe vectorbestand loslaten (en stilletjes de vector van een andere tekst teruggeven)
+            conn.execute("BEGIN")
+            try:
+                generation = int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    for key, offset, dim in conn.execute(
+                            f"SELECT key, offset, dim FROM entries WHERE key IN ({placeholders})", batch):
+                        rows[key] = (offset, dim)
+            finally:
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache lookup failed: {str(e)}")
+            self._count(misses=len(texts))
+            return results
+
+        now = time.time()
+        touched = []
+        for i, key in enumerate(keys):
+            if key in rows:
+                results[i] = self._read(generation, *rows[key])
+                if results[i] is not None:
+                    touched.append(key)
+        hits = len(touched)
+        self._count(hits=hits, misses=len(texts) - hits)
+        if touched and not self.read_only:
+            with self._map_lock:
+                self._touched.update((key, now) for key in touched)
+                flush = len(self._touched) >= 64
+            if flush:
+                self._flush_touched()
+        return results
+
+    def put(self, model: str, text: str, vector: Sequence[float]) -> None:
+        """Store one embedding"""
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Append embeddings that are not cached yet
+
+        Args:
+            model: Embedding model
+            texts: Embedded texts
+            vectors: Embeddings in the same order as texts
+        """
+        if self.read_only or not texts:
+            return
+        conn = self._connection()
+        pending = {}
+        for text, vector in zip(texts, vectors):
+            pending.setdefault(self.make_key(model, text), vector)
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # Schrijflock: serialiseert appends over processen heen
+            try:
+                keys = list(pending)
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    for (key,) in conn.execute(f"SELECT key FROM entries WHERE key IN ({placeholders})", batch):
+                        pending.pop(key, None)
+                if not pending:
+                    conn.execute("COMMIT")
+                    return
+
+                generation = int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+                now = time.time()
+                rows = []
+                with open(self._vector_path(generation), "ab") as f:
+                    offset = f.tell()
+                    for key, vector in pending.items():
+                        data = np.asarray(vector, dtype=self.dtype).tobytes()
+                        f.write(data)
+                        rows.append((key, offset, len(data) // self.dtype.itemsize, now))
+                        offset += len(data)
+                conn.executemany("INSERT INTO entries (key, offset, dim, last_used) VALUES (?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+                self._count(stores=len(rows))
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Embedding cache store failed: {str(e)}")
+            return
+
+        if offset > self.max_bytes:
+            self._compact_in_background()
+
+    def _compact_in_background(self) -> None:
+        """Start compaction in a daemon thread (at most one at a time per process)"""
+        with self._stats_lock:
+            if self._compacting.is_set():
+                return
+            self._compacting.set()
+
+        def run() -> None:
+            try:
+                self.compact()
+            finally:
+                self._compacting.clear()
+        threading.Thread(target=run, name="embedding-compaction", daemon=True).start()
+
+    def _flush_touched(self) -> None:
+        """Persist last-used timestamps (batched to keep lookups read-only most of the time)"""
+        with self._map_lock:
+            touched, self._touched = self._touched, {}
+        if not touched or self.read_only:
+            return
+        try:
+            conn = self._connection()
+            conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                             [(used, key) for key, used in touched.items()])
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache touch failed: {str(e)}")
+
+    def compact(self, target_bytes: Optional[int] = None) -> None:
+        """
+        Rewrite the vector file keeping only the most recently used entries
+
+        Args:
+            target_bytes: Size to compact to (defaults to 75% of max_bytes)
+        """
+        if self.read_only:
+            return
+        target_bytes = target_bytes if target_bytes is not None else int(self.max_bytes * 0.75)
+        self._flush_touched()
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                generation = int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+                old_path = self._vector_path(generation)
+                new_path = self._vector_path(generation + 1)
+
+                keep = []
+                size = 0
+                for key, offset, dim in conn.execute(
+                        "SELECT key, offset, dim FROM entries ORDER BY last_used DESC"):
+                    nbytes = dim * self.dtype.itemsize
+                    if size + nbytes > target_bytes:
+                        break
+                    keep.append((key, offset, dim))
+                    size += nbytes
+
+                rows = []
+                with open(old_path, "rb") as src, open(new_path, "wb") as dst:
+                    for key, offset, dim in keep:
+                        src.seek(offset)
+                        rows.append((dst.tell(), key))
+                        dst.write(src.read(dim * self.dtype.itemsize))
+
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (key TEXT PRIMARY KEY, offset INTEGER)")
+                conn.execute("DELETE FROM keep")
+                conn.executemany("INSERT INTO keep (offset, key) VALUES (?, ?)", rows)
+                conn.execute("DELETE FROM entries WHERE key NOT IN (SELECT key FROM keep)")
+                conn.execute("UPDATE entries SET offset = (SELECT offset FROM keep WHERE keep.key = entries.key)")
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'generation'", (str(generation + 1),))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Embedding cache compaction failed: {str(e)}")
+            return
+
+        # Processen met een mapping van het oude bestand houden hun pagina's tot ze remappen
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+        self._count(compactions=1)
+        logger.info(f"Compacted embedding cache to {len(rows)} entries ({size} bytes)")
+
+    def _count(self, **counts: int) -> None:
+        with self._stats_lock:
+            for name, value in counts.items():
+                self._stats[name] += value
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and storage size"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        conn = self._connection()
+        if conn is not None:
+            try:
+                stats["entries"] = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                generation = int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+                path = self._vector_path(generation)
+                stats["bytes"] = os.path.getsize(path) if os.path.exists(path) else 0
+                stats["generation"] = generation
+            except sqlite3.Error:
+                pass
+        stats["dtype"] = self.dtype.name
+        stats["read_only"] = self.read_only
+        return stats
@@ -0,0 +1,182 @@
+"""
+Event loop thread for Happy2Align
+One long-lived asyncio loop per process; sync code (Flask routes, sync wrappers) submits coroutines to it
+so the async HTTP pools and their connections survive between requests
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopThread:
+    """A daemon thread running one event loop forever, with a thread-safe bridge for sync callers"""
+
+    def __init__(self, name: str = "happy2align-loop"):
+        """
+        Initialize the loop thread (the thread starts on first use)
+
+        Args:
+            name: Name of the thread
+        """
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "bridged": 0, "bridge_seconds": 0.0}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop (started on first access)"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed() or not self._thread.is_alive():
+                self._start()
+            return self._loop
+
+    def _start(self) -> None:
+        ready = threading.Event()
+        loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+            # Openstaande taken netjes afronden bij stop()
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+        self._loop = loop
+        self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info(f"Started event loop thread {self.name}")
+
+    def in_loop_thread(self) -> bool:
+        """True when called from the loop thread itself (blocking there would deadlock)"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine on the loop
+
+        Returns:
+            A concurrent future; cancelling it cancels the task on the loop
+        """
+        loop = self.loop
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        future.add_done_callback(self._count)
+        return future
+
+    def _count(self, future: concurrent.futures.Future) -> None:
+        failed = future.cancelled() or future.exception() is not None
+        with self._stats_lock:
+            self._stats["failed" if failed else "completed"] += 1
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the loop and block until it finishes
+
+        Args:
+            coro: Coroutine to run
+            timeout: Seconds to wait (None = no limit); the task is cancelled on timeout
+
+        Returns:
+            The coroutine's result
+
+        Raises:
+            RuntimeError: When called from the loop thread
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("EventLoopThread.run() called from the loop thread; await the coroutine instead")
+        start = time.perf_counter()
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+        finally:
+            with self._stats_lock:
+                self._stats["bridged"] += 1
+                self._stats["bridge_seconds"] += time.perf_counter() - start
+
+    def iterate(self, agen_factory: Callable[[], AsyncIterator[Any]]) -> Iterator[Any]:
+        """
+        Consume an async iterator from sync code
+
+        Items are handed over through a queue as the loop produces them; closing
+        the sync iterator early cancels the producer.
+
+        Args:
+            agen_factory: Callable returning the async iterator (called on the loop)
+        """
+        items: queue.Queue = queue.Queue()
+        done = object()
+
+        async def produce():
+            try:
+                async for item in agen_factory():
+                    items.put(item)
+            except BaseException as e:
+                items.put(e)
+                raise
+            finally:
+                items.put(done)
+
+        future = self.submit(produce())
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the loop and wait for the thread"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return bridge counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        bridge_seconds = stats.pop("bridge_seconds")
+        stats["mean_bridge_ms"] = bridge_seconds / stats["bridged"] * 1000 if stats["bridged"] else None
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+
+# Singleton instance
+event_loop = EventLoopThread()
+atexit.register(event_loop.stop)
+
+
+def run_sync(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the process-wide loop from sync code"""
+    return event_loop.run(coro, timeout=timeout)
@@ -0,0 +1,284 @@
+"""
+Shared HTTP connection pool for Happy2Align
+One process-wide httpx transport (HTTP/2 when available) for all OpenAI traffic
+"""
+
+import asyncio
+import functools
+import importlib.util
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from agents.config import (
+    HTTP2_ENABLED, HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE,
+    HTTP_POOL_KEEPALIVE_EXPIRY, MODEL_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _PoolStats:
+    """Request counters shared by the instrumented transports"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_seconds = 0.0
+
+    def start(self) -> float:
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return time.time()
+
+    def finish(self, started: float, failed: bool) -> None:
+        with self.lock:
+            self.in_flight -= 1
+            self.total_seconds += time.time() - started
+            if failed:
+                self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "mean_seconds": self.total_seconds / self.requests if self.requests else None,
+            }
+
+
+class _TrackedAsyncStream(httpx.AsyncByteStream):
+    """Response body that reports the request as finished when the stream is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, stats: _PoolStats, started: float):
+        self._stream = stream
+        self._stats = stats
+        self._started = started
+        self._failed = False
+        self._closed = False
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except Exception:
+            self._failed = True
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._stats.finish(self._started, self._failed)
+
+
+class _TrackedSyncStream(httpx.SyncByteStream):
+    """Sync counterpart of _TrackedAsyncStream"""
+
+    def __init__(self, stream: httpx.SyncByteStream, stats: _PoolStats, started: float):
+        self._stream = stream
+        self._stats = stats
+        self._started = started
+        self._failed = False
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                yield chunk
+        except Exception:
+            self._failed = True
+            raise
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._stats.finish(self._started, self._failed)
+
+
+def _connection_counts(transport) -> Dict[str, int]:
+    """Count open and idle connections in an httpcore pool"""
+    pool = getattr(transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for conn in connections if getattr(conn, "is_idle", lambda: False)())
+    return {"connections": len(connections), "idle_connections": idle}
+
+
+class InstrumentedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport that records pool utilization
+
+    Connections belong to the event loop that opened them, so every running loop
+    (the shared event-loop thread, an ASGI server loop, a short-lived asyncio.run)
+    gets its own connection pool; a pool disappears together with its loop.
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.stats = _PoolStats()
+
+    def _for_loop(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._kwargs)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = self.stats.start()
+        try:
+            response = await self._for_loop().handle_async_request(request)
+        except BaseException:
+            self.stats.finish(started, failed=True)
+            raise
+        # In-flight tot de body gelezen en de stream gesloten is (bij streaming dus de hele generatie)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedAsyncStream(response.stream, self.stats, started),
+            extensions=response.extensions,
+        )
+
+    def connection_counts(self) -> Dict[str, int]:
+        """Open and idle connections over the pools of all live loops"""
+        with self._lock:
+            transports = list(self._transports.values())
+        counts = {"connections": 0, "idle_connections": 0, "loops": len(transports)}
+        for transport in transports:
+            for key, value in _connection_counts(transport).items():
+                counts[key] += value
+        return counts
+
+    async def aclose(self) -> None:
+        """Close the pool of the running loop; pools of other loops are dropped (they can only close there)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transports = dict(self._transports)
+            self._transports = weakref.WeakKeyDictionary()
+        for owner, transport in transports.items():
+            if owner is loop:
+                await transport.aclose()
+
+
+class InstrumentedSyncTransport(httpx.BaseTransport):
+    """Sync transport that records pool utilization"""
+
+    def __init__(self, **kwargs):
+        self._transport = httpx.HTTPTransport(**kwargs)
+        self.stats = _PoolStats()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = self.stats.start()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self.stats.finish(started, failed=True)
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedSyncStream(response.stream, self.stats, started),
+            extensions=response.extensions,
+        )
+
+    def connection_counts(self) -> Dict[str, int]:
+        return _connection_counts(self._transport)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+@functools.lru_cache(maxsize=None)
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (pip install httpx[http2])"""
+    if not HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def _transport_kwargs() -> Dict[str, Any]:
+    return {
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=HTTP_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_POOL_KEEPALIVE_EXPIRY
+        ),
+    }
+
+
+_lock = threading.Lock()
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the process-wide async HTTP client"""
+    global _async_client
+    with _lock:
+        if _async_client is None or _async_client.is_closed:
+            _async_client = httpx.AsyncClient(
+                timeout=MODEL_TIMEOUT,
+                transport=InstrumentedAsyncTransport(**_transport_kwargs())
+            )
+        return _async_client
+
+
+def get_sync_client() -> httpx.Client:
+    """Return the process-wide sync HTTP client (for callers that cannot await)"""
+    global _sync_client
+    with _lock:
+        if _sync_client is None or _sync_client.is_closed:
+            _sync_client = httpx.Client(
+                timeout=MODEL_TIMEOUT,
+                transport=InstrumentedSyncTransport(**_transport_kwargs())
+            )
+        return _sync_client
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Return utilization metrics of the shared pools"""
+    stats = {"http2": _http2_available(), "max_connections": HTTP_POOL_MAX_CONNECTIONS}
+    for name, client in (("async", _async_client), ("sync", _sync_client)):
+        if client is None:
+            continue
+        transport = client._transport
+        pool = {**transport.stats.snapshot(), **transport.connection_counts()}
+        pool["utilization"] = pool["in_flight"] / HTTP_POOL_MAX_CONNECTIONS
+        stats[name] = pool
+    return stats
+
+
+async def aclose() -> None:
+    """Close the shared pools"""
+    global _async_client, _sync_client
+    with _lock:
+        async_client, _async_client = _async_client, None
+        sync_client, _sync_client = _sync_client, None
+    if async_client is not None:
+        await async_client.aclose()
+    if sync_client is not None:
+        sync_client.close()
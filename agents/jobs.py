@@ -0,0 +1,252 @@
+"""
+Background jobs for Happy2Align
+Runs conversation turns in a bounded worker pool so web threads return immediately; results are
+polled or followed as events, and jobs can be cancelled per session
+"""
+
+import concurrent.futures
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it was cancelled while running"""
+
+
+class JobQueueFull(Exception):
+    """Raised when the pool already has max_pending unfinished jobs"""
+
+
+@dataclass
+class Job:
+    """One background turn"""
+    id: str
+    session_id: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    # Voortgang (status/token/step events) voor abonnees; nieuwe abonnees krijgen de laatste max_events opnieuw
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    events_dropped: int = 0  # Events die al voor de kop van de lijst zijn weggegooid
+    cancel_requested: bool = False
+    # Plaats in de wachtrij van de admission controller (gezet door de beurt zelf zolang hij wacht)
+    queue_position: Optional[int] = None
+    estimated_wait: Optional[float] = None
+    future: Optional[concurrent.futures.Future] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public view of the job (without the event log)"""
+        data = {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.queue_position is not None and self.status not in FINISHED:
+            data["queue_position"] = self.queue_position
+            data["estimated_wait"] = self.estimated_wait
+        if self.status == DONE:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """Bounded pool of background turns with polling, event subscriptions and cancellation"""
+
+    def __init__(self, max_workers: int = 8, max_pending: int = 100, result_ttl: float = 600,
+                 max_events: int = 500):
+        """
+        Initialize the manager
+
+        Args:
+            max_workers: Turns running at the same time
+            max_pending: Unfinished (queued + running) jobs before submit() refuses new ones
+            result_ttl: Seconds a finished job stays available for polling
+            max_events: Events kept per job for replay; older ones are dropped (a token stream is unbounded)
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.max_events = max_events
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._changed = threading.Condition()
+        self._stats = {"submitted": 0, "rejected": 0, "started": 0, "done": 0, "failed": 0, "cancelled": 0,
+                       "queue_seconds": 0.0, "run_seconds": 0.0, "runs": 0}
+
+    def submit(self, session_id: str, work: Callable[[Job, Callable[[Dict[str, Any]], None]], Any]) -> Job:
+        """
+        Queue a turn
+
+        Args:
+            session_id: Session the turn belongs to (for cancellation)
+            work: Called as work(job, emit) on a pool thread; returns the result. It should call
+                check_cancelled(job) at safe points and may emit progress events.
+
+        Returns:
+            The queued job
+
+        Raises:
+            JobQueueFull: When max_pending jobs are unfinished
+        """
+        with self._changed:
+            self._expire()
+            pending = sum(1 for job in self._jobs.values() if job.status not in FINISHED)
+            if pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise JobQueueFull(f"{pending} jobs pending")
+            job = Job(id=uuid.uuid4().hex, session_id=session_id)
+            self._jobs[job.id] = job
+            self._stats["submitted"] += 1
+        job.future = self._executor.submit(self._run, job, work)
+        return job
+
+    def _run(self, job: Job, work: Callable) -> None:
+        with self._changed:
+            if job.status != QUEUED:
+                return  # Geannuleerd voordat hij aan de beurt was
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._stats["started"] += 1
+            self._stats["queue_seconds"] += job.started_at - job.created_at
+
+        def emit(event: Dict[str, Any]) -> None:
+            with self._changed:
+                job.events.append(event)
+                if len(job.events) > self.max_events:
+                    del job.events[0]
+                    job.events_dropped += 1
+                self._changed.notify_all()
+
+        try:
+            check_cancelled(job)
+            result = work(job, emit)
+            check_cancelled(job)
+            self._finish(job, DONE, result=result)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+            self._finish(job, FAILED, error=str(e))
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self._changed:
+            if job.status in FINISHED:
+                return
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+            self._stats[status] += 1
+            if job.started_at is not None:
+                self._stats["runs"] += 1
+                self._stats["run_seconds"] += job.finished_at - job.started_at
+            self._changed.notify_all()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job, or None when unknown or expired"""
+        with self._changed:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job
+
+        A queued job never starts; a running job stops at its next
+        check_cancelled() point and its result is discarded.
+
+        Returns:
+            True when the job was still unfinished
+        """
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            job.cancel_requested = True
+            queued = job.status == QUEUED
+        if queued:
+            if job.future is not None:
+                job.future.cancel()
+            self._finish(job, CANCELLED)
+        return True
+
+    def cancel_session(self, session_id: str) -> int:
+        """Cancel every unfinished job of a session; returns how many"""
+        with self._changed:
+            job_ids = [job.id for job in self._jobs.values() if job.session_id == session_id and job.status not in FINISHED]
+        return sum(1 for job_id in job_ids if self.cancel(job_id))
+
+    def follow(self, job_id: str, heartbeat: float = 15.0) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Yield a job's events from the start until it finishes
+
+        Yields None every `heartbeat` seconds without events, so the caller can
+        keep its connection alive; the job itself is looked up with get() afterwards.
+        Events dropped from the replay log before they were read are skipped.
+        """
+        seen = 0  # Telt ook weggegooide events, zodat de positie klopt als de kop van de lijst verdwijnt
+        while True:
+            with self._changed:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                # De Condition wekt bij elke job: blijf wachten tot deze job verandert of de heartbeat verloopt
+                deadline = time.monotonic() + heartbeat
+                while job.events_dropped + len(job.events) == seen and job.status not in FINISHED:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                events = job.events[max(seen - job.events_dropped, 0):]
+                seen = job.events_dropped + len(job.events)
+                finished = job.status in FINISHED
+            if not events and not finished:
+                yield None
+            for event in events:
+                yield event
+            if finished:
+                return
+
+    def _expire(self) -> None:
+        """Drop finished jobs older than result_ttl (caller holds the lock)"""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.status in FINISHED and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool counters"""
+        with self._changed:
+            stats = dict(self._stats)
+            statuses = [job.status for job in self._jobs.values()]
+        runs = stats.pop("runs")
+        stats["mean_queue_seconds"] = stats.pop("queue_seconds") / stats["started"] if stats["started"] else None
+        stats["mean_run_seconds"] = stats.pop("run_seconds") / runs if runs else None
+        stats["queued"] = statuses.count(QUEUED)
+        stats["running"] = statuses.count(RUNNING)
+        stats["max_workers"] = self.max_workers
+        return stats
+
+
+def check_cancelled(job: Job) -> None:
+    """Raise JobCancelled when the job was cancelled (call at safe points inside a job)"""
+    if job.cancel_requested:
+        raise JobCancelled(job.id)
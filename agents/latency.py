@@ -0,0 +1,121 @@
+"""
+Latency histograms for Happy2Align
+Per-model latency tracking used for hedging decisions and metrics
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, List, Optional
+
+# Bucket-grenzen in seconden (log-verdeeld van 50ms tot 120s)
+DEFAULT_BUCKETS = [
+    0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0,
+    6.0, 8.0, 10.0, 12.5, 15.0, 20.0, 25.0, 30.0, 45.0, 60.0, 120.0
+]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with percentile estimates"""
+
+    def __init__(self, buckets: Optional[List[float]] = None):
+        """
+        Initialize the histogram
+
+        Args:
+            buckets: Sorted upper bounds of the buckets in seconds
+        """
+        self.buckets = list(buckets or DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)  # laatste bucket = overflow
+        self.count = 0
+        self.censored = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, censored: bool = False) -> None:
+        """
+        Record one latency sample
+
+        Args:
+            seconds: Observed latency
+            censored: The request was cancelled or timed out, so `seconds` is only a lower
+                bound; it is still counted so that the slow tail is not dropped from the percentiles
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.censored += censored
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Estimate a percentile by linear interpolation inside the bucket
+
+        Args:
+            p: Percentile between 0 and 100
+
+        Returns:
+            Latency in seconds or None when there are no samples
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = self.count * p / 100.0
+            cumulative = 0
+            for index, bucket_count in enumerate(self.counts):
+                if bucket_count and cumulative + bucket_count >= target:
+                    lower = self.buckets[index - 1] if index > 0 else 0.0
+                    upper = self.buckets[index] if index < len(self.buckets) else self.max
+                    fraction = (target - cumulative) / bucket_count
+                    return min(lower + (upper - lower) * fraction, self.max)
+                cumulative += bucket_count
+            return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return summary statistics"""
+        return {
+            "count": self.count,
+            "censored": self.censored,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else None,
+        }
+
+
+class LatencyTracker:
+    """Collection of latency histograms keyed by model name"""
+
+    def __init__(self):
+        """Initialize the tracker"""
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, model: str) -> LatencyHistogram:
+        """Return (and create if needed) the histogram of a model"""
+        with self._lock:
+            histogram = self._histograms.get(model)
+            if histogram is None:
+                histogram = self._histograms[model] = LatencyHistogram()
+            return histogram
+
+    def observe(self, model: str, seconds: float, censored: bool = False) -> None:
+        """Record one latency sample for a model (censored = lower bound of a cancelled/timed-out call)"""
+        self.histogram(model).observe(seconds, censored)
+
+    def percentile(self, model: str, p: float) -> Optional[float]:
+        """Estimate a latency percentile for a model"""
+        return self.histogram(model).percentile(p)
+
+    def count(self, model: str) -> int:
+        """Number of samples recorded for a model"""
+        return self.histogram(model).count
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return summary statistics for every model"""
+        with self._lock:
+            models = list(self._histograms.items())
+        return {model: histogram.snapshot() for model, histogram in models}
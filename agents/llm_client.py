@@ -4,21 +4,47 @@ Handles all OpenAI API calls with consistent timeout and fallback logic
 """
 
 import asyncio
+import concurrent.futures
 import logging
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Union
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage, BaseMessage
-from openai import AsyncOpenAI, OpenAI
+from openai import AsyncOpenAI, OpenAI, RateLimitError
 import time
-import httpx
+from agents import http_pool
 from agents.config import (
     OPENAI_API_KEY, PRIMARY_MODEL, FALLBACK_MODEL,
     DEFAULT_TEMPERATURE, FALLBACK_TEMPERATURE,
-    MODEL_TIMEOUT, FALLBACK_TIMEOUT, REQUEST_TIMEOUT
+    MODEL_TIMEOUT, FALLBACK_TIMEOUT, REQUEST_TIMEOUT,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_MEMORY, RESPONSE_CACHE_MAX_DISK,
+    HEDGING_ENABLED, HEDGE_DELAY, HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY,
+    HEDGE_MAX_DELAY, HEDGE_MIN_SAMPLES,
+    RATE_LIMIT_ENABLED, RATE_LIMIT_BACKEND, RATE_LIMIT_DB_PATH, RATE_LIMITS,
+    RATE_LIMIT_DEFAULT_RPM, RATE_LIMIT_DEFAULT_TPM, RATE_LIMIT_MAX_WAIT,
+    RATE_LIMIT_RETRY_BUDGET, RATE_LIMIT_COMPLETION_TOKENS,
+    CIRCUIT_BREAKER_ENABLED, CIRCUIT_BREAKER_FAILURE_RATE, CIRCUIT_BREAKER_SLOW_CALL,
+    CIRCUIT_BREAKER_WINDOW, CIRCUIT_BREAKER_MIN_CALLS, CIRCUIT_BREAKER_OPEN_SECONDS,
+    CIRCUIT_BREAKER_PROBE_INTERVAL,
+    EMBEDDING_BATCH_MAX_INPUTS, EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_BATCH_CONCURRENCY,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DTYPE,
+    EMBEDDING_CACHE_MAX_BYTES, EMBEDDING_CACHE_READ_ONLY
 )
+from agents.circuit_breaker import CLOSED, OPEN, CircuitBreaker, CircuitOpenError
+from agents.embedding_cache import EmbeddingCache
+from agents.event_loop import event_loop
+from agents.latency import LatencyTracker
+from agents.rate_limiter import MemoryBackend, RateLimiter, RateLimitWaitExceeded, SQLiteBackend
+from agents.response_cache import ResponseCache, make_cache_key
+from agents.singleflight import SingleFlight
+from agents.structured_output import parse_stats
 
 logger = logging.getLogger(__name__)
 
+# Quota-problemen (429 na de korte retry, of de eigen limiter zit vol) gaan niet naar de fallback:
+# die deelt de quota niet op te lossen, en een extra request verdubbelt juist de load
+QUOTA_ERRORS = (RateLimitError, RateLimitWaitExceeded)
+
 class LLMClient:
     """Centralized LLM client with consistent timeout and fallback handling"""
     
@@ -36,16 +62,18 @@ class LLMClient:
         if self._initialized:
             return
             
-        # LangChain clients met aangepaste HTTP client configuratie
+        # Alle clients delen één process-brede connection pool (HTTP/2 indien beschikbaar)
+        shared_http_client = http_pool.get_sync_client()
+        shared_async_http_client = http_pool.get_async_client()
+        
+        # LangChain clients
         self.primary_llm = ChatOpenAI(
             model_name=PRIMARY_MODEL,
             openai_api_key=OPENAI_API_KEY,
             request_timeout=MODEL_TIMEOUT,
             max_retries=2,
-            http_client=httpx.Client(  # Gebruik sync client voor LangChain
-                timeout=MODEL_TIMEOUT,
-                limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
-            )
+            http_client=shared_http_client,
+            http_async_client=shared_async_http_client
         )
         
         self.fallback_llm = ChatOpenAI(
@@ -53,27 +81,66 @@ class LLMClient:
             openai_api_key=OPENAI_API_KEY,
             request_timeout=FALLBACK_TIMEOUT,
             max_retries=1,
-            http_client=httpx.Client(  # Gebruik sync client voor LangChain
-                timeout=FALLBACK_TIMEOUT,
-                limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
-            )
+            http_client=shared_http_client,
+            http_async_client=shared_async_http_client
         )
         
-        # Direct OpenAI clients met aangepaste HTTP client configuratie
-        self.async_client = AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-            http_client=httpx.AsyncClient(  # Gebruik async client voor directe OpenAI calls
-                timeout=MODEL_TIMEOUT,
-                limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
+        # Direct OpenAI clients
+        self.async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=shared_async_http_client)
+        self.sync_client = OpenAI(api_key=OPENAI_API_KEY, http_client=shared_http_client)
+        
+        # Exact-match response cache (geheugen + SQLite)
+        self.response_cache = ResponseCache(
+            path=RESPONSE_CACHE_PATH or None,
+            ttl=RESPONSE_CACHE_TTL,
+            max_memory_entries=RESPONSE_CACHE_MAX_MEMORY,
+            max_disk_entries=RESPONSE_CACHE_MAX_DISK
+        ) if RESPONSE_CACHE_ENABLED else None
+        
+        # Identieke gelijktijdige calls delen één upstream request
+        self.singleflight = SingleFlight()
+        
+        # Latency histogrammen per model (basis voor de hedge-delay)
+        self.latency = LatencyTracker()
+        self._hedge_stats = {"primary_wins": 0, "fallback_wins": 0, "hedges_started": 0}
+        
+        # Client-side RPM/TPM limiter per model (state gedeeld tussen worker processen)
+        self.rate_limiter = RateLimiter(
+            SQLiteBackend(RATE_LIMIT_DB_PATH) if RATE_LIMIT_BACKEND == "sqlite" else MemoryBackend(),
+            limits=RATE_LIMITS,
+            default_rpm=RATE_LIMIT_DEFAULT_RPM,
+            default_tpm=RATE_LIMIT_DEFAULT_TPM,
+            max_wait=RATE_LIMIT_MAX_WAIT
+        ) if RATE_LIMIT_ENABLED else None
+        
+        # Circuit breakers per model; open primary => direct naar de fallback
+        self.breakers = {
+            model: CircuitBreaker(
+                model,
+                failure_rate_threshold=CIRCUIT_BREAKER_FAILURE_RATE,
+                slow_call_seconds=CIRCUIT_BREAKER_SLOW_CALL,
+                window_size=CIRCUIT_BREAKER_WINDOW,
+                min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+                open_seconds=CIRCUIT_BREAKER_OPEN_SECONDS
             )
-        )
-        self.sync_client = OpenAI(api_key=OPENAI_API_KEY)
+            for model in (PRIMARY_MODEL, FALLBACK_MODEL)
+        } if CIRCUIT_BREAKER_ENABLED else {}
+        self._probe_tasks: Dict[str, asyncio.Task] = {}
+        
+        # Persistente embedding cache (memory-mapped vectoren + SQLite index)
+        self.embedding_cache = EmbeddingCache(
+            EMBEDDING_CACHE_DIR,
+            dtype=EMBEDDING_CACHE_DTYPE,
+            max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+            read_only=EMBEDDING_CACHE_READ_ONLY
+        ) if EMBEDDING_CACHE_ENABLED else None
         
         self._initialized = True
         
     async def call_async(self, 
                         messages: Union[List[BaseMessage], List[Dict[str, str]]], 
                         use_fallback: bool = True,
+                        use_cache: bool = True,
                         **kwargs) -> str:
         """
         Async call to LLM with automatic fallback
@@ -81,67 +148,90 @@ class LLMClient:
         Args:
             messages: List of messages (LangChain format or dict format)
             use_fallback: Whether to use fallback model on failure
+            use_cache: Whether to serve and store the answer in the response cache
             **kwargs: Additional arguments for the LLM
             
         Returns:
             Response text from the LLM
         """
-        start_time = time.time()
-        
         # Convert dict messages to LangChain format if needed
         if messages and isinstance(messages[0], dict):
             messages = self._convert_to_langchain_messages(messages)
         
+        request_key = make_cache_key(
+            PRIMARY_MODEL, self.primary_llm.temperature,
+            self._messages_to_dicts(messages), **kwargs
+        )
+        use_cache = use_cache and self.response_cache is not None
+        if use_cache:
+            cached = await self._cache_get(request_key)
+            if cached is not None:
+                logger.info(f"Response cache hit for {PRIMARY_MODEL}")
+                return cached
+        
+        response, answered_by = await self.singleflight.do(
+            ("call_async", request_key, use_fallback),
+            lambda: self._call_with_fallback(messages, use_fallback, **kwargs)
+        )
+        
+        # De key hoort bij PRIMARY_MODEL: een antwoord van de fallback niet als het zijne cachen
+        if use_cache and response is not None and answered_by == PRIMARY_MODEL:
+            await self._cache_set(request_key, response)
+        return response
+    
+    async def _call_with_fallback(self,
+                                  messages: List[BaseMessage],
+                                  use_fallback: bool = True,
+                                  **kwargs) -> Tuple[str, str]:
+        """Call the primary model and fall back to the fallback model on failure; returns (answer, model)"""
+        if use_fallback and HEDGING_ENABLED:
+            return await self._call_hedged(messages, **kwargs)
+        
+        start_time = time.time()
+        
         # Try primary model first
         try:
             logger.info(f"Calling {PRIMARY_MODEL} with timeout {MODEL_TIMEOUT}s")
-            
-            # Gebruik een nieuwe event loop voor elke call
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            response = await asyncio.wait_for(
-                self.primary_llm.ainvoke(messages, **kwargs),
-                timeout=MODEL_TIMEOUT
-            )
+            response = await self._invoke_model(self.primary_llm, PRIMARY_MODEL, MODEL_TIMEOUT, messages, **kwargs)
             
             elapsed = time.time() - start_time
             logger.info(f"{PRIMARY_MODEL} responded in {elapsed:.2f}s")
-            return response.content.strip()
+            return response, PRIMARY_MODEL
+            
+        except QUOTA_ERRORS as e:
+            # Vóór TimeoutError: RateLimitWaitExceeded is er een subklasse van
+            logger.warning(f"{PRIMARY_MODEL} quota exhausted, not falling back: {str(e)}")
+            raise
             
         except asyncio.TimeoutError:
             logger.warning(f"{PRIMARY_MODEL} timed out after {MODEL_TIMEOUT}s")
             if not use_fallback:
                 raise TimeoutError(f"Model {PRIMARY_MODEL} timed out after {MODEL_TIMEOUT}s")
+        
+        except CircuitOpenError as e:
+            logger.info(f"Skipping {PRIMARY_MODEL}: {str(e)}")
+            if not use_fallback:
+                raise
                 
         except Exception as e:
             logger.error(f"Error with {PRIMARY_MODEL}: {str(e)}")
             if not use_fallback:
                 raise
         
-        # Fallback to faster model
+        # Fallback to faster model (laatste redmiddel, dus niet geblokkeerd door zijn breaker)
         if use_fallback:
             try:
                 logger.info(f"Falling back to {FALLBACK_MODEL} with timeout {FALLBACK_TIMEOUT}s")
-                
-                # Gebruik een nieuwe event loop voor de fallback
-                try:
-                    loop = asyncio.get_event_loop()
-                except RuntimeError:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                
-                response = await asyncio.wait_for(
-                    self.fallback_llm.ainvoke(messages, **kwargs),
-                    timeout=FALLBACK_TIMEOUT
-                )
+                response = await self._invoke_model(self.fallback_llm, FALLBACK_MODEL, FALLBACK_TIMEOUT, messages,
+                                                    enforce_breaker=False, **kwargs)
                 
                 elapsed = time.time() - start_time
                 logger.info(f"{FALLBACK_MODEL} responded in {elapsed:.2f}s (total time)")
-                return response.content.strip()
+                return response, FALLBACK_MODEL
+                
+            except QUOTA_ERRORS as e:
+                logger.warning(f"{FALLBACK_MODEL} quota exhausted: {str(e)}")
+                raise
                 
             except asyncio.TimeoutError:
                 logger.error(f"Both models timed out!")
@@ -151,9 +241,222 @@ class LLMClient:
                 logger.error(f"Fallback model also failed: {str(e)}")
                 raise Exception(f"Beide modellen faalden: {str(e)}")
     
+    async def _invoke_model(self,
+                            llm: ChatOpenAI,
+                            model: str,
+                            timeout: float,
+                            messages: List[BaseMessage],
+                            enforce_breaker: bool = True,
+                            **kwargs) -> str:
+        """
+        Invoke one model with a timeout, respecting its rate limit and circuit
+        breaker, and record its latency and outcome
+        """
+        breaker = self.breakers.get(model)
+        # Alleen een eigen allow_request() geeft een proefplek terug; de fallback reserveert er geen
+        reserved = breaker is not None and enforce_breaker
+        if reserved and not breaker.allow_request():
+            raise CircuitOpenError(model)
+        
+        tokens = self._estimate_tokens(self._messages_to_dicts(messages))
+        for attempt in range(2):
+            start_time = None
+            try:
+                await self._acquire_rate_limit(model, tokens)
+                start_time = time.time()
+                response = await asyncio.wait_for(llm.ainvoke(messages, **kwargs), timeout=timeout)
+            except RateLimitError as e:
+                retry_after = await self._register_rate_limit_async(model, e)
+                # Bij een korte Retry-After wachten we op hetzelfde model i.p.v. de load te verdubbelen
+                if attempt == 0 and retry_after <= RATE_LIMIT_RETRY_BUDGET:
+                    continue
+                # Quota is geen gezondheidsprobleem: niet meetellen voor de breaker
+                if reserved:
+                    breaker.release()
+                raise
+            except RateLimitWaitExceeded:
+                # Lokale quota-druk (eigen limiter) zegt ook niets over de gezondheid van het model
+                if reserved:
+                    breaker.release()
+                raise
+            except asyncio.CancelledError:
+                # Verliezer van een hedge: de echte latency is minstens zo lang, dus als ondergrens meetellen
+                # (anders verdwijnt de trage staart uit de p95 en zakt de hedge-delay steeds verder)
+                if start_time is not None:
+                    self.latency.observe(model, time.time() - start_time, censored=True)
+                if reserved:
+                    breaker.release()
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and start_time is not None:
+                    self.latency.observe(model, time.time() - start_time, censored=True)
+                self._record_failure(model)
+                raise
+            latency = time.time() - start_time
+            self.latency.observe(model, latency)
+            if breaker is not None:
+                breaker.record_success(latency)
+            return response.content.strip()
+    
+    def _record_failure(self, model: str) -> None:
+        """Report a failed call to the model's breaker and start probing once it opens"""
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            return
+        breaker.record_failure()
+        if breaker.state == OPEN:
+            logger.warning(f"Circuit breaker for {model} is open")
+            self._ensure_probe(model)
+    
+    def _ensure_probe(self, model: str) -> None:
+        """Start a background probe for a model on the running event loop (once per loop)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = self._probe_tasks.get(model)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        self._probe_tasks[model] = loop.create_task(self._probe_model(model))
+    
+    async def _probe_model(self, model: str) -> None:
+        """Probe an unhealthy model until its breaker closes again"""
+        llm, timeout = {
+            PRIMARY_MODEL: (self.primary_llm, MODEL_TIMEOUT),
+            FALLBACK_MODEL: (self.fallback_llm, FALLBACK_TIMEOUT),
+        }[model]
+        breaker = self.breakers[model]
+        while breaker.state != CLOSED:
+            await asyncio.sleep(CIRCUIT_BREAKER_PROBE_INTERVAL)
+            if not breaker.allow_request():
+                continue
+            start_time = time.time()
+            try:
+                await asyncio.wait_for(llm.ainvoke([HumanMessage(content="ping")]), timeout=timeout)
+                breaker.record_success(time.time() - start_time)
+                logger.info(f"Probe of {model} succeeded, breaker is {breaker.state}")
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                logger.warning(f"Probe of {model} failed: {str(e)}")
+    
+    def _estimate_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Estimate prompt plus completion tokens for the rate limiter"""
+        text = "".join(str(msg.get("content", "")) for msg in messages)
+        return RateLimiter.estimate_tokens(text, RATE_LIMIT_COMPLETION_TOKENS)
+    
+    async def _acquire_rate_limit(self, model: str, tokens: int) -> None:
+        """Wait for rate limit capacity for a model (no-op when disabled)"""
+        if self.rate_limiter is not None:
+            waited = await self.rate_limiter.acquire(model, tokens)
+            if waited > 0.5:
+                logger.info(f"Waited {waited:.2f}s for {model} rate limit capacity")
+    
+    def _register_rate_limit(self, model: str, error: Exception) -> float:
+        """Record a 429 response so that all workers back off; returns the Retry-After delay"""
+        retry_after = RateLimiter.retry_after_from_error(error)
+        logger.warning(f"{model} rate limited (429), retry after {retry_after:.1f}s")
+        if self.rate_limiter is not None:
+            self.rate_limiter.penalize(model, retry_after)
+        return retry_after
+    
+    async def _register_rate_limit_async(self, model: str, error: Exception) -> float:
+        """_register_rate_limit for coroutines: the shared limiter state is written off the event loop"""
+        retry_after = RateLimiter.retry_after_from_error(error)
+        logger.warning(f"{model} rate limited (429), retry after {retry_after:.1f}s")
+        if self.rate_limiter is not None:
+            await self.rate_limiter.penalize_async(model, retry_after)
+        return retry_after
+    
+    async def _cache_get(self, key: str) -> Optional[str]:
+        """Response cache lookup in a worker thread (the disk tier is SQLite, the event loop is shared)"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.response_cache.get, key)
+    
+    async def _cache_set(self, key: str, value: str) -> None:
+        """Response cache write in a worker thread"""
+        await asyncio.get_running_loop().run_in_executor(None, self.response_cache.set, key, value)
+    
+    def hedge_delay(self) -> float:
+        """
+        Delay before the fallback request is started in hedging mode
+        
+        Uses HEDGE_DELAY when configured, otherwise the observed p95 latency of
+        the primary model (clamped), or HEDGE_DEFAULT_DELAY until enough samples exist.
+        """
+        if HEDGE_DELAY is not None:
+            return HEDGE_DELAY
+        if self.latency.count(PRIMARY_MODEL) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        p95 = self.latency.percentile(PRIMARY_MODEL, 95)
+        return min(max(p95, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+    
+    async def _call_hedged(self, messages: List[BaseMessage], **kwargs) -> Tuple[str, str]:
+        """
+        Hedged call: start the fallback after an adaptive delay (or as soon as the
+        primary fails) and return whichever answer arrives first, with the model that gave it
+        """
+        start_time = time.time()
+        delay = self.hedge_delay()
+        logger.info(f"Hedged call to {PRIMARY_MODEL}, fallback after {delay:.2f}s")
+        
+        primary = asyncio.ensure_future(
+            self._invoke_model(self.primary_llm, PRIMARY_MODEL, MODEL_TIMEOUT, messages, **kwargs)
+        )
+        tasks = {primary: PRIMARY_MODEL}
+        errors = {}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if primary in done:
+                if primary.exception() is None:
+                    self._hedge_stats["primary_wins"] += 1
+                    return primary.result(), PRIMARY_MODEL
+                if isinstance(primary.exception(), QUOTA_ERRORS):
+                    logger.warning(f"{PRIMARY_MODEL} quota exhausted, not hedging: {str(primary.exception())}")
+                    raise primary.exception()
+                errors[PRIMARY_MODEL] = primary.exception()
+                logger.error(f"Error with {PRIMARY_MODEL}: {str(errors[PRIMARY_MODEL])}")
+                del tasks[primary]
+            
+            self._hedge_stats["hedges_started"] += 1
+            fallback = asyncio.ensure_future(
+                self._invoke_model(self.fallback_llm, FALLBACK_MODEL, FALLBACK_TIMEOUT, messages,
+                                   enforce_breaker=False, **kwargs)
+            )
+            tasks[fallback] = FALLBACK_MODEL
+            
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    model = tasks[task]
+                    if task.exception() is None:
+                        elapsed = time.time() - start_time
+                        logger.info(f"{model} won hedged call in {elapsed:.2f}s")
+                        key = "primary_wins" if model == PRIMARY_MODEL else "fallback_wins"
+                        self._hedge_stats[key] += 1
+                        return task.result(), model
+                    errors[model] = task.exception()
+                    logger.error(f"Error with {model}: {str(errors[model])}")
+            
+            quota = [e for e in errors.values() if isinstance(e, QUOTA_ERRORS)]
+            if quota:
+                logger.warning(f"Hedged call failed on quota: {str(quota[0])}")
+                raise quota[0]
+            if all(isinstance(e, asyncio.TimeoutError) for e in errors.values()):
+                raise TimeoutError("Beide AI modellen deden er te lang over. Probeer het later opnieuw.")
+            raise Exception(f"Beide modellen faalden: {'; '.join(str(e) for e in errors.values())}")
+        finally:
+            # Annuleer de verliezer (of beide bij annulering van de caller)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
     def call_sync(self, 
                   messages: Union[List[BaseMessage], List[Dict[str, str]]], 
                   use_fallback: bool = True,
+                  use_cache: bool = True,
                   **kwargs) -> str:
         """
         Synchronous call to LLM with automatic fallback
@@ -161,30 +464,137 @@ class LLMClient:
         Args:
             messages: List of messages (LangChain format or dict format)
             use_fallback: Whether to use fallback model on failure
+            use_cache: Whether to serve and store the answer in the response cache
             **kwargs: Additional arguments for the LLM
             
         Returns:
             Response text from the LLM
         """
-        # Create new event loop for sync call
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # If there's already a running loop, create a new one
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(asyncio.run, self.call_async(messages, use_fallback, **kwargs))
-                    return future.result()
-            else:
-                return loop.run_until_complete(self.call_async(messages, use_fallback, **kwargs))
-        except RuntimeError:
-            # No event loop, create one
-            return asyncio.run(self.call_async(messages, use_fallback, **kwargs))
+        # Via de gedeelde event loop, zodat de async connection pools hergebruikt worden
+        if event_loop.in_loop_thread():
+            raise RuntimeError("call_sync() cannot block the shared event loop; use await call_async() instead")
+        return event_loop.run(self.call_async(messages, use_fallback, use_cache, **kwargs))
+    
+    async def call_stream(self,
+                          messages: Union[List[BaseMessage], List[Dict[str, str]]],
+                          use_fallback: bool = True,
+                          use_cache: bool = True,
+                          **kwargs) -> AsyncIterator[str]:
+        """
+        Streaming call to LLM with automatic fallback
+        
+        Falls back to the fallback model only when the primary fails before its
+        first token; once tokens have been yielded a failure is raised.
+        
+        Args:
+            messages: List of messages (LangChain format or dict format)
+            use_fallback: Whether to use fallback model on failure
+            use_cache: Whether to serve and store the answer in the response cache
+            **kwargs: Additional arguments for the LLM
+            
+        Yields:
+            Text chunks as they are generated
+        """
+        if messages and isinstance(messages[0], dict):
+            messages = self._convert_to_langchain_messages(messages)
+        
+        request_key = make_cache_key(
+            PRIMARY_MODEL, self.primary_llm.temperature,
+            self._messages_to_dicts(messages), **kwargs
+        )
+        use_cache = use_cache and self.response_cache is not None
+        if use_cache:
+            cached = await self._cache_get(request_key)
+            if cached is not None:
+                logger.info(f"Response cache hit for {PRIMARY_MODEL} (stream)")
+                yield cached
+                return
+        
+        attempts = [(self.primary_llm, PRIMARY_MODEL, MODEL_TIMEOUT)]
+        if use_fallback:
+            attempts.append((self.fallback_llm, FALLBACK_MODEL, FALLBACK_TIMEOUT))
+        
+        errors = []
+        for llm, model, timeout in attempts:
+            breaker = self.breakers.get(model)
+            # Alleen de primary wordt overgeslagen; de laatste poging gaat altijd door (zonder proefplek)
+            reserved = breaker is not None and model != attempts[-1][1]
+            if reserved and not breaker.allow_request():
+                logger.info(f"Skipping {model} stream: circuit breaker is open")
+                errors.append(CircuitOpenError(model))
+                continue
+            try:
+                await self._acquire_rate_limit(model, self._estimate_tokens(self._messages_to_dicts(messages)))
+            except Exception as e:
+                if reserved:
+                    breaker.release()
+                if isinstance(e, QUOTA_ERRORS):
+                    logger.warning(f"{model} quota exhausted, not falling back: {str(e)}")
+                    raise
+                logger.warning(f"Skipping {model} stream: {str(e)}")
+                errors.append(e)
+                continue
+            start_time = time.time()
+            chunks = []
+            stream = llm.astream(messages, **kwargs)
+            try:
+                logger.info(f"Streaming from {model} with timeout {timeout}s")
+                while True:
+                    try:
+                        # Timeout per chunk: een hangende stream telt als timeout
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield chunk.content
+                
+                elapsed = time.time() - start_time
+                self.latency.observe(model, elapsed)
+                reserved = False  # record_success geeft de proefplek zelf terug
+                if breaker is not None:
+                    breaker.record_success(elapsed)
+                logger.info(f"{model} finished streaming in {elapsed:.2f}s")
+                if use_cache and model == PRIMARY_MODEL:
+                    await self._cache_set(request_key, "".join(chunks).strip())
+                return
+            
+            except Exception as e:
+                if not isinstance(e, RateLimitError):
+                    reserved = False  # record_failure geeft de proefplek zelf terug
+                    self._record_failure(model)
+                if isinstance(e, RateLimitError):
+                    await self._register_rate_limit_async(model, e)
+                if chunks:
+                    logger.error(f"Stream from {model} failed after first token: {str(e)}")
+                    raise
+                if isinstance(e, RateLimitError):
+                    logger.warning(f"{model} stream rate limited, not falling back")
+                    raise
+                if isinstance(e, asyncio.TimeoutError):
+                    logger.warning(f"{model} stream timed out after {timeout}s")
+                else:
+                    logger.error(f"Error streaming from {model}: {str(e)}")
+                errors.append(e)
+            finally:
+                # Zonder uitkomst (quota, annulering, afgebroken generator) de eigen proefplek teruggeven
+                if reserved:
+                    breaker.release()
+                await stream.aclose()
+        
+        if all(isinstance(e, asyncio.TimeoutError) for e in errors):
+            if not use_fallback:
+                raise TimeoutError(f"Model {PRIMARY_MODEL} timed out after {MODEL_TIMEOUT}s")
+            raise TimeoutError("Beide AI modellen deden er te lang over. Probeer het later opnieuw.")
+        if not use_fallback:
+            raise errors[-1]
+        raise Exception(f"Beide modellen faalden: {str(errors[-1])}")
     
     async def call_openai_direct_async(self, 
                                       messages: List[Dict[str, str]], 
                                       model: Optional[str] = None,
                                       use_fallback: bool = True,
+                                      use_cache: bool = True,
                                       **kwargs) -> str:
         """
         Direct async OpenAI API call with fallback
@@ -193,6 +603,7 @@ class LLMClient:
             messages: List of messages in OpenAI format
             model: Model to use (defaults to PRIMARY_MODEL)
             use_fallback: Whether to use fallback model on failure
+            use_cache: Whether to serve and store the answer in the response cache
             **kwargs: Additional arguments for the API
             
         Returns:
@@ -200,19 +611,36 @@ class LLMClient:
         """
         if model is None:
             model = PRIMARY_MODEL
-            
+        
+        request_key = make_cache_key(model, None, messages, direct=True, **kwargs)
+        use_cache = use_cache and self.response_cache is not None
+        if use_cache:
+            cached = await self._cache_get(request_key)
+            if cached is not None:
+                logger.info(f"Response cache hit for direct call to {model}")
+                return cached
+        
+        response, answered_by = await self.singleflight.do(
+            ("call_openai_direct_async", request_key, use_fallback),
+            lambda: self._call_openai_direct_async(messages, model, use_fallback, **kwargs)
+        )
+        
+        if use_cache and response is not None and answered_by == model:
+            await self._cache_set(request_key, response)
+        return response
+    
+    async def _call_openai_direct_async(self,
+                                        messages: List[Dict[str, str]],
+                                        model: str,
+                                        use_fallback: bool = True,
+                                        **kwargs) -> Tuple[str, str]:
+        """Direct async OpenAI API call to one model, falling back once on failure; returns (answer, model)"""
         start_time = time.time()
         
         # Try primary model
         try:
             logger.info(f"Direct OpenAI call to {model} with timeout {MODEL_TIMEOUT}s")
-            
-            # Gebruik een nieuwe event loop voor elke call
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
+            await self._acquire_rate_limit(model, self._estimate_tokens(messages))
             
             response = await asyncio.wait_for(
                 self.async_client.chat.completions.create(
@@ -223,8 +651,15 @@ class LLMClient:
             )
             
             elapsed = time.time() - start_time
+            self.latency.observe(model, elapsed)
             logger.info(f"{model} responded in {elapsed:.2f}s")
-            return response.choices[0].message.content.strip()
+            return response.choices[0].message.content.strip(), model
+            
+        except QUOTA_ERRORS as e:
+            if isinstance(e, RateLimitError):
+                await self._register_rate_limit_async(model, e)
+            logger.warning(f"Direct call to {model} hit its quota, not falling back: {str(e)}")
+            raise
             
         except asyncio.TimeoutError:
             logger.warning(f"Direct call to {model} timed out")
@@ -239,7 +674,7 @@ class LLMClient:
         # Fallback
         if use_fallback and model != FALLBACK_MODEL:
             logger.info(f"Falling back to {FALLBACK_MODEL}")
-            return await self.call_openai_direct_async(messages, FALLBACK_MODEL, False, **kwargs)
+            return await self._call_openai_direct_async(messages, FALLBACK_MODEL, False, **kwargs)
     
     def call_openai_direct_sync(self, 
                                messages: List[Dict[str, str]], 
@@ -266,6 +701,8 @@ class LLMClient:
         # Try primary model
         try:
             logger.info(f"Direct sync OpenAI call to {model}")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire_blocking(model, self._estimate_tokens(messages))
             
             response = self.sync_client.chat.completions.create(
                 model=model,
@@ -277,6 +714,12 @@ class LLMClient:
             logger.info(f"{model} responded in {elapsed:.2f}s")
             return response.choices[0].message.content.strip()
             
+        except QUOTA_ERRORS as e:
+            if isinstance(e, RateLimitError):
+                self._register_rate_limit(model, e)
+            logger.warning(f"Direct sync call to {model} hit its quota, not falling back: {str(e)}")
+            raise
+            
         except Exception as e:
             logger.error(f"Direct sync call to {model} failed: {str(e)}")
             if not use_fallback or model == FALLBACK_MODEL:
@@ -287,54 +730,196 @@ class LLMClient:
             logger.info(f"Falling back to {FALLBACK_MODEL}")
             return self.call_openai_direct_sync(messages, FALLBACK_MODEL, False, **kwargs)
     
-    async def create_embedding(self, text: str, model: str = "text-embedding-ada-002") -> List[float]:
+    async def create_embedding(self,
+                               text: str,
+                               model: str = "text-embedding-ada-002",
+                               use_cache: bool = True) -> List[float]:
         """
         Create embeddings using OpenAI
         
         Args:
             text: Text to embed
             model: Embedding model to use
+            use_cache: Whether to serve and store the vector in the embedding cache
             
         Returns:
             List of embedding values
         """
+        loop = asyncio.get_running_loop()
+        if use_cache and self.embedding_cache is not None:
+            # Cache I/O (SQLite + mmap) in een worker thread: de event loop is gedeeld
+            cached = await loop.run_in_executor(None, self.embedding_cache.get, model, text)
+            if cached is not None:
+                return cached.tolist()
+        
         try:
-            # Gebruik een nieuwe event loop voor elke call
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
+            await self._acquire_rate_limit(model, RateLimiter.estimate_tokens(text))
             response = await self.async_client.embeddings.create(
                 model=model,
                 input=text
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
         except Exception as e:
             logger.error(f"Embedding creation failed: {str(e)}")
             raise
+        
+        if use_cache and self.embedding_cache is not None:
+            await loop.run_in_executor(None, self.embedding_cache.put, model, text, embedding)
+        return embedding
     
-    def create_embedding_sync(self, text: str, model: str = "text-embedding-ada-002") -> List[float]:
+    def create_embedding_sync(self,
+                              text: str,
+                              model: str = "text-embedding-ada-002",
+                              use_cache: bool = True) -> List[float]:
         """
         Create embeddings using OpenAI (sync version)
         
         Args:
             text: Text to embed
             model: Embedding model to use
+            use_cache: Whether to serve and store the vector in the embedding cache
             
         Returns:
             List of embedding values
         """
+        if use_cache and self.embedding_cache is not None:
+            cached = self.embedding_cache.get(model, text)
+            if cached is not None:
+                return cached.tolist()
+        
         try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire_blocking(model, RateLimiter.estimate_tokens(text))
             response = self.sync_client.embeddings.create(
                 model=model,
                 input=text
             )
-            return response.data[0].embedding
+            embedding = response.data[0].embedding
         except Exception as e:
             logger.error(f"Embedding creation failed: {str(e)}")
             raise
+        
+        if use_cache and self.embedding_cache is not None:
+            self.embedding_cache.put(model, text, embedding)
+        return embedding
+    
+    async def create_embeddings_batch(self,
+                                      texts: List[str],
+                                      model: str = "text-embedding-ada-002",
+                                      max_concurrency: Optional[int] = None) -> List[List[float]]:
+        """
+        Create embeddings for many texts with as few requests as possible
+        
+        Cached inputs are served from the embedding cache, identical inputs are
+        embedded once, the rest is split into provider-sized chunks (by count and
+        estimated tokens) and chunks run with bounded concurrency.
+        
+        Args:
+            texts: Texts to embed
+            model: Embedding model to use
+            max_concurrency: Maximum concurrent requests (defaults to EMBEDDING_BATCH_CONCURRENCY)
+            
+        Returns:
+            Embeddings in the same order as the input texts
+        """
+        loop = asyncio.get_running_loop()
+        vectors, missing = await loop.run_in_executor(None, self._cached_embeddings, texts, model)
+        chunks = self._chunk_embedding_inputs(missing)
+        semaphore = asyncio.Semaphore(max_concurrency or EMBEDDING_BATCH_CONCURRENCY)
+        
+        async def embed_chunk(chunk: List[str]) -> List[List[float]]:
+            async with semaphore:
+                await self._acquire_rate_limit(model, sum(RateLimiter.estimate_tokens(t) for t in chunk))
+                response = await self.async_client.embeddings.create(model=model, input=chunk)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        
+        try:
+            results = await asyncio.gather(*(embed_chunk(chunk) for chunk in chunks))
+        except Exception as e:
+            logger.error(f"Batch embedding creation failed: {str(e)}")
+            raise
+        
+        await loop.run_in_executor(None, self._store_embeddings, vectors, chunks, results, model)
+        logger.info(f"Embedded {len(texts)} texts ({len(missing)} uncached) in {len(chunks)} requests")
+        return [vectors[text] for text in texts]
+    
+    def create_embeddings_batch_sync(self,
+                                     texts: List[str],
+                                     model: str = "text-embedding-ada-002",
+                                     max_concurrency: Optional[int] = None) -> List[List[float]]:
+        """
+        Create embeddings for many texts (sync version of create_embeddings_batch)
+        
+        Args:
+            texts: Texts to embed
+            model: Embedding model to use
+            max_concurrency: Maximum concurrent requests (defaults to EMBEDDING_BATCH_CONCURRENCY)
+            
+        Returns:
+            Embeddings in the same order as the input texts
+        """
+        vectors, missing = self._cached_embeddings(texts, model)
+        chunks = self._chunk_embedding_inputs(missing)
+        
+        def embed_chunk(chunk: List[str]) -> List[List[float]]:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire_blocking(model, sum(RateLimiter.estimate_tokens(t) for t in chunk))
+            response = self.sync_client.embeddings.create(model=model, input=chunk)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        
+        try:
+            if len(chunks) <= 1:
+                results = [embed_chunk(chunk) for chunk in chunks]
+            else:
+                workers = min(len(chunks), max_concurrency or EMBEDDING_BATCH_CONCURRENCY)
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(embed_chunk, chunks))
+        except Exception as e:
+            logger.error(f"Batch embedding creation failed: {str(e)}")
+            raise
+        
+        self._store_embeddings(vectors, chunks, results, model)
+        return [vectors[text] for text in texts]
+    
+    def _cached_embeddings(self, texts: List[str], model: str):
+        """Split unique inputs into cached vectors and texts that still need embedding"""
+        unique = list(dict.fromkeys(texts))
+        if self.embedding_cache is None:
+            return {}, unique
+        vectors = {}
+        missing = []
+        for text, cached in zip(unique, self.embedding_cache.get_many(model, unique)):
+            if cached is None:
+                missing.append(text)
+            else:
+                vectors[text] = cached.tolist()
+        return vectors, missing
+    
+    def _store_embeddings(self, vectors: Dict[str, List[float]], chunks, results, model: str) -> None:
+        """Merge freshly created vectors into `vectors` and persist them in the embedding cache"""
+        fresh = {text: vector for chunk, chunk_vectors in zip(chunks, results)
+                 for text, vector in zip(chunk, chunk_vectors)}
+        vectors.update(fresh)
+        if fresh and self.embedding_cache is not None:
+            self.embedding_cache.put_many(model, list(fresh), list(fresh.values()))
+    
+    def _chunk_embedding_inputs(self, texts: List[str]) -> List[List[str]]:
+        """Split inputs into chunks that respect the provider's input count and token limits"""
+        chunks = []
+        current = []
+        current_tokens = 0
+        for text in texts:
+            tokens = RateLimiter.estimate_tokens(text)
+            if current and (len(current) >= EMBEDDING_BATCH_MAX_INPUTS
+                            or current_tokens + tokens > EMBEDDING_BATCH_MAX_TOKENS):
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
     
     def _convert_to_langchain_messages(self, messages: List[Dict[str, str]]) -> List[BaseMessage]:
         """Convert dict messages to LangChain format"""
@@ -354,8 +939,41 @@ class LLMClient:
                 
         return langchain_messages
     
+    def _messages_to_dicts(self, messages: List[BaseMessage]) -> List[Dict[str, str]]:
+        """Convert LangChain messages to plain dicts (used for cache keys)"""
+        return [{"role": msg.type, "content": msg.content} for msg in messages]
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return response cache hit/miss counters"""
+        if self.response_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.response_cache.stats()}
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Return all client-side metrics"""
+        return {
+            "response_cache": self.cache_stats(),
+            "coalescing": self.singleflight.stats(),
+            "latency": self.latency.snapshot(),
+            "hedging": {"enabled": HEDGING_ENABLED, "delay": self.hedge_delay(), **self._hedge_stats},
+            "rate_limiter": self.rate_limiter.stats() if self.rate_limiter is not None else {"enabled": False},
+            "circuit_breakers": self.breaker_states(),
+            "http_pool": http_pool.pool_stats(),
+            "event_loop": event_loop.stats(),
+            "structured_output": parse_stats.stats(),
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache is not None else {"enabled": False}
+        }
+    
+    def breaker_states(self) -> Dict[str, Any]:
+        """Return the circuit breaker state of each model"""
+        return {model: breaker.snapshot() for model, breaker in self.breakers.items()}
+    
     async def health_check(self) -> Dict[str, Any]:
-        """Check health of both models"""
+        """Check health of both models (concurrent probes share one check)"""
+        return await self.singleflight.do(("health_check",), self._run_health_check)
+    
+    async def _run_health_check(self) -> Dict[str, Any]:
+        """Probe both models and the embedding endpoint"""
         results = {
             "primary_model": PRIMARY_MODEL,
             "fallback_model": FALLBACK_MODEL,
@@ -367,13 +985,6 @@ class LLMClient:
         # Test primary model
         try:
             test_msg = [HumanMessage(content="test")]
-            # Gebruik een nieuwe event loop voor elke call
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
             await asyncio.wait_for(
                 self.primary_llm.ainvoke(test_msg),
                 timeout=MODEL_TIMEOUT
@@ -399,10 +1010,12 @@ class LLMClient:
             
         # Test embeddings
         try:
-            await self.create_embedding("test")
+            await self.create_embedding("test", use_cache=False)
             results["embedding_available"] = True
         except:
             pass
+        
+        results["circuit_breakers"] = self.breaker_states()
             
         return results
 
@@ -415,13 +1028,8 @@ class LLMClient:
         await self.cleanup()
     
     async def cleanup(self):
-        """Cleanup HTTP clients"""
-        if hasattr(self.primary_llm, 'http_client'):
-            await self.primary_llm.http_client.aclose()
-        if hasattr(self.fallback_llm, 'http_client'):
-            await self.fallback_llm.http_client.aclose()
-        if hasattr(self.async_client, 'http_client'):
-            await self.async_client.http_client.aclose()
+        """Cleanup HTTP clients (the shared connection pool)"""
+        await http_pool.aclose()
 
 # Singleton instance
 llm_client = LLMClient()
\ No newline at end of file
@@ -7,6 +7,7 @@ from .router import RouterAgent
 from .requirement_refiner import RequirementRefiner
 from .workflow_generator import WorkflowGenerator
 from .tom_helper import ToMHelper
+from .session_context import SessionContext
 from agents.llm_client import llm_client
 import asyncio
 import logging
@@ -20,55 +21,56 @@ class AgentManager:
         self.workflow_generator = WorkflowGenerator(model_name)
         self.tom_helper = ToMHelper(model_name)
         self.llm_client = llm_client  # Use centralized client
-        
-        self.conversation_history: List[Dict[str, str]] = []
-        self.context: Dict[str, any] = {
-            "requirements": [],
-            "questions": [],
-            "answers": [],
-            "sentiments": [],
-            "expertise": [],
-            "current_agent": None,
-            "round": 1
-        }
-        self.active_agent = None
-        
+
+    @staticmethod
+    def _init_context(context: SessionContext) -> Dict[str, any]:
+        """Per-session manager state, kept in the session context"""
+        state = context.data
+        state.setdefault("requirements", [])
+        state.setdefault("questions", [])
+        state.setdefault("answers", [])
+        state.setdefault("sentiments", [])
+        state.setdefault("expertise", [])
+        state.setdefault("current_agent", None)
+        state.setdefault("round", 1)
         # Agent status tracking
-        self.router_status = "inactive"
-        self.requirement_refiner_status = "inactive"
-        self.workflow_generator_status = "inactive"
-        self.tom_helper_status = "inactive"
+        state.setdefault("status", {
+            "router": "inactive",
+            "requirement_refiner": "inactive",
+            "workflow_generator": "inactive",
+            "tom_helper": "inactive"
+        })
+        return state
 
-    async def process_query(self, user_input: str, context: Optional[Dict[str, any]] = None) -> Dict[str, any]:
+    async def process_query(self, user_input: str, context: Optional[SessionContext] = None) -> Dict[str, any]:
         """Process a user query through the appropriate agents."""
-        # Add user input to conversation history
-        self.conversation_history.append({"role": "user", "content": user_input})
-        self.context["answers"].append(user_input)
+        context = context or SessionContext()
+        state = self._init_context(context)
+        status = state["status"]
         
         # Route the query
-        self.router_status = "waiting"
+        status["router"] = "waiting"
         try:
-            agent_type = await self.router.route_query(user_input)
-            self.router_status = "active"
+            agent_type = await self.router.route_query(user_input, context)
+            status["router"] = "active"
         except Exception as e:
             logger.error(f"Router failed: {e}")
-            self.router_status = "error"
+            status["router"] = "error"
             agent_type = "RequirementRefiner"  # Default fallback
             
-        self.context["current_agent"] = agent_type
-        self.active_agent = agent_type
+        state["current_agent"] = agent_type
         
         # Get sentiment and expertise level
-        self.tom_helper_status = "waiting"
+        status["tom_helper"] = "waiting"
         try:
             sentiment = await self.tom_helper.detect_sentiment(user_input)
             expertise = await self.tom_helper.estimate_expertise(user_input, "software development")
-            self.tom_helper_status = "active"
-            self.context["sentiments"].append(sentiment)
-            self.context["expertise"].append(expertise)
+            status["tom_helper"] = "active"
+            state["sentiments"].append(sentiment)
+            state["expertise"].append(expertise)
         except Exception as e:
             logger.error(f"ToM helpers failed: {e}")
-            self.tom_helper_status = "error"
+            status["tom_helper"] = "error"
             sentiment = "NEUTRAL"
             expertise = "INTERMEDIATE"
         
@@ -76,58 +78,51 @@ class AgentManager:
         response = None
         
         if agent_type == "RequirementRefiner":
-            self.requirement_refiner_status = "waiting"
+            status["requirement_refiner"] = "waiting"
             try:
-                response = await self.requirement_refiner.process(user_input, self.context)
-                self.requirement_refiner_status = "active"
-                self.context["questions"].append(self.context.get("question", "What are your main requirements?"))
-                if "requirements_complete" not in response:
-                    self.context["requirements"].append(response)
-                self.context["round"] = self.context.get("round", 1) + 1
+                response = await self.requirement_refiner.process(user_input, context)
+                status["requirement_refiner"] = "active"
+                state["round"] = state.get("round", 1) + 1
             except Exception as e:
-                self.requirement_refiner_status = "error"
+                status["requirement_refiner"] = "error"
                 logger.error(f"RequirementRefiner failed: {e}")
                 response = "Er ging iets mis bij het verfijnen van de requirements. Probeer het opnieuw."
                 
         elif agent_type == "WorkflowRefiner":
-            self.workflow_generator_status = "waiting"
+            status["workflow_generator"] = "waiting"
             try:
-                response = await self.workflow_generator.process(user_input, self.context)
-                self.workflow_generator_status = "active"
+                context.add_message("user", user_input)
+                response = await self.workflow_generator.process(user_input, context)
+                status["workflow_generator"] = "active"
+                context.add_message("assistant", response)
             except Exception as e:
-                self.workflow_generator_status = "error"
+                status["workflow_generator"] = "error"
                 logger.error(f"WorkflowGenerator failed: {e}")
                 response = "Er ging iets mis bij het genereren van de workflow. Probeer het opnieuw."
         else:
             response = "Onbekende agent: " + str(agent_type)
-        
-        # Add response to conversation history
-        self.conversation_history.append({"role": "assistant", "content": response})
-        
-        # Get status overview
-        status = self.get_status()
+            context.add_message("user", user_input)
+            context.add_message("assistant", response)
         
         return {
             "response": response,
-            "active_agent": self.active_agent,
-            "context": self.context,
-            "history": self.conversation_history,
-            "status": status,
+            "active_agent": agent_type,
+            "context": state,
+            "history": context.history,
+            "status": self.get_status(context),
             "sentiment": sentiment,
             "expertise": expertise
         }
 
-    def get_status(self) -> Dict[str, any]:
-        """Get current status of all agents"""
+    def get_status(self, context: SessionContext) -> Dict[str, any]:
+        """Get current status of all agents for a session"""
+        state = self._init_context(context)
         return {
             "manager": "active",
-            "router": self.router_status,
-            "requirement_refiner": self.requirement_refiner_status,
-            "workflow_generator": self.workflow_generator_status,
-            "tom_helper": self.tom_helper_status,
-            "active_agent": self.active_agent,
-            "context": self.context,
-            "history": self.conversation_history
+            **state["status"],
+            "active_agent": state["current_agent"],
+            "context": state,
+            "history": context.history
         }
     
     async def health_check(self) -> Dict[str, any]:
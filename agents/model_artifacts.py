@@ -0,0 +1,166 @@
+"""
+Model artifacts for Happy2Align
+Versioned joblib artifacts and JSONL decision logs shared by the local classifiers
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT = 1
+
+# Drempels waarvoor de training dekking en nauwkeurigheid rapporteert
+CALIBRATION_THRESHOLDS = (0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+
+
+def artifact_path(directory: str, name: str, version: int) -> str:
+    """Path of one artifact version"""
+    return os.path.join(directory, f"{name}-v{version}.joblib")
+
+
+def artifact_versions(directory: str, name: str) -> List[int]:
+    """All versions of an artifact in a directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    prefix = f"{name}-v"
+    versions = []
+    for filename in os.listdir(directory):
+        if filename.startswith(prefix) and filename.endswith(".joblib"):
+            try:
+                versions.append(int(filename[len(prefix):-len(".joblib")]))
+            except ValueError:
+                pass
+    return sorted(versions)
+
+
+def next_version(directory: str, name: str) -> int:
+    """Version number for a newly trained artifact"""
+    versions = artifact_versions(directory, name)
+    return versions[-1] + 1 if versions else 1
+
+
+def load_artifact(directory: str, name: str, version: str = "latest") -> Optional[Dict[str, Any]]:
+    """
+    Load an artifact (only load artifacts you trained yourself: joblib unpickles)
+
+    Args:
+        directory: Artifact directory
+        name: Artifact name (file prefix)
+        version: Version number or "latest"
+
+    Returns:
+        The stored payload or None when no artifact exists
+    """
+    import joblib
+
+    if version == "latest":
+        versions = artifact_versions(directory, name)
+        if not versions:
+            return None
+        version = versions[-1]
+    path = artifact_path(directory, name, int(version))
+    if not os.path.exists(path):
+        return None
+    artifact = joblib.load(path)
+    if artifact.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported artifact format in {path}")
+    return artifact
+
+
+def save_artifact(directory: str, name: str, version: int, payload: Dict[str, Any]) -> str:
+    """Write an artifact version and return its path"""
+    import joblib
+
+    os.makedirs(directory, exist_ok=True)
+    path = artifact_path(directory, name, version)
+    joblib.dump({"format": ARTIFACT_FORMAT, "version": version, **payload}, path)
+    return path
+
+
+def calibration_table(probabilities: np.ndarray, correct: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Coverage and accuracy of held-out predictions per confidence threshold
+
+    Args:
+        probabilities: Probability of the predicted label per held-out example
+        correct: Whether that prediction matched the label
+
+    Returns:
+        One {"threshold", "coverage", "accuracy"} row per threshold in CALIBRATION_THRESHOLDS
+    """
+    rows = []
+    for threshold in CALIBRATION_THRESHOLDS:
+        confident = probabilities >= threshold
+        rows.append({
+            "threshold": threshold,
+            "coverage": float(confident.mean()),
+            "accuracy": float(correct[confident].mean()) if confident.any() else None,
+        })
+    return rows
+
+
+def format_calibration(rows: List[Dict[str, Any]]) -> str:
+    """Calibration table as aligned text for the training CLIs"""
+    lines = [f"{'threshold':>10}{'coverage':>10}{'accuracy':>10}"]
+    for row in rows:
+        accuracy = f"{row['accuracy']:.3f}" if row["accuracy"] is not None else "-"
+        lines.append(f"{row['threshold']:>10.2f}{row['coverage']:>10.2f}{accuracy:>10}")
+    return "\n".join(lines)
+
+
+class DecisionLog:
+    """Append-only JSONL log of classification decisions (the training data for retraining)"""
+
+    def __init__(self, path: Optional[str], log_text: bool = True):
+        """
+        Initialize the log
+
+        Args:
+            path: JSONL file (None disables logging)
+            log_text: Store the classified text; False stores only its hash and length
+        """
+        self.path = path
+        self.log_text = log_text
+        self._lock = threading.Lock()
+
+    def append(self, **entry: Any) -> None:
+        """Append one decision with a timestamp"""
+        if not self.path:
+            return
+        if not self.log_text and "text" in entry:
+            # Gebruikersberichten alleen bewaren als dat expliciet aan staat (niet bruikbaar om te trainen)
+            text = entry.pop("text") or ""
+            entry["text_sha256"] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            entry["text_length"] = len(text)
+        entry = {"ts": datetime.utcnow().isoformat(), **entry}
+        try:
+            with self._lock:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write decision log {self.path}: {str(e)}")
+
+    @staticmethod
+    def read(path: str, source: Optional[str] = "llm") -> Iterator[Dict[str, Any]]:
+        """Yield logged decisions (by default only those made by the LLM)"""
+        if not path or not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if source is None or entry.get("source") == source:
+                    yield entry
@@ -5,44 +5,172 @@ Implements the complete flow as specified in the conceptual design
 
 from agents.prompts import (
     ROUTER_PROMPT, REQUIREMENT_REFINER_PROMPT, WORKFLOW_GENERATOR_PROMPT,
-    WORKFLOW_REFINER_PROMPT, TOPIC_DECOMPOSER_PROMPT, EXPERTISE_TOM_PROMPT, SENTIMENT_TOM_PROMPT
+    WORKFLOW_REFINER_PROMPT, TOPIC_DECOMPOSER_PROMPT, EXPERTISE_TOM_PROMPT, SENTIMENT_TOM_PROMPT,
+    TURN_ANALYSIS_PROMPT, WORKFLOW_PATCH_PROMPT
 )
-import re
 import asyncio
-from typing import Dict, List, Any, Optional
+import contextvars
+from typing import Callable, Dict, Iterator, List, Any, AsyncIterator, Optional, Tuple
 from langchain_openai import ChatOpenAI
+from langchain.schema import HumanMessage
+from agents.config import (
+    ORCHESTRATOR_SPECULATION, TURN_ANALYSIS_FUSED, WORKFLOW_PATCH_ENABLED, WORKFLOW_PATCH_MIN_STEPS
+)
+from agents.event_loop import event_loop
+from agents.conversation_memory import ConversationMemory, conversation_memory as default_conversation_memory
+from agents.llm_client import LLMClient, llm_client
+from agents.router_classifier import LocalRouter, local_router as default_local_router
+from agents.semantic_cache import SemanticCache, semantic_cache as default_semantic_cache
+from agents.session_context import SessionContext
+from agents.step_executor import Step, StepExecutor
+from agents.structured_output import (
+    DECOMPOSITION_RESPONSE, WORKFLOW_RESPONSE, StepStream, parse_decomposition, parse_stats,
+    parse_steps
+)
+from agents.tom_estimator import LocalToM, expertise_text, local_tom as default_local_tom
+from agents.turn_analysis import (
+    TURN_ANALYSIS_RESPONSE, TurnAnalysisError, normalize_expertise, normalize_route, normalize_sentiment,
+    parse_turn_analysis
+)
+from agents.workflow_patch import PATCH_RESPONSE, PatchError, apply_patch, parse_patch
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Event-sink van de lopende streaming-run (None = niet streamen)
+_event_sink: contextvars.ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = \
+    contextvars.ContextVar("orchestrator_event_sink", default=None)
+
 class ImprovedOrchestrator:
-    def __init__(self, llm: ChatOpenAI):
+    def __init__(self, llm: ChatOpenAI, client: Optional[LLMClient] = None,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 local_router: Optional[LocalRouter] = None,
+                 local_tom: Optional[LocalToM] = None,
+                 memory: Optional[ConversationMemory] = None):
         self.llm = llm
+        # Alle prompts gaan via de centrale client (fallback + response cache)
+        self.client = client or llm_client
+        # Semantic cache voor parafrases van dezelfde openingsvraag
+        self.semantic_cache = semantic_cache or default_semantic_cache
+        # Lokale classifier beslist zelf als hij zeker genoeg is, anders de LLM
+        self.local_router = local_router or default_local_router
+        # Lokale ToM-schatter; alleen onzekere beurten gaan naar de expertise/sentiment prompts
+        self.local_tom = local_tom or default_local_tom
+        # Laatste berichten letterlijk + samenvatting van oudere beurten, binnen een tokenbudget
+        self.memory = memory or default_conversation_memory
+        # Onafhankelijke stappen (router, decompositie, ToM) lopen parallel
+        self.executor = StepExecutor(speculation=ORCHESTRATOR_SPECULATION)
+        # Router + expertise + sentiment in één JSON-call i.p.v. drie losse prompts
+        self.fused_analysis = TURN_ANALYSIS_FUSED
+        self.analysis_stats = {"fused_calls": 0, "fused_failures": 0}
+        # Workflow verfijning als edit-operaties; ongeldige patches vallen terug op volledig opnieuw genereren
+        self.workflow_patch = WORKFLOW_PATCH_ENABLED
+        self.patch_stats = {"patched": 0, "fallbacks": 0, "operations": 0}
         self.max_questions_per_subtopic = 5
-        self.conversation_history = []
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters of the fused turn analysis, workflow patches (versus regenerations) and the step executor"""
+        patches = dict(self.patch_stats)
+        attempts = patches["patched"] + patches["fallbacks"]
+        patches["patch_rate"] = patches["patched"] / attempts if attempts else None
+        return {"turn_analysis": dict(self.analysis_stats), "workflow_patch": patches,
+                "executor": self.executor.stats()}
+    
+    async def _ask(self, prompt: str, stream_field: Optional[str] = None, **kwargs) -> str:
+        """
+        Send a single prompt through the centralized LLM client
+        
+        When a streaming run is active and stream_field is given, tokens are
+        emitted as "token" events; for the "workflow" field every completed
+        step is also emitted as a "step" event while the answer streams.
+        """
+        emit = _event_sink.get()
+        if emit is None or stream_field is None:
+            return await self.client.call_async([HumanMessage(content=prompt)], **kwargs)
+        
+        chunks = []
+        # Workflow-stappen worden uitgezonden zodra ze compleet zijn (JSON of genummerde lijst)
+        steps = StepStream() if stream_field == "workflow" else None
+        async for chunk in self.client.call_stream([HumanMessage(content=prompt)], **kwargs):
+            chunks.append(chunk)
+            emit({"event": "token", "field": stream_field, "text": chunk})
+            if steps is not None:
+                for step in steps.feed(chunk):
+                    emit({"event": "step", "text": step})
+        if steps is not None:
+            for step in steps.close():
+                emit({"event": "step", "text": step})
+        return "".join(chunks).strip()
+    
+    async def run_conversation_stream(self, user_input: str, conversation_history: Optional[List[Dict]] = None,
+                                      current_workflow: Optional[List[str]] = None,
+                                      context: Optional[SessionContext] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of run_conversation
+        
+        Yields "status", "token" and "step" events while the flow runs and a
+        final {"event": "result", "data": ...} with the same payload as run_conversation.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        
+        async def run():
+            _event_sink.set(events.put_nowait)
+            return await self.run_conversation(user_input, conversation_history, current_workflow, context)
+        
+        task = asyncio.ensure_future(run())
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            yield {"event": "result", "data": task.result()}
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    def _emit_status(self, agent: str, message: str) -> None:
+        """Emit a status event when a streaming run is active"""
+        emit = _event_sink.get()
+        if emit is not None:
+            emit({"event": "status", "agent": agent, "message": message})
         
     async def run_conversation(self, user_input: str, conversation_history: Optional[List[Dict]] = None, 
-                              current_workflow: Optional[List[str]] = None) -> Dict[str, Any]:
+                              current_workflow: Optional[List[str]] = None,
+                              context: Optional[SessionContext] = None) -> Dict[str, Any]:
         """
         Main orchestration method that handles the complete flow
+        
+        All conversation state lives in the session context, so one orchestrator
+        can run turns of many sessions concurrently.
+        
+        Args:
+            user_input: Latest user message
+            conversation_history: History of the session (ignored when context is given)
+            current_workflow: Workflow of the session (ignored when context is given)
+            context: Session context of this turn
         """
+        if context is None:
+            context = SessionContext(
+                history=conversation_history if conversation_history is not None else [],
+                current_workflow=current_workflow
+            )
+        
         try:
-            # Initialize conversation history if not provided
-            if conversation_history is None:
-                conversation_history = []
-            self.conversation_history = conversation_history
-            
             # Add user input to history
-            self.conversation_history.append({"role": "user", "content": user_input})
+            context.add_message("user", user_input)
             
-            # Step 1: Route the query
-            router_decision = await self._route(user_input)
+            # Step 1: Route the query; decomposition and ToM start speculatively alongside it
+            self._emit_status("router", "Router analyseert je bericht...")
+            run = await self.executor.run(self._first_turn_steps(user_input, context))
+            router_decision = run.results["route"]
             logger.info(f"Router decision: {router_decision}")
             
             if router_decision == "RequirementRefiner":
-                return await self._handle_requirement_refinement(user_input)
+                return await self._handle_requirement_refinement(user_input, run.results, context)
             elif router_decision == "WorkflowRefiner":
-                return await self._handle_workflow_refinement(user_input, current_workflow)
+                return await self._handle_workflow_refinement(user_input, context)
             else:
                 return {
                     "error": f"Unknown router decision: {router_decision}",
@@ -54,25 +182,165 @@ class ImprovedOrchestrator:
             return {
                 "error": str(e),
                 "type": "error",
-                "history": self.conversation_history
+                "history": context.history
             }
     
+    def _first_turn_steps(self, user_input: str, context: SessionContext) -> List[Step]:
+        """
+        DAG of the first turn
+        
+        Decomposition and the ToM estimates only matter for the requirement flow,
+        but need nothing but the user input, so they run speculatively while the
+        router decides and are discarded when it picks WorkflowRefiner. In fused
+        mode route, expertise and sentiment all come from one analysis call.
+        """
+        def needs_requirements(results: Dict[str, Any]) -> bool:
+            return results["route"] == "RequirementRefiner"
+        
+        async def decompose(results):
+            self._emit_status("decomposer", "Onderwerpen worden opgesplitst...")
+            return await self._decompose_topics(user_input)
+        
+        async def first_question(results):
+            subtopic = results["decompose"][0]
+            questions = subtopic["questions"][:self.max_questions_per_subtopic]
+            if not questions:
+                return None
+            self._emit_status("req", "Vraag wordt opgesteld...")
+            return await self._refine_question(subtopic["title"], questions[0],
+                                               results["expertise"], results["sentiment"], context.history)
+        
+        speculative = {"condition": needs_requirements, "condition_on": ("route",), "speculative": True}
+        question = Step("question", first_question, depends_on=("decompose", "expertise", "sentiment"),
+                        condition=needs_requirements, condition_on=("route",))
+        
+        if self.fused_analysis:
+            def field(name):
+                async def pick(results):
+                    return results["analysis"][name]
+                return Step(name, pick, depends_on=("analysis",))
+            
+            return [
+                Step("analysis", lambda results: self._analyze_turn(user_input, context.history)),
+                field("route"),
+                field("expertise"),
+                field("sentiment"),
+                Step("decompose", decompose, **speculative),
+                question,
+            ]
+        
+        return [
+            Step("route", lambda results: self._route(user_input)),
+            Step("decompose", decompose, **speculative),
+            Step("expertise", lambda results: self._estimate_expertise(context.history), **speculative),
+            Step("sentiment", lambda results: self._detect_sentiment(user_input, context.history), **speculative),
+            question,
+        ]
+    
+    async def _analyze_turn(self, user_input: str, history: List[Dict]) -> Dict[str, str]:
+        """
+        Route and estimate expertise and sentiment in a single JSON-mode call
+        
+        Falls back to the separate prompts when the answer does not match the schema.
+        """
+        
+        # Geen LLM call als de lokale modellen alle drie de velden zeker weten
+        predictions = {"route": None, "expertise": None, "sentiment": None}
+        local = {"route": None, "expertise": None, "sentiment": None}
+        if self.local_router is not None and self.local_tom is not None:
+            predictions["route"], predictions["expertise"], predictions["sentiment"] = await asyncio.gather(
+                self.local_router.predict(user_input),
+                self.local_tom.predict("expertise", expertise_text(history)),
+                self.local_tom.predict("sentiment", user_input)
+            )
+            local = {
+                "route": self.local_router.decide(user_input, predictions["route"]),
+                "expertise": self.local_tom.decide("expertise", expertise_text(history), predictions["expertise"]),
+                "sentiment": self.local_tom.decide("sentiment", user_input, predictions["sentiment"]),
+            }
+            if all(local.values()):
+                return local
+        
+        conv_str = self.memory.render(history)
+        prompt = TURN_ANALYSIS_PROMPT.format(conversation=conv_str, latest_message=user_input)
+        
+        self.analysis_stats["fused_calls"] += 1
+        output = await self._ask(prompt, response_format=TURN_ANALYSIS_RESPONSE)
+        try:
+            analysis = parse_turn_analysis(output)
+            # Velden die lokaal de drempel haalden blijven staan (en zijn al gelogd); de rest komt van de LLM
+            if self.local_router is not None and local["route"] is None:
+                self.local_router.record(user_input, analysis["route"], "llm", prediction=predictions["route"])
+            if self.local_tom is not None:
+                if local["expertise"] is None:
+                    self.local_tom.record("expertise", expertise_text(history), analysis["expertise"], "llm",
+                                          prediction=predictions["expertise"])
+                if local["sentiment"] is None:
+                    self.local_tom.record("sentiment", user_input, analysis["sentiment"], "llm",
+                                          prediction=predictions["sentiment"])
+            analysis.update({field: value for field, value in local.items() if value is not None})
+            return analysis
+        except TurnAnalysisError as e:
+            self.analysis_stats["fused_failures"] += 1
+            logger.warning(f"{str(e)}, falling back to separate prompts")
+        
+        # Alleen de velden die lokaal niet vaststonden apart vragen (die andere zijn al geteld en gelogd)
+        fallbacks = {
+            "route": lambda: (self._route_with_llm(user_input, predictions["route"])
+                              if predictions["route"] is not None else self._route(user_input)),
+            "expertise": lambda: self._estimate_expertise(history=history),
+            "sentiment": lambda: self._detect_sentiment(user_input, history=history),
+        }
+        missing = [field for field, value in local.items() if value is None]
+        values = await asyncio.gather(*(fallbacks[field]() for field in missing))
+        return {**local, **dict(zip(missing, values))}
+    
     async def _route(self, user_input: str) -> str:
         """Route the query to the appropriate agent"""
+        prediction = None
+        if self.local_router is not None:
+            prediction = await self.local_router.predict(user_input)
+            decision = self.local_router.decide(user_input, prediction)
+            if decision is not None:
+                return decision
+        return await self._route_with_llm(user_input, prediction)
+    
+    async def _route_with_llm(self, user_input: str, prediction: Optional[Tuple[str, float]]) -> str:
+        """Route with the semantic cache or the LLM once the local classifier deferred"""
+        if self.semantic_cache is not None:
+            cached = await self.semantic_cache.lookup("route", user_input)
+            if cached is not None:
+                return cached
+        
         prompt = ROUTER_PROMPT.format(user_input=user_input)
-        response = await self.llm.ainvoke(prompt)
-        decision = response.content.strip()
+        decision = await self._ask(prompt)
         
         # Validate router output
-        if decision not in ["RequirementRefiner", "WorkflowRefiner"]:
+        decision = normalize_route(decision)
+        if decision is None:
             # Default to RequirementRefiner for new conversations
             return "RequirementRefiner"
+        
+        if self.local_router is not None:
+            self.local_router.record(user_input, decision, "llm", prediction=prediction)
+        if self.semantic_cache is not None:
+            await self.semantic_cache.store("route", user_input, decision)
         return decision
     
-    async def _handle_requirement_refinement(self, user_input: str) -> Dict[str, Any]:
-        """Handle the requirement refinement flow"""
-        # Step 2: Decompose topics
-        subtopics = await self._decompose_topics(user_input)
+    async def _handle_requirement_refinement(self, user_input: str, results: Dict[str, Any],
+                                             context: SessionContext) -> Dict[str, Any]:
+        """
+        Handle the requirement refinement flow
+        
+        Args:
+            user_input: Latest user message
+            results: Results of the first-turn steps (decompose, expertise, sentiment, question)
+            context: Session context of this turn
+        """
+        # Step 2: Subtopics and ToM come from the step run
+        subtopics = results["decompose"]
+        expertise = results["expertise"]
+        sentiment = results["sentiment"]
         
         # Initialize requirements collection
         requirements = []
@@ -85,17 +353,18 @@ class ImprovedOrchestrator:
             
             # Process questions for this subtopic (max 5)
             for question_idx, question in enumerate(subtopic["questions"][:self.max_questions_per_subtopic]):
-                # Check ToM before asking
-                expertise = await self._estimate_expertise()
-                sentiment = await self._detect_sentiment(user_input)
-                
-                # Ask clarifying question
-                refined_question = await self._refine_question(
-                    subtopic["title"], 
-                    question, 
-                    expertise,
-                    sentiment
-                )
+                # Ask clarifying question (the first one was already refined by the step run)
+                if subtopic_idx == 0 and question_idx == 0:
+                    refined_question = results["question"]
+                else:
+                    self._emit_status("req", "Vraag wordt opgesteld...")
+                    refined_question = await self._refine_question(
+                        subtopic["title"],
+                        question,
+                        expertise,
+                        sentiment,
+                        context.history
+                    )
                 
                 all_questions_asked.append(refined_question)
                 
@@ -109,12 +378,14 @@ class ImprovedOrchestrator:
                         "subtopic_index": subtopic_idx,
                         "question_index": question_idx,
                         "total_subtopics": len(subtopics),
+                        "subtopics": subtopics,
                         "expertise": expertise,
                         "sentiment": sentiment,
-                        "history": self.conversation_history
+                        "history": context.history
                     }
         
         # Step 4: Generate workflow from requirements
+        self._emit_status("workflow", "Workflow wordt gegenereerd...")
         workflow = await self._generate_workflow(requirements)
         
         return {
@@ -122,53 +393,45 @@ class ImprovedOrchestrator:
             "workflow": workflow,
             "requirements": requirements,
             "questions_asked": all_questions_asked,
-            "history": self.conversation_history
+            "history": context.history
         }
     
-    async def _handle_workflow_refinement(self, user_input: str, current_workflow: Optional[List[str]]) -> Dict[str, Any]:
+    async def _handle_workflow_refinement(self, user_input: str, context: SessionContext) -> Dict[str, Any]:
         """Handle workflow refinement requests"""
+        current_workflow = context.current_workflow
         if not current_workflow:
             return {
                 "type": "error",
                 "error": "No current workflow to refine. Please create requirements first.",
-                "history": self.conversation_history
+                "history": context.history
             }
         
+        self._emit_status("workflow", "Workflow wordt aangepast...")
         refined_workflow = await self._refine_workflow(current_workflow, user_input)
         
         return {
             "type": "workflow_refined",
             "workflow": refined_workflow,
             "modification": user_input,
-            "history": self.conversation_history
+            "history": context.history
         }
     
     async def _decompose_topics(self, user_request: str) -> List[Dict[str, Any]]:
         """Decompose user request into subtopics with questions"""
-        prompt = TOPIC_DECOMPOSER_PROMPT.format(user_request=user_request)
-        response = await self.llm.ainvoke(prompt)
-        output = response.content
-        
-        # Parse subtopics and questions
-        subtopics = []
-        current = None
-        
-        for line in output.splitlines():
-            line = line.strip()
-            # Match subtopic pattern
-            subtopic_match = re.match(r"- Subtopic \d+: (.+)", line)
-            if subtopic_match:
-                if current:
-                    subtopics.append(current)
-                current = {"title": subtopic_match.group(1), "questions": []}
-            # Match question pattern
-            elif current and (line.startswith("- Q") or line.startswith("Q")):
-                question = line.split(":", 1)[-1].strip()
-                if question:
-                    current["questions"].append(question)
-        
-        if current:
-            subtopics.append(current)
+        output = None
+        if self.semantic_cache is not None:
+            output = await self.semantic_cache.lookup("decompose", user_request)
+        
+        if output is None:
+            prompt = TOPIC_DECOMPOSER_PROMPT.format(user_request=user_request)
+            output = await self._ask(prompt, response_format=DECOMPOSITION_RESPONSE)
+            subtopics, method = parse_decomposition(output)
+            # Alleen bruikbare antwoorden cachen
+            if method != "failed" and self.semantic_cache is not None:
+                await self.semantic_cache.store("decompose", user_request, output)
+        else:
+            subtopics, method = parse_decomposition(output)
+        parse_stats.record("decompose", method)
         
         # Ensure we have at least one subtopic
         if not subtopics:
@@ -185,10 +448,44 @@ class ImprovedOrchestrator:
         
         return subtopics
     
-    async def _refine_question(self, subtopic: str, question: str, expertise: str, sentiment: str) -> str:
+    async def refine_question(self, subtopic: str, question: str, history: List[Dict],
+                              expertise: str, sentiment: str) -> str:
+        """Refine a follow-up question for a conversation outside of run_conversation"""
+        return await self._refine_question(subtopic, question, expertise, sentiment, history=history)
+    
+    async def estimate_tom(self, history: List[Dict], latest_message: str) -> Dict[str, str]:
+        """Estimate expertise and sentiment concurrently for a conversation"""
+        if self.fused_analysis:
+            analysis = await self._analyze_turn(latest_message, history=history)
+            return {"expertise": analysis["expertise"], "sentiment": analysis["sentiment"]}
+        expertise, sentiment = await asyncio.gather(
+            self._estimate_expertise(history=history),
+            self._detect_sentiment(latest_message, history=history)
+        )
+        return {"expertise": expertise, "sentiment": sentiment}
+    
+    async def local_tom_estimate(self, history: List[Dict], latest_message: str) -> Dict[str, Optional[str]]:
+        """
+        Expertise and sentiment from the local estimator alone (no LLM call, nothing logged)
+        
+        A label is None where there is no estimator or it is below its threshold.
+        """
+        if self.local_tom is None:
+            return {"expertise": None, "sentiment": None}
+        predictions = await asyncio.gather(
+            self.local_tom.predict("expertise", expertise_text(history)),
+            self.local_tom.predict("sentiment", latest_message)
+        )
+        return {
+            field: prediction[0] if prediction is not None and prediction[1] >= self.local_tom.thresholds[field] else None
+            for field, prediction in zip(("expertise", "sentiment"), predictions)
+        }
+    
+    async def _refine_question(self, subtopic: str, question: str, expertise: str, sentiment: str,
+                               history: List[Dict]) -> str:
         """Refine a question based on ToM insights"""
         # Build conversation context
-        conv_str = "\n".join(f"{msg['role']}: {msg['content']}" for msg in self.conversation_history)
+        conv_str = self.memory.render(history)
         
         # Add ToM context to the prompt
         enhanced_prompt = f"""{REQUIREMENT_REFINER_PROMPT}
@@ -211,36 +508,52 @@ Adjust your question complexity and tone accordingly:
             conversation=conv_str
         )
         
-        response = await self.llm.ainvoke(prompt)
-        return response.content.strip()
+        return await self._ask(prompt, stream_field="question")
     
-    async def _estimate_expertise(self) -> str:
+    async def _estimate_expertise(self, history: List[Dict]) -> str:
         """Estimate user expertise based on conversation"""
-        conv_str = "\n".join(f"{msg['role']}: {msg['content']}" for msg in self.conversation_history)
-        prompt = EXPERTISE_TOM_PROMPT.format(conversation=conv_str)
-        response = await self.llm.ainvoke(prompt)
-        expertise = response.content.strip()
+        user_text = expertise_text(history)
+        prediction = None
+        if self.local_tom is not None:
+            prediction = await self.local_tom.predict("expertise", user_text)
+            expertise = self.local_tom.decide("expertise", user_text, prediction)
+            if expertise is not None:
+                return expertise
         
-        # Validate expertise level
-        if expertise not in ["BEGINNER", "INTERMEDIATE", "EXPERT"]:
-            expertise = "INTERMEDIATE"  # Default
+        conv_str = self.memory.render(history)
+        prompt = EXPERTISE_TOM_PROMPT.format(conversation=conv_str)
+        expertise = await self._ask(prompt)
         
+        # Validate expertise level (the prompt asks for Novice/Intermediate/Expert)
+        expertise = normalize_expertise(expertise)
+        if expertise is None:
+            return "INTERMEDIATE"  # Default
+        if self.local_tom is not None:
+            self.local_tom.record("expertise", user_text, expertise, "llm", prediction=prediction)
         return expertise
     
-    async def _detect_sentiment(self, latest_message: str) -> str:
+    async def _detect_sentiment(self, latest_message: str, history: List[Dict]) -> str:
         """Detect sentiment from conversation"""
-        conv_str = "\n".join(f"{msg['role']}: {msg['content']}" for msg in self.conversation_history)
+        prediction = None
+        if self.local_tom is not None:
+            prediction = await self.local_tom.predict("sentiment", latest_message)
+            sentiment = self.local_tom.decide("sentiment", latest_message, prediction)
+            if sentiment is not None:
+                return sentiment
+        
+        conv_str = self.memory.render(history)
         prompt = SENTIMENT_TOM_PROMPT.format(
             conversation=conv_str,
             latest_message=latest_message
         )
-        response = await self.llm.ainvoke(prompt)
-        sentiment = response.content.strip()
+        sentiment = await self._ask(prompt)
         
         # Validate sentiment
-        if sentiment not in ["POSITIVE", "NEUTRAL", "NEGATIVE", "MIXED"]:
-            sentiment = "NEUTRAL"  # Default
-        
+        sentiment = normalize_sentiment(sentiment)
+        if sentiment is None:
+            return "NEUTRAL"  # Default
+        if self.local_tom is not None:
+            self.local_tom.record("sentiment", latest_message, sentiment, "llm", prediction=prediction)
         return sentiment
     
     async def _generate_workflow(self, requirements: List[Dict[str, Any]]) -> List[str]:
@@ -249,19 +562,11 @@ Adjust your question complexity and tone accordingly:
         req_str = "\n".join(f"- {r.get('subtopic', 'General')}: {r.get('answer', '')}" for r in requirements)
         
         prompt = WORKFLOW_GENERATOR_PROMPT.format(requirements=req_str)
-        response = await self.llm.ainvoke(prompt)
-        output = response.content
-        
-        # Parse workflow steps
-        steps = []
-        for line in output.splitlines():
-            line = line.strip()
-            if line and (line[0].isdigit() or line.startswith("-")):
-                # Clean up the line
-                step = re.sub(r"^\d+\.\s*", "", line)
-                step = re.sub(r"^-\s*", "", step)
-                if step:
-                    steps.append(step)
+        output = await self._ask(prompt, stream_field="workflow", response_format=WORKFLOW_RESPONSE)
+        
+        # Parse workflow steps (JSON, lokaal gerepareerd of als genummerde lijst)
+        steps, method = parse_steps(output)
+        parse_stats.record("workflow", method)
         
         # Ensure we have at least some steps
         if not steps:
@@ -277,28 +582,63 @@ Adjust your question complexity and tone accordingly:
         return steps
     
     async def _refine_workflow(self, workflow: List[str], modification: str) -> List[str]:
-        """Refine existing workflow based on user input"""
+        """
+        Refine existing workflow based on user input
+        
+        Longer workflows are edited through a patch (insert/delete/replace
+        operations applied locally), so the output scales with the size of the
+        change instead of the length of the workflow. When the patch does not
+        parse or apply, the full workflow is regenerated.
+        """
         workflow_str = "\n".join(f"{i+1}. {step}" for i, step in enumerate(workflow))
         
+        if self.workflow_patch and len(workflow) >= WORKFLOW_PATCH_MIN_STEPS:
+            steps = await self._patch_workflow(workflow, workflow_str, modification)
+            if steps is not None:
+                return steps
+        
         prompt = WORKFLOW_REFINER_PROMPT.format(
             workflow=workflow_str,
             modification=modification
         )
         
-        response = await self.llm.ainvoke(prompt)
-        output = response.content
+        output = await self._ask(prompt, stream_field="workflow", response_format=WORKFLOW_RESPONSE)
         
         # Parse refined workflow
-        steps = []
-        for line in output.splitlines():
-            line = line.strip()
-            if line and (line[0].isdigit() or line.startswith("-")):
-                step = re.sub(r"^\d+\.\s*", "", line)
-                step = re.sub(r"^-\s*", "", step)
-                if step:
-                    steps.append(step)
+        steps, method = parse_steps(output)
+        parse_stats.record("workflow_refine", method)
         
         return steps if steps else workflow  # Fallback to original if parsing fails
+    
+    async def _patch_workflow(self, workflow: List[str], workflow_str: str, modification: str) -> Optional[List[str]]:
+        """Ask for edit operations and apply them; None when the patch is unusable"""
+        prompt = WORKFLOW_PATCH_PROMPT.format(
+            workflow=workflow_str,
+            modification=modification,
+            append_index=len(workflow) + 1
+        )
+        # Niet streamen: ruwe patch-JSON is niets voor de gebruiker, en bij een afgekeurde patch volgt alleen
+        # de volledige workflow als stream. Na het toepassen gaan de stappen van de nieuwe workflow naar buiten
+        output = await self._ask(prompt, response_format=PATCH_RESPONSE)
+        
+        try:
+            operations, method = parse_patch(output)
+            steps = apply_patch(workflow, operations)
+        except PatchError as e:
+            logger.warning(f"Workflow patch rejected, regenerating full workflow: {e}")
+            parse_stats.record("workflow_patch", "failed")
+            self.patch_stats["fallbacks"] += 1
+            return None
+        
+        parse_stats.record("workflow_patch", method)
+        self.patch_stats["patched"] += 1
+        self.patch_stats["operations"] += len(operations)
+        # De live weergave krijgt de stappen van de gepatchte workflow
+        emit = _event_sink.get()
+        if emit is not None:
+            for step in steps:
+                emit({"event": "step", "text": step})
+        return steps
 
 # Synchronous wrapper for compatibility
 class Orchestrator:
@@ -307,14 +647,29 @@ class Orchestrator:
     def __init__(self, llm):
         self.async_orchestrator = ImprovedOrchestrator(llm)
     
+    def stats(self) -> Dict[str, Any]:
+        """Counters of the wrapped orchestrator"""
+        return self.async_orchestrator.stats()
+    
     def run_conversation(self, user_input: str, conversation_history: Optional[List[Dict]] = None,
-                        current_workflow: Optional[List[str]] = None) -> Dict[str, Any]:
-        """Synchronous wrapper for async orchestrator"""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(
-                self.async_orchestrator.run_conversation(user_input, conversation_history, current_workflow)
-            )
-        finally:
-            loop.close()
\ No newline at end of file
+                        current_workflow: Optional[List[str]] = None,
+                        context: Optional[SessionContext] = None) -> Dict[str, Any]:
+        """Synchronous wrapper for async orchestrator (runs on the process-wide event loop)"""
+        return event_loop.run(
+            self.async_orchestrator.run_conversation(user_input, conversation_history, current_workflow, context)
+        )
+    
+    def stream_conversation(self, user_input: str, conversation_history: Optional[List[Dict]] = None,
+                            current_workflow: Optional[List[str]] = None,
+                            context: Optional[SessionContext] = None) -> Iterator[Dict[str, Any]]:
+        """Synchronous iterator over the events of a streaming run"""
+        async def events():
+            try:
+                async for event in self.async_orchestrator.run_conversation_stream(
+                        user_input, conversation_history, current_workflow, context):
+                    yield event
+            except Exception as e:
+                logger.error(f"Streaming orchestration error: {str(e)}")
+                yield {"event": "result", "data": {"type": "error", "error": str(e)}}
+        
+        yield from event_loop.iterate(events)
\ No newline at end of file
@@ -32,7 +32,8 @@ Make sure each step is clear, executable, and relevant to the user's intent.
 Refined Requirements:
 {requirements}
 
-Generate only the numbered list of workflow steps, without any additional explanation or introduction.
+Return only a JSON object with the ordered workflow steps, without any additional explanation or introduction:
+{{"steps": ["First step", "Second step"]}}
 '''
 
 WORKFLOW_REFINER_PROMPT = '''You are a workflow editor. Based on the user's request, update the existing workflow by modifying, deleting, or adding steps.
@@ -43,7 +44,25 @@ Original Workflow:
 User modification request:
 {modification}
 
-Return only the updated step-by-step list of workflow steps.
+Return only a JSON object with the complete updated list of workflow steps, in order:
+{{"steps": ["First step", "Second step"]}}
+'''
+
+WORKFLOW_PATCH_PROMPT = '''You are a workflow editor. Based on the user's request, describe the changes to the existing workflow as edit operations. Do not repeat steps that stay the same.
+
+Original Workflow:
+{workflow}
+
+User modification request:
+{modification}
+
+Operations use the step numbers of the original workflow:
+- {{"op": "replace", "index": 3, "step": "New text for step 3"}}
+- {{"op": "delete", "index": 5, "step": null}}
+- {{"op": "insert", "index": 2, "step": "New step placed before original step 2"}} (use index {append_index} to append at the end)
+
+Return only a JSON object with the operations:
+{{"operations": [{{"op": "replace", "index": 1, "step": "Updated first step"}}]}}
 '''
 
 TOPIC_DECOMPOSER_PROMPT = '''You are an assistant that breaks down vague user intent into concrete subtopics and clarifying questions.
@@ -54,12 +73,8 @@ User request:
 First, generate 5 relevant subtopics.
 Then, for each subtopic, generate 3–5 clarifying questions.
 
-Return your response structured like this:
-- Subtopic 1: {{title}}
-  - Q1:
-  - Q2:
-  - ...
-- Subtopic 2: ...
+Return only a JSON object structured like this:
+{{"subtopics": [{{"title": "Subtopic title", "questions": ["First question?", "Second question?"]}}]}}
 '''
 
 EXPERTISE_TOM_PROMPT = '''You are an expertise estimator. Based on the conversation history, classify the user's software or technical expertise.
@@ -86,4 +101,32 @@ User's last message:
 {latest_message}
 
 Return only the sentiment category.
-''' 
\ No newline at end of file
+'''
+
+TURN_ANALYSIS_PROMPT = '''You analyze the latest turn of a conversation in a multi-agent AI assistant. Do three things at once:
+1. route: is the latest message about refining or clarifying requirements ("RequirementRefiner") or about modifying or improving a generated workflow ("WorkflowRefiner")?
+2. expertise: the user's software or technical expertise based on the whole conversation ("BEGINNER", "INTERMEDIATE" or "EXPERT").
+3. sentiment: the user's tone across the latest message and the whole conversation ("POSITIVE", "NEUTRAL", "NEGATIVE" or "MIXED").
+
+Conversation:
+{conversation}
+
+User's last message:
+{latest_message}
+
+Return only a JSON object of the form:
+{{"route": "RequirementRefiner", "expertise": "INTERMEDIATE", "sentiment": "NEUTRAL"}}
+'''
+
+CONVERSATION_SUMMARY_PROMPT = '''You maintain a running summary of a requirements conversation between a user and an AI assistant.
+
+Existing summary:
+{summary}
+
+New messages:
+{messages}
+
+Update the summary with the new messages. Keep every requirement, decision, constraint and open question, and note how the user describes themselves (expertise) and their tone. Drop greetings and repetition.
+
+Return only the updated summary, at most {max_words} words.
+'''
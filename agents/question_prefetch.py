@@ -0,0 +1,277 @@
+"""
+Question prefetching for Happy2Align
+Refines the next requirement question in the background while the user reads the current one;
+the ToM update for the latest answer runs in that same background job, never on the request path
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents.admission import PREFETCH, AdmissionController, admission as default_admission
+from agents.event_loop import event_loop
+from agents.config import QUESTION_PREFETCH_ENABLED, QUESTION_PREFETCH_WORKERS, MODEL_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+Position = Tuple[int, int]  # (subtopic index, question index)
+
+
+@dataclass
+class _Prefetch:
+    """A background refinement of one question"""
+    position: Position
+    # Resultaat: {"question", "expertise", "sentiment"} (de ToM waarvoor de vraag verfijnd is)
+    future: concurrent.futures.Future
+    # Gezet zodra de admission controller de achtergrondverfijning heeft toegelaten
+    admitted: threading.Event
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class QuestionPrefetcher:
+    """
+    Background refinement of question N+1
+
+    When answer N arrives, take() serves the question that was prefetched
+    during the previous turn. Only the local ToM estimator looks at answer N
+    first: when it is sure the answer moved expertise or sentiment away from
+    the labels the prefetch was refined for, the prefetch is dropped and the
+    question is refined again for the new labels. Otherwise the full ToM
+    estimate for answer N is made by the next background job, right before it
+    refines question N+2, and a served question always matches the labels
+    returned with it.
+    """
+
+    def __init__(self,
+                 orchestrator,
+                 enabled: bool = QUESTION_PREFETCH_ENABLED,
+                 max_workers: int = QUESTION_PREFETCH_WORKERS,
+                 max_questions_per_subtopic: int = 5,
+                 admission: Optional[AdmissionController] = None,
+                 max_idle: float = 86400):
+        """
+        Initialize the prefetcher
+
+        Args:
+            orchestrator: ImprovedOrchestrator used to refine questions and estimate ToM
+            enabled: Refine in the background (otherwise questions are refined on demand)
+            max_workers: Concurrent background jobs on the shared event loop
+            max_questions_per_subtopic: Questions asked per subtopic
+            admission: Admission controller for background refinements (prefetch priority)
+            max_idle: Seconds after which state of a session that was not seen again is dropped
+                (0 = only on forget(); session stores call forget() on expiry, but not every backend can)
+        """
+        self.orchestrator = orchestrator
+        self.enabled = enabled
+        self.max_questions_per_subtopic = max_questions_per_subtopic
+        self.admission = admission or default_admission
+        self.max_idle = max_idle
+        self._slots = asyncio.Semaphore(max_workers)
+        self._pending: Dict[str, _Prefetch] = {}
+        # Laatste antwoord per sessie (met geschiedenis en tijdstip) waarvoor de ToM nog bijgewerkt moet worden
+        self._tom_inputs: Dict[str, Tuple[List[Dict], str, float]] = {}
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+        self._stats = {"scheduled": 0, "hits": 0, "misses": 0, "errors": 0, "not_admitted": 0,
+                       "invalidated": 0, "idle_dropped": 0}
+
+    def next_position(self, subtopics: List[Dict[str, Any]], subtopic_index: int,
+                      question_index: int) -> Optional[Position]:
+        """
+        Position of the question after (subtopic_index, question_index)
+
+        Returns:
+            (subtopic index, question index) or None when all questions were asked
+        """
+        questions = subtopics[subtopic_index]["questions"][:self.max_questions_per_subtopic]
+        if question_index < len(questions) - 1:
+            return subtopic_index, question_index + 1
+        for index in range(subtopic_index + 1, len(subtopics)):
+            if subtopics[index]["questions"]:
+                return index, 0
+        return None
+
+    def _submit(self, coro_factory) -> concurrent.futures.Future:
+        """Run an orchestrator coroutine in the background on the shared event loop"""
+        async def limited():
+            async with self._slots:
+                return await coro_factory()
+        return event_loop.submit(limited())
+
+    async def _refine(self, subtopic: Dict[str, Any], question_index: int, history: List[Dict],
+                      expertise: str, sentiment: str,
+                      tom_input: Optional[Tuple[List[Dict], str]]) -> Dict[str, str]:
+        """Update the ToM for the latest answer (if any), then refine the question for it"""
+        if tom_input is not None:
+            try:
+                tom = await self.orchestrator.estimate_tom(*tom_input)
+                expertise, sentiment = tom["expertise"], tom["sentiment"]
+            except Exception as e:
+                logger.warning(f"ToM update failed, keeping previous estimate: {str(e)}")
+                self._count("errors")
+        question = await self.orchestrator.refine_question(
+            subtopic["title"], subtopic["questions"][question_index], history, expertise, sentiment
+        )
+        return {"question": question, "expertise": expertise, "sentiment": sentiment}
+
+    def _submit_prefetch(self, user_id: str, admitted: threading.Event, subtopic: Dict[str, Any],
+                         question_index: int, history: List[Dict], expertise: str, sentiment: str,
+                         tom_input: Optional[Tuple[List[Dict], str]]) -> concurrent.futures.Future:
+        """Background ToM update + refinement; waits for a prefetch slot so interactive turns go first"""
+        history = list(history)  # Snapshot: de sessie loopt door terwijl we verfijnen
+
+        async def refine():
+            async with self.admission.admit_async(user_id, PREFETCH):
+                admitted.set()
+                return await self._refine(subtopic, question_index, history, expertise, sentiment, tom_input)
+        return self._submit(refine)
+
+    def schedule(self, session_id: str, subtopics: List[Dict[str, Any]], position: Position,
+                 history: List[Dict], expertise: str, sentiment: str, user_id: Optional[str] = None) -> None:
+        """
+        Start refining the question after `position` in the background
+
+        Args:
+            session_id: Session the question belongs to
+            subtopics: Subtopics with their raw questions
+            position: Position of the question the user is reading now
+            history: Conversation so far
+            expertise: Current expertise estimate
+            sentiment: Current sentiment estimate
+            user_id: Fair-queuing key for admission control (defaults to the session)
+        """
+        with self._lock:
+            tom_input = self._tom_inputs.pop(session_id, None)
+        self._drop_idle()
+        if tom_input is not None:
+            tom_input = tom_input[:2]
+        if not self.enabled or not subtopics:
+            return
+        next_position = self.next_position(subtopics, *position)
+        self.cancel(session_id)
+        if next_position is None:
+            return
+
+        subtopic_index, question_index = next_position
+        admitted = threading.Event()
+        future = self._submit_prefetch(user_id or f"session:{session_id}", admitted, subtopics[subtopic_index],
+                                       question_index, history, expertise, sentiment, tom_input)
+        with self._lock:
+            self._pending[session_id] = _Prefetch(next_position, future, admitted)
+            self._stats["scheduled"] += 1
+
+    def take(self, session_id: str, subtopics: List[Dict[str, Any]], position: Position,
+             history: List[Dict], answer: str, expertise: str, sentiment: str) -> Dict[str, str]:
+        """
+        Return the refined question at `position` after the user answered
+
+        A prefetched question is served with the labels it was refined for, unless
+        the local ToM estimator is sure the latest answer changed one of them; the
+        answer is queued for the ToM update of the next background job. Without a
+        usable prefetch the ToM update and the refinement run on demand.
+
+        Args:
+            session_id: Session the question belongs to
+            subtopics: Subtopics with their raw questions
+            position: Position of the question to ask now
+            history: Conversation including the latest answer
+            answer: Latest answer of the user
+            expertise: Expertise estimate before the answer
+            sentiment: Sentiment estimate before the answer
+
+        Returns:
+            Dict with question, expertise and sentiment
+        """
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+
+        history = list(history)
+        subtopic_index, question_index = position
+        subtopic = subtopics[subtopic_index]
+
+        if entry is not None and entry.position == position and entry.admitted.is_set():
+            try:
+                refined = entry.future.result(timeout=MODEL_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Prefetched question failed: {str(e)}")
+                self._count("errors")
+                refined = None
+            if refined is not None and not self._tom_shifted(refined, history, answer):
+                self._count("hits")
+                if self.enabled:
+                    with self._lock:
+                        self._tom_inputs[session_id] = (history, answer, time.monotonic())
+                return refined
+            if refined is not None:
+                # Verwoord voor de oude ToM: opnieuw verfijnen voor het nieuwe antwoord
+                self._count("invalidated")
+        elif entry is not None and entry.position == position:
+            # Nog niet toegelaten of afgewezen (druk): deze beurt heeft al een slot, dus zelf verfijnen
+            entry.future.cancel()
+            self._count("not_admitted")
+        else:
+            if entry is not None:
+                entry.future.cancel()
+            self._count("misses")
+
+        try:
+            return self._submit(
+                lambda: self._refine(subtopic, question_index, history, expertise, sentiment, (history, answer))
+            ).result()
+        except Exception as e:
+            logger.error(f"Question refinement failed, using raw question: {str(e)}")
+            self._count("errors")
+            return {"question": subtopic["questions"][question_index], "expertise": expertise, "sentiment": sentiment}
+
+    def _tom_shifted(self, refined: Dict[str, str], history: List[Dict], answer: str) -> bool:
+        """True when the local estimator is sure the answer moved expertise or sentiment off the prefetch's labels"""
+        try:
+            local = event_loop.submit(self.orchestrator.local_tom_estimate(history, answer)).result(timeout=MODEL_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"ToM shift check failed, serving the prefetch: {str(e)}")
+            return False
+        return any(label is not None and label != refined[name] for name, label in local.items())
+
+    def _drop_idle(self) -> None:
+        """Forget sessions not seen for max_idle seconds (at most once a minute)"""
+        now = time.monotonic()
+        with self._lock:
+            if not self.max_idle or now - self._last_purge < 60:
+                return
+            self._last_purge = now
+            cutoff = now - self.max_idle
+            idle = [session_id for session_id, entry in self._pending.items() if entry.created_at < cutoff]
+            idle += [session_id for session_id, tom_input in self._tom_inputs.items() if tom_input[2] < cutoff]
+        for session_id in set(idle):
+            self.forget(session_id)
+            self._count("idle_dropped")
+
+    def cancel(self, session_id: str) -> None:
+        """Drop the pending prefetch of a session (e.g. on reset)"""
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry is not None:
+            entry.future.cancel()
+
+    def forget(self, session_id: str) -> None:
+        """Drop everything kept for a session"""
+        self.cancel(session_id)
+        with self._lock:
+            self._tom_inputs.pop(session_id, None)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return prefetch counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        served = stats["hits"] + stats["misses"] + stats["not_admitted"] + stats["invalidated"]
+        stats["hit_rate"] = stats["hits"] / served if served else 0.0
+        return stats
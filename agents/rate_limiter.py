@@ -0,0 +1,326 @@
+"""
+Client-side rate limiter for Happy2Align
+Per-model token buckets for requests (RPM) and estimated tokens (TPM), shared across worker processes
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitWaitExceeded(TimeoutError):
+    """Raised when a caller would have to wait longer than the configured maximum"""
+
+
+@dataclass
+class BucketState:
+    """Fill level of the request and token buckets of one model"""
+    requests: float
+    tokens: float
+    updated_at: float
+    blocked_until: float = 0.0
+
+
+def _take(state: BucketState, rpm: int, tpm: int, tokens: int, now: float) -> float:
+    """
+    Refill the buckets and try to take one request and `tokens` tokens
+
+    Returns:
+        0 when the capacity was taken, otherwise the seconds to wait before retrying
+    """
+    elapsed = max(0.0, now - state.updated_at)
+    state.requests = min(float(rpm), state.requests + elapsed * rpm / 60.0)
+    state.tokens = min(float(tpm), state.tokens + elapsed * tpm / 60.0)
+    state.updated_at = now
+
+    if state.blocked_until > now:
+        return state.blocked_until - now
+
+    tokens = min(tokens, tpm)  # Een request groter dan de bucket zou nooit passen
+    if state.requests >= 1 and state.tokens >= tokens:
+        state.requests -= 1
+        state.tokens -= tokens
+        return 0.0
+
+    request_wait = (1 - state.requests) * 60.0 / rpm if state.requests < 1 else 0.0
+    token_wait = (tokens - state.tokens) * 60.0 / tpm if state.tokens < tokens else 0.0
+    return max(request_wait, token_wait, 0.001)
+
+
+class MemoryBackend:
+    """Bucket storage for a single process"""
+
+    blocking = False  # Alleen geheugen: mag direct op de event loop
+
+    def __init__(self):
+        self._states: Dict[str, BucketState] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, model: str, rpm: int, tpm: int, tokens: int) -> float:
+        now = time.time()
+        with self._lock:
+            state = self._states.get(model)
+            if state is None:
+                state = self._states[model] = BucketState(float(rpm), float(tpm), now)
+            return _take(state, rpm, tpm, tokens, now)
+
+    def block(self, model: str, until: float) -> None:
+        with self._lock:
+            state = self._states.get(model)
+            if state is None:
+                state = self._states[model] = BucketState(0.0, 0.0, time.time())
+            state.blocked_until = max(state.blocked_until, until)
+
+
+class SQLiteBackend:
+    """Bucket storage shared by all worker processes on this host"""
+
+    # BEGIN IMMEDIATE kan tot de busy-timeout wachten op andere workers: niet op de event loop
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "model TEXT PRIMARY KEY, "
+            "requests REAL NOT NULL, "
+            "tokens REAL NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "blocked_until REAL NOT NULL DEFAULT 0)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (autocommit, explicit transactions)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, conn: sqlite3.Connection, model: str, rpm: int, tpm: int, now: float) -> BucketState:
+        row = conn.execute(
+            "SELECT requests, tokens, updated_at, blocked_until FROM buckets WHERE model = ?", (model,)
+        ).fetchone()
+        if row is None:
+            return BucketState(float(rpm), float(tpm), now)
+        return BucketState(*row)
+
+    def _save(self, conn: sqlite3.Connection, model: str, state: BucketState) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (model, requests, tokens, updated_at, blocked_until) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (model, state.requests, state.tokens, state.updated_at, state.blocked_until)
+        )
+
+    def try_acquire(self, model: str, rpm: int, tpm: int, tokens: int) -> float:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            state = self._load(conn, model, rpm, tpm, now)
+            wait = _take(state, rpm, tpm, tokens, now)
+            self._save(conn, model, state)
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def block(self, model: str, until: float) -> None:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            state = self._load(conn, model, 0, 0, now)
+            state.blocked_until = max(state.blocked_until, until)
+            self._save(conn, model, state)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class RateLimiter:
+    """Per-model RPM/TPM limiter with FIFO queuing of waiting callers"""
+
+    def __init__(self,
+                 backend,
+                 limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 default_rpm: int = 500,
+                 default_tpm: int = 200000,
+                 max_wait: float = 30.0):
+        """
+        Initialize the limiter
+
+        Args:
+            backend: MemoryBackend or SQLiteBackend holding the bucket state
+            limits: (rpm, tpm) per model name
+            default_rpm: Requests per minute for models without explicit limits
+            default_tpm: Tokens per minute for models without explicit limits
+            max_wait: Maximum seconds a caller waits for capacity
+        """
+        self.backend = backend
+        self.limits = limits or {}
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_wait = max_wait
+
+        # FIFO wachtrij per model; alleen de kop van de wachtrij vraagt capaciteit aan
+        self._queues: Dict[str, Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "throttled": 0, "wait_seconds": 0.0, "rejected": 0, "rate_limited": 0}
+
+    def limits_for(self, model: str) -> Tuple[int, int]:
+        """Return (rpm, tpm) for a model"""
+        return self.limits.get(model, (self.default_rpm, self.default_tpm))
+
+    @staticmethod
+    def estimate_tokens(text: str, completion_tokens: int = 0) -> int:
+        """Rough token estimate (~4 characters per token) plus the expected completion"""
+        return len(text) // 4 + 1 + completion_tokens
+
+    async def acquire(self, model: str, tokens: int) -> float:
+        """
+        Wait (in FIFO order) until one request and `tokens` tokens are available
+
+        Args:
+            model: Model the request is sent to
+            tokens: Estimated tokens of the request
+
+        Returns:
+            Seconds spent waiting
+        """
+        loop = asyncio.get_running_loop()
+        ticket = loop.create_future()
+        entry = (loop, ticket)
+        start = time.monotonic()
+
+        with self._lock:
+            queue = self._queues.setdefault(model, deque())
+            queue.append(entry)
+            if len(queue) == 1:
+                ticket.set_result(None)
+
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                raise RateLimitWaitExceeded(f"Rate limit queue for {model} is full, try again later")
+            rpm, tpm = self.limits_for(model)
+            throttled = False
+            while True:
+                wait = await self._try_acquire(model, rpm, tpm, tokens)
+                if wait <= 0:
+                    break
+                throttled = True
+                remaining = self.max_wait - (time.monotonic() - start)
+                if wait > remaining:
+                    raise RateLimitWaitExceeded(f"Rate limit for {model} would require waiting {wait:.1f}s")
+                await asyncio.sleep(wait)
+        except RateLimitWaitExceeded:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise
+        finally:
+            self._leave(model, entry)
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["wait_seconds"] += waited
+            if throttled:
+                self._stats["throttled"] += 1
+        return waited
+
+    async def _try_acquire(self, model: str, rpm: int, tpm: int, tokens: int) -> float:
+        """backend.try_acquire, in a worker thread when the backend does blocking I/O"""
+        if not getattr(self.backend, "blocking", False):
+            return self.backend.try_acquire(model, rpm, tpm, tokens)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.backend.try_acquire, model, rpm, tpm, tokens)
+
+    def acquire_blocking(self, model: str, tokens: int) -> float:
+        """Blocking variant of acquire for synchronous callers (no FIFO ordering)"""
+        start = time.monotonic()
+        rpm, tpm = self.limits_for(model)
+        while True:
+            wait = self.backend.try_acquire(model, rpm, tpm, tokens)
+            if wait <= 0:
+                break
+            if wait > self.max_wait - (time.monotonic() - start):
+                with self._lock:
+                    self._stats["rejected"] += 1
+                raise RateLimitWaitExceeded(f"Rate limit for {model} would require waiting {wait:.1f}s")
+            time.sleep(wait)
+        waited = time.monotonic() - start
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["wait_seconds"] += waited
+        return waited
+
+    def _leave(self, model: str, entry) -> None:
+        """Remove a caller from the queue and wake up the next one"""
+        with self._lock:
+            queue = self._queues[model]
+            was_head = bool(queue) and queue[0] is entry
+            try:
+                queue.remove(entry)
+            except ValueError:
+                pass
+            if was_head and queue:
+                next_loop, next_ticket = queue[0]
+                next_loop.call_soon_threadsafe(self._wake, next_ticket)
+
+    @staticmethod
+    def _wake(ticket: asyncio.Future) -> None:
+        if not ticket.done():
+            ticket.set_result(None)
+
+    def penalize(self, model: str, retry_after: float) -> None:
+        """Block a model for all workers after a 429 response"""
+        with self._lock:
+            self._stats["rate_limited"] += 1
+        self.backend.block(model, time.time() + retry_after)
+
+    async def penalize_async(self, model: str, retry_after: float) -> None:
+        """penalize() for coroutines: a blocking backend is written from a worker thread"""
+        if not getattr(self.backend, "blocking", False):
+            self.penalize(model, retry_after)
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.penalize, model, retry_after)
+
+    @staticmethod
+    def retry_after_from_error(error: Exception, default: float = 1.0) -> float:
+        """Read Retry-After (or retry-after-ms) from an OpenAI 429 error"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except (TypeError, ValueError):
+            pass
+        return default
+
+    def stats(self) -> Dict[str, Any]:
+        """Return limiter counters and queue lengths"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = {model: len(queue) for model, queue in self._queues.items() if queue}
+        return stats
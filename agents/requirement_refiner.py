@@ -5,6 +5,8 @@ Requirement Refiner agent using centralized LLM client
 from typing import List, Dict, Optional, Any
 from .base_agent import BaseAgent
 from agents.config import REQUIREMENT_REFINER_SYSTEM_PROMPT
+from agents.conversation_memory import conversation_memory
+from agents.session_context import SessionContext
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,23 +19,23 @@ class RequirementRefiner(BaseAgent):
         super().__init__(model_name)
         self.system_prompt = REQUIREMENT_REFINER_SYSTEM_PROMPT
 
-    async def process(self, user_input: str, context: Dict[str, Any] = None) -> str:
+    async def process(self, user_input: str, context: Optional[SessionContext] = None) -> str:
         """Refine requirements based on user input"""
-        if not context:
-            context = {
-                "subtopic": "initial_requirements",
-                "question": "Wat zijn je belangrijkste requirements?",
-                "round": 1,
-                "requirements": [],
-                "questions": [],
-                "answers": []
-            }
+        session = context or SessionContext()
+        context = session.data
+        # Alleen ontbrekende sleutels invullen: de AgentManager zet zijn eigen state al in dezelfde data
+        for key, default in (("subtopic", "initial_requirements"),
+                             ("question", "Wat zijn je belangrijkste requirements?"),
+                             ("round", 1)):
+            context.setdefault(key, default)
+        for key in ("requirements", "questions", "answers"):
+            context.setdefault(key, [])
 
         # Add user message to history and context
-        self.add_to_history("user", user_input)
+        session.add_message("user", user_input)
         context.setdefault("answers", []).append(user_input)
 
-        if context["round"] >= 5:
+        if context.get("round", 1) >= 5:
             return "Maximum aantal vragen bereikt voor dit subtopic. Ga door naar het volgende subtopic."
 
         # Add current question to context if present
@@ -42,22 +44,24 @@ class RequirementRefiner(BaseAgent):
 
         # Build context strings
         requirements_str = "\n".join(f"- {req}" for req in context.get("requirements", []))
-        questions_str = "\n".join(f"Q: {q}" for q in context.get("questions", []))
-        answers_str = "\n".join(f"A: {a}" for a in context.get("answers", []))
-        history_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history])
+        # Oudere vragen en antwoorden zitten al in de samenvatting van de geschiedenis
+        recent = conversation_memory.keep_messages
+        questions_str = "\n".join(f"Q: {q}" for q in (context.get("questions", [])[-recent:] if recent else []))
+        answers_str = "\n".join(f"A: {a}" for a in (context.get("answers", [])[-recent:] if recent else []))
+        history_str = conversation_memory.render(session.history)
 
         # Build complete system message
         system_message = (
             f"{self.system_prompt}\n\n"
             f"Huidige requirements:\n{requirements_str}\n\n"
-            f"Volledige gespreksgeschiedenis:\n{history_str}\n\n"
-            f"Alle vragen tot nu toe:\n{questions_str}\n\n"
-            f"Alle antwoorden tot nu toe:\n{answers_str}"
+            f"Gespreksgeschiedenis:\n{history_str}\n\n"
+            f"Recente vragen:\n{questions_str}\n\n"
+            f"Recente antwoorden:\n{answers_str}"
         )
         
         messages = self._format_messages(system_message, user_input)
 
-        logger.info(f"[RequirementRefiner] Processing with round {context['round']}")
+        logger.info(f"[RequirementRefiner] Processing with round {context.get('round', 1)}")
 
         try:
             # Use centralized LLM client with automatic fallback
@@ -76,6 +80,6 @@ class RequirementRefiner(BaseAgent):
             response_text = "Ik heb je bericht ontvangen, maar kon geen antwoord genereren. Kun je het anders formuleren?"
 
         # Add response to history
-        self.add_to_history("assistant", response_text)
+        session.add_message("assistant", response_text)
 
         return response_text
\ No newline at end of file
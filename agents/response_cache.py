@@ -0,0 +1,228 @@
+"""
+Response cache for Happy2Align
+Content-addressed cache for LLM answers with an in-memory LRU tier and an on-disk SQLite tier
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, temperature: Optional[float], messages: List[Dict[str, str]], **params) -> str:
+    """
+    Build a content-addressed key for an LLM request
+
+    Args:
+        model: Model name the request is sent to
+        temperature: Sampling temperature
+        messages: Messages in OpenAI dict format
+        **params: Extra request parameters that influence the answer
+
+    Returns:
+        Hex sha256 digest of the canonical request
+    """
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "messages": messages,
+        "params": params,
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) exact-match cache for LLM responses"""
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 ttl: float = 3600,
+                 max_memory_entries: int = 1000,
+                 max_disk_entries: int = 50000,
+                 evict_interval: int = 100):
+        """
+        Initialize the cache
+
+        Args:
+            path: SQLite file for the disk tier (None disables the disk tier)
+            ttl: Time-to-live of an entry in seconds
+            max_memory_entries: Maximum number of entries in the memory tier
+            max_disk_entries: Maximum number of entries in the disk tier (may overshoot by evict_interval)
+            evict_interval: Trim the disk tier once per this many writes instead of on every write
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.evict_interval = max(1, evict_interval)
+        self._writes = 0
+
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+        if self.path:
+            self._init_disk()
+
+    def _init_disk(self):
+        """Create the SQLite table if needed"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        """Connection to the disk tier for one transaction (one per call, safe across threads and processes)"""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            Cached response text or None on a miss
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, response = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        response, created_at = row
+                        if now - created_at <= self.ttl:
+                            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                            self._remember(key, created_at, response)
+                            with self._lock:
+                                self._stats["disk_hits"] += 1
+                            return response
+                        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        with self._lock:
+                            self._stats["expired"] += 1
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache disk lookup failed: {str(e)}")
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key: str, response: str) -> None:
+        """
+        Store a response in both tiers
+
+        Args:
+            key: Cache key from make_cache_key
+            response: Response text to cache
+        """
+        now = time.time()
+        self._remember(key, now, response)
+
+        with self._lock:
+            self._stats["stores"] += 1
+            self._writes += 1
+            evict = self._writes % self.evict_interval == 0
+
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, response, now, now)
+                    )
+                    if evict:
+                        self._evict_disk(conn, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache disk store failed: {str(e)}")
+
+    def _remember(self, key: str, created_at: float, response: str) -> None:
+        """Put an entry in the memory tier and evict the least recently used entries"""
+        with self._lock:
+            self._memory[key] = (created_at, response)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _evict_disk(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired entries and trim the disk tier to its maximum size"""
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+            with self._lock:
+                self._stats["evictions"] += overflow
+
+    def clear(self) -> None:
+        """Remove all entries from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM responses")
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache clear failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
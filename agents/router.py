@@ -2,10 +2,12 @@
 Router Agent for Happy 2 Align with timeout and fallback support
 """
 
-from typing import Literal, Dict, Any
+from typing import Literal, Optional
 from langchain.prompts import ChatPromptTemplate
 from .config import DEFAULT_MODEL
 from .base_agent import BaseAgent
+from .session_context import SessionContext
+from .router_classifier import local_router
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,14 +24,20 @@ Only return one word: RequirementRefiner or WorkflowRefiner."""),
             ("human", "{user_input}")
         ])
 
-    async def process(self, user_input: str, context: Dict[str, Any] = None) -> str:
+    async def process(self, user_input: str, context: Optional[SessionContext] = None) -> str:
         """Route the user query to the appropriate agent with timeout handling."""
         try:
+            # Lokale classifier eerst: geen LLM call als hij zeker genoeg is
+            prediction = await local_router.predict(user_input)
+            agent_type = local_router.decide(user_input, prediction)
+            if agent_type is not None:
+                return agent_type
+            
             # Format messages
             messages = self.prompt.format_messages(user_input=user_input)
             
-            # Call LLM with timeout and fallback
-            response = await self._call_llm_with_timeout(messages, use_fallback=True)
+            # Call LLM (timeout and fallback are handled by the centralized client)
+            response = await self.call_llm(messages, use_fallback=True)
             
             # Validate response
             agent_type = response.strip()
@@ -37,12 +45,13 @@ Only return one word: RequirementRefiner or WorkflowRefiner."""),
                 logger.warning(f"Invalid router response: {agent_type}, defaulting to RequirementRefiner")
                 return "RequirementRefiner"
             
+            local_router.record(user_input, agent_type, "llm", prediction=prediction)
             return agent_type
             
         except TimeoutError:
             # Bij timeout, kijk naar context om te beslissen
             logger.error("Router timeout, using context-based decision")
-            if context and context.get('current_workflow'):
+            if context and context.current_workflow:
                 return "WorkflowRefiner"
             return "RequirementRefiner"
             
@@ -50,14 +59,16 @@ Only return one word: RequirementRefiner or WorkflowRefiner."""),
             logger.error(f"Router error: {str(e)}, defaulting to RequirementRefiner")
             return "RequirementRefiner"
 
-    async def route_query(self, user_input: str) -> Literal["RequirementRefiner", "WorkflowRefiner"]:
+    async def route_query(self, user_input: str,
+                          context: Optional[SessionContext] = None) -> Literal["RequirementRefiner", "WorkflowRefiner"]:
         """Legacy method for backward compatibility."""
-        return await self.process(user_input)
+        return await self.process(user_input, context)
 
 # Create a singleton instance
 _router = RouterAgent()
 
 # Export the route_query function
-async def route_query(user_input: str) -> Literal["RequirementRefiner", "WorkflowRefiner"]:
+async def route_query(user_input: str,
+                      context: Optional[SessionContext] = None) -> Literal["RequirementRefiner", "WorkflowRefiner"]:
     """Route a user query to the appropriate agent."""
-    return await _router.route_query(user_input)
\ No newline at end of file
+    return await _router.route_query(user_input, context)
\ No newline at end of file
@@ -3,7 +3,8 @@ Router agent die berichten analyseert en doorstuurt naar de juiste agent
 """
 
 from .base_agent import BaseAgent
-from typing import Dict, Any, Literal
+from .session_context import SessionContext
+from typing import Literal, Optional
 from agents.config import ROUTER_SYSTEM_PROMPT, DEFAULT_MODEL
 
 class RouterAgent(BaseAgent):
@@ -16,11 +17,10 @@ class RouterAgent(BaseAgent):
         super().__init__(model_name)
         self.system_prompt = ROUTER_SYSTEM_PROMPT
     
-    async def process(self, user_input: str, context: Dict[str, Any] = None) -> str:
+    async def process(self, user_input: str, context: Optional[SessionContext] = None) -> str:
         """Analyseer het bericht en bepaal naar welke agent het moet"""
         messages = self._format_messages(self.system_prompt, user_input)
-        response = await self.llm.agenerate([messages])
-        agent_type = response.generations[0][0].text.strip()
+        agent_type = await self.call_llm(messages)
         
         # Valideer het agent type
         if agent_type not in self.VALID_AGENT_TYPES:
@@ -0,0 +1,366 @@
+"""
+Local router classifier for Happy2Align
+TF-IDF + logistic regression that answers RequirementRefiner / WorkflowRefiner without an LLM call
+
+Training CLI:
+    python -m agents.router_classifier train [--log instance/router_decisions.jsonl] [--dataset ...]
+    python -m agents.router_classifier list
+    python -m agents.router_classifier predict "Kun je stap 3 weghalen?"
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from agents.config import (
+    ROUTER_CLASSIFIER_ENABLED, ROUTER_MODEL_DIR, ROUTER_MODEL_VERSION,
+    ROUTER_CONFIDENCE_THRESHOLD, ROUTER_DECISION_LOG, ROUTER_LOG_TEXT
+)
+from agents.model_artifacts import (
+    DecisionLog, artifact_versions, calibration_table, format_calibration, load_artifact, next_version,
+    save_artifact
+)
+from agents.turn_analysis import ROUTES
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_NAME = "router"
+
+
+class RouterClassifier:
+    """A trained, versioned router model"""
+
+    def __init__(self, pipeline, version: int, metadata: Dict[str, Any]):
+        """
+        Initialize the classifier
+
+        Args:
+            pipeline: Fitted scikit-learn pipeline (text -> route)
+            version: Artifact version
+            metadata: Training metadata (examples, metrics, library versions)
+        """
+        self.pipeline = pipeline
+        self.version = version
+        self.metadata = metadata
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """
+        Classify one message
+
+        Returns:
+            (route, probability of that route)
+        """
+        probabilities = self.pipeline.predict_proba([text])[0]
+        best = probabilities.argmax()
+        return self.pipeline.classes_[best], float(probabilities[best])
+
+    @staticmethod
+    def versions(directory: str) -> List[int]:
+        """All artifact versions in a directory, oldest first"""
+        return artifact_versions(directory, ARTIFACT_NAME)
+
+    @classmethod
+    def load(cls, directory: str, version: str = "latest") -> Optional["RouterClassifier"]:
+        """
+        Load an artifact (only load artifacts you trained yourself: joblib unpickles)
+
+        Args:
+            directory: Artifact directory
+            version: Version number or "latest"
+
+        Returns:
+            The classifier or None when no artifact exists
+        """
+        artifact = load_artifact(directory, ARTIFACT_NAME, version)
+        if artifact is None:
+            return None
+        return cls(artifact["pipeline"], artifact["version"], artifact["metadata"])
+
+    def save(self, directory: str) -> str:
+        """Write the artifact and return its path"""
+        return save_artifact(directory, ARTIFACT_NAME, self.version, {
+            "metadata": self.metadata,
+            "pipeline": self.pipeline,
+        })
+
+
+def train(examples: List[Tuple[str, str]], version: int, folds: int = 5) -> RouterClassifier:
+    """
+    Fit a TF-IDF + logistic regression router
+
+    Args:
+        examples: (text, route) pairs
+        version: Version of the new artifact
+        folds: Cross-validation folds used to report accuracy and local coverage per threshold (0 = skip)
+
+    Returns:
+        The trained classifier (fitted on all examples)
+    """
+    import sklearn
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import StratifiedKFold, cross_val_predict
+    from sklearn.pipeline import make_pipeline
+
+    texts = [text for text, _ in examples]
+    labels = [label for _, label in examples]
+    if len(set(labels)) < 2:
+        raise ValueError("Training data needs examples of both routes")
+
+    def make():
+        # Karakter n-grammen werken voor Nederlands en Engels door elkaar en zijn robuust voor typefouten.
+        # C=10: met de standaard regularisatie blijven de kansen bij weinig data rond 0.6 hangen
+        return make_pipeline(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), sublinear_tf=True, min_df=1),
+            LogisticRegression(C=10.0, max_iter=1000, class_weight="balanced")
+        )
+
+    metrics: Dict[str, Any] = {}
+    counts = {label: labels.count(label) for label in set(labels)}
+    if folds and min(counts.values()) >= folds:
+        # Elk bericht wordt één keer voorspeld door een model dat het niet gezien heeft
+        splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+        probabilities = cross_val_predict(make(), texts, labels, cv=splitter, method="predict_proba")
+        classes = np.array(sorted(set(labels)))
+        confidence = probabilities.max(axis=1)
+        correct = classes[probabilities.argmax(axis=1)] == np.array(labels)
+        at_threshold = calibration_table(confidence, correct)
+        confident = confidence >= ROUTER_CONFIDENCE_THRESHOLD
+        metrics = {
+            "folds": folds,
+            "accuracy": float(correct.mean()),
+            "threshold": ROUTER_CONFIDENCE_THRESHOLD,
+            "coverage_at_threshold": float(confident.mean()),
+            "accuracy_at_threshold": float(correct[confident].mean()) if confident.any() else None,
+            "calibration": at_threshold,
+        }
+
+    pipeline = make().fit(texts, labels)
+    metadata = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "examples": len(examples),
+        "label_counts": counts,
+        "metrics": metrics,
+        "sklearn_version": sklearn.__version__,
+    }
+    return RouterClassifier(pipeline, version, metadata)
+
+
+class LocalRouter:
+    """Classifier in front of the LLM router, plus the decision log used for retraining"""
+
+    def __init__(self,
+                 classifier: Optional[RouterClassifier],
+                 threshold: float = 0.7,
+                 log_path: Optional[str] = None,
+                 log_text: bool = False):
+        """
+        Initialize the router
+
+        Args:
+            classifier: Trained classifier (None = always defer to the LLM)
+            threshold: Minimum probability to answer without the LLM
+            log_path: JSONL file receiving every routing decision (None disables)
+            log_text: Log the message itself (needed for retraining); otherwise only its hash and length
+        """
+        self.classifier = classifier
+        self.threshold = threshold
+        self.log = DecisionLog(log_path, log_text=log_text)
+        self._lock = threading.Lock()
+        self._stats = {"local": 0, "deferred": 0, "llm_decisions": 0, "disagreements": 0, "local_seconds": 0.0}
+
+    async def predict(self, text: str) -> Optional[Tuple[str, float]]:
+        """
+        Run the classifier in a worker thread (a prediction costs milliseconds of CPU)
+
+        Returns:
+            (route, probability), or None when there is no classifier
+        """
+        if self.classifier is None:
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._timed_predict, text)
+
+    def _timed_predict(self, text: str) -> Tuple[str, float]:
+        start = time.perf_counter()
+        prediction = self.classifier.predict(text)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["local_seconds"] += elapsed
+        return prediction
+
+    def decide(self, text: str, prediction: Optional[Tuple[str, float]]) -> Optional[str]:
+        """
+        Accept a prediction when it clears the threshold
+
+        Returns:
+            The route, or None when the LLM should decide (pass the prediction on to record())
+        """
+        if prediction is None:
+            return None
+        route, confidence = prediction
+        confident = confidence >= self.threshold
+        with self._lock:
+            self._stats["local" if confident else "deferred"] += 1
+        if not confident:
+            return None
+        self.record(text, route, "classifier", prediction=prediction)
+        return route
+
+    async def classify(self, text: str) -> Optional[str]:
+        """
+        Answer locally when the classifier is confident
+
+        Returns:
+            The route, or None when the LLM should decide
+        """
+        return self.decide(text, await self.predict(text))
+
+    def record(self, text: str, route: str, source: str,
+               prediction: Optional[Tuple[str, float]] = None) -> None:
+        """
+        Append a routing decision to the decision log
+
+        Args:
+            text: Routed message
+            route: Decision
+            source: "llm" or "classifier" (only LLM decisions are used for training)
+            prediction: The classifier's (route, probability) for this text, if it was asked
+        """
+        if source == "llm":
+            with self._lock:
+                self._stats["llm_decisions"] += 1
+                if prediction is not None and prediction[0] != route:
+                    self._stats["disagreements"] += 1
+        self.log.append(
+            text=text,
+            route=route,
+            source=source,
+            confidence=prediction[1] if prediction is not None else None,
+            model_version=self.classifier.version if self.classifier is not None else None,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return how often the classifier answered locally"""
+        with self._lock:
+            stats = dict(self._stats)
+        local_calls = stats["local"] + stats["deferred"]
+        stats["local_rate"] = stats["local"] / local_calls if local_calls else 0.0
+        stats["mean_local_us"] = stats.pop("local_seconds") / local_calls * 1e6 if local_calls else None
+        stats["model_version"] = self.classifier.version if self.classifier is not None else None
+        return stats
+
+
+def _create_local_router() -> LocalRouter:
+    classifier = None
+    if ROUTER_CLASSIFIER_ENABLED:
+        try:
+            classifier = RouterClassifier.load(ROUTER_MODEL_DIR, ROUTER_MODEL_VERSION)
+            if classifier is None:
+                logger.info("No router classifier artifact found, routing with the LLM")
+            else:
+                logger.info(f"Loaded router classifier v{classifier.version}")
+        except Exception as e:
+            logger.warning(f"Could not load router classifier: {str(e)}")
+    return LocalRouter(classifier, threshold=ROUTER_CONFIDENCE_THRESHOLD, log_path=ROUTER_DECISION_LOG or None,
+                       log_text=ROUTER_LOG_TEXT)
+
+
+# Singleton instance
+local_router = _create_local_router()
+
+
+def load_decision_log(path: str) -> List[Tuple[str, str]]:
+    """LLM routing decisions from the decision log (entries logged without their text are skipped)"""
+    return [(entry["text"], entry["route"]) for entry in DecisionLog.read(path)
+            if entry.get("route") in ROUTES and entry.get("text")]
+
+
+EVALUATION_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "evaluation", "data")
+
+
+def load_evaluation_examples(dataset_path: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Labelled messages from the evaluation data (router examples, labelled turns, synthetic dataset)"""
+    examples = []
+    with open(os.path.join(EVALUATION_DATA_DIR, "router_examples.jsonl"), encoding="utf-8") as f:
+        examples += [(entry["text"], entry["route"]) for entry in map(json.loads, f)]
+    with open(os.path.join(EVALUATION_DATA_DIR, "labelled_turns.json"), encoding="utf-8") as f:
+        examples += [(case["message"], case["route"]) for case in json.load(f)]
+    # De synthetische dataset bevat alleen openingsvragen, dus allemaal RequirementRefiner
+    if dataset_path and os.path.exists(dataset_path):
+        with open(dataset_path, encoding="utf-8") as f:
+            examples.extend((sample["query"], "RequirementRefiner") for sample in json.load(f))
+    return examples
+
+
+def _dedupe(examples: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Keep the most recent label per text"""
+    latest = {}
+    for text, label in examples:
+        latest[text.strip()] = label
+    return [(text, label) for text, label in latest.items() if text]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Train and inspect the local router classifier")
+    parser.add_argument("--model-dir", default=ROUTER_MODEL_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_cmd = commands.add_parser("train", help="Train a new artifact version")
+    train_cmd.add_argument("--log", default=ROUTER_DECISION_LOG, help="Router decision log (JSONL)")
+    train_cmd.add_argument("--dataset", help="Synthetic evaluation dataset (JSON)")
+    train_cmd.add_argument("--examples", action="append", default=[],
+                           help="Extra JSONL file with {\"text\": ..., \"route\": ...} lines")
+    train_cmd.add_argument("--folds", type=int, default=5, help="Cross-validation folds for the calibration table")
+
+    commands.add_parser("list", help="List artifact versions")
+
+    predict_cmd = commands.add_parser("predict", help="Classify a message with the latest artifact")
+    predict_cmd.add_argument("text")
+    predict_cmd.add_argument("--version", default="latest")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        examples = load_evaluation_examples(args.dataset)
+        if args.log:
+            examples += load_decision_log(args.log)
+        for path in args.examples:
+            with open(path, encoding="utf-8") as f:
+                examples += [(entry["text"], entry["route"]) for entry in map(json.loads, f) if entry.get("route") in ROUTES]
+        examples = _dedupe(examples)
+
+        classifier = train(examples, version=next_version(args.model_dir, ARTIFACT_NAME), folds=args.folds)
+        path = classifier.save(args.model_dir)
+        print(f"Saved {path}")
+        print(json.dumps(classifier.metadata, indent=2))
+        calibration = classifier.metadata["metrics"].get("calibration")
+        if calibration:
+            print(f"\n{format_calibration(calibration)}")
+
+    elif args.command == "list":
+        for version in RouterClassifier.versions(args.model_dir):
+            classifier = RouterClassifier.load(args.model_dir, str(version))
+            metrics = classifier.metadata.get("metrics", {})
+            print(f"v{version}  trained_at={classifier.metadata['trained_at']}  "
+                  f"examples={classifier.metadata['examples']}  accuracy={metrics.get('accuracy')}")
+
+    elif args.command == "predict":
+        classifier = RouterClassifier.load(args.model_dir, args.version)
+        if classifier is None:
+            parser.error(f"No router artifact in {args.model_dir}")
+        start = time.perf_counter()
+        route, confidence = classifier.predict(args.text)
+        print(f"{route} ({confidence:.2f}) in {(time.perf_counter() - start) * 1e6:.0f}us")
+
+
+if __name__ == "__main__":
+    main()
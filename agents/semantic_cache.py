@@ -0,0 +1,215 @@
+"""
+Semantic cache for Happy2Align
+Returns cached LLM answers for near-duplicate prompts using embedding similarity
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from agents.llm_client import llm_client
+from agents.config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_CAPACITY, SEMANTIC_CACHE_THRESHOLDS,
+    SEMANTIC_CACHE_DEFAULT_THRESHOLD, SEMANTIC_CACHE_EMBEDDING_MODEL, SEMANTIC_CACHE_KINDS
+)
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[str], Awaitable[List[float]]]
+
+
+class _KindIndex:
+    """Bounded cosine-similarity index for one prompt kind with LRU eviction"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.vectors: Optional[np.ndarray] = None  # (capacity, dim), rijen zijn genormaliseerd
+        self.answers: List[Optional[str]] = [None] * capacity
+        self.texts: List[Optional[str]] = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.used = np.zeros(capacity, dtype=bool)
+
+    def search(self, vector: np.ndarray) -> Optional[tuple]:
+        """Return (slot, similarity) of the most similar entry"""
+        if self.vectors is None or not self.used.any():
+            return None
+        scores = self.vectors @ vector
+        scores[~self.used] = -np.inf
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def insert(self, vector: np.ndarray, text: str, answer: str, tick: int) -> None:
+        """Insert an entry, evicting the least recently used slot when full"""
+        if self.vectors is None:
+            self.vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+        free = np.flatnonzero(~self.used)
+        if free.size:
+            slot = int(free[0])
+        else:
+            slot = int(np.argmin(self.last_used))
+        self.vectors[slot] = vector
+        self.answers[slot] = answer
+        self.texts[slot] = text
+        self.last_used[slot] = tick
+        self.used[slot] = True
+
+
+class SemanticCache:
+    """Embedding-similarity cache with a per-kind threshold"""
+
+    def __init__(self,
+                 embed_fn: EmbedFn,
+                 thresholds: Optional[Dict[str, float]] = None,
+                 default_threshold: float = 0.95,
+                 capacity: int = 512,
+                 embedding_memo_size: int = 256,
+                 kinds: Optional[Set[str]] = None):
+        """
+        Initialize the cache
+
+        Args:
+            embed_fn: Async function that returns the embedding of a text
+            thresholds: Minimum cosine similarity per prompt kind
+            default_threshold: Threshold for kinds without an explicit value
+            capacity: Maximum number of entries per kind
+            embedding_memo_size: Number of recent text embeddings kept for reuse
+            kinds: Prompt kinds the cache serves; other kinds are never embedded or matched
+                (None = all kinds)
+        """
+        self.embed_fn = embed_fn
+        self.thresholds = thresholds or {}
+        self.default_threshold = default_threshold
+        self.capacity = capacity
+        self.embedding_memo_size = embedding_memo_size
+        self.kinds = kinds
+
+        self._indexes: Dict[str, _KindIndex] = {}
+        self._memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._tick = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    async def _embed(self, text: str) -> np.ndarray:
+        """Embed and normalize a text, reusing recent embeddings (route and decompose share input)"""
+        with self._lock:
+            vector = self._memo.get(text)
+            if vector is not None:
+                self._memo.move_to_end(text)
+                return vector
+
+        raw = np.asarray(await self.embed_fn(text), dtype=np.float32)
+        norm = np.linalg.norm(raw)
+        vector = raw / norm if norm > 0 else raw
+
+        with self._lock:
+            self._memo[text] = vector
+            while len(self._memo) > self.embedding_memo_size:
+                self._memo.popitem(last=False)
+        return vector
+
+    def enabled_for(self, kind: str) -> bool:
+        """Return whether the cache serves a prompt kind"""
+        return self.kinds is None or kind in self.kinds
+
+    def threshold_for(self, kind: str) -> float:
+        """Return the similarity threshold for a prompt kind"""
+        return self.thresholds.get(kind, self.default_threshold)
+
+    async def lookup(self, kind: str, text: str) -> Optional[str]:
+        """
+        Find a cached answer for a semantically similar prompt
+
+        Args:
+            kind: Prompt kind (e.g. "route", "decompose")
+            text: User-facing part of the prompt
+
+        Returns:
+            Cached answer or None when nothing is similar enough (or the kind is disabled)
+        """
+        if not self.enabled_for(kind):
+            return None
+        try:
+            vector = await self._embed(text)
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {str(e)}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return None
+
+        with self._lock:
+            index = self._indexes.get(kind)
+            match = index.search(vector) if index is not None else None
+            if match is not None and match[1] >= self.threshold_for(kind):
+                slot, similarity = match
+                self._tick += 1
+                index.last_used[slot] = self._tick
+                self._stats["hits"] += 1
+                logger.info(f"Semantic cache hit for {kind} (similarity {similarity:.3f})")
+                return index.answers[slot]
+            self._stats["misses"] += 1
+        return None
+
+    async def store(self, kind: str, text: str, answer: str) -> None:
+        """
+        Store an answer for a prompt
+
+        Args:
+            kind: Prompt kind
+            text: User-facing part of the prompt
+            answer: Answer to cache
+        """
+        if not self.enabled_for(kind):
+            return
+        try:
+            vector = await self._embed(text)
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {str(e)}")
+            with self._lock:
+                self._stats["errors"] += 1
+            return
+
+        with self._lock:
+            index = self._indexes.get(kind)
+            if index is None:
+                index = self._indexes[kind] = _KindIndex(self.capacity)
+            self._tick += 1
+            index.insert(vector, text, answer, self._tick)
+            self._stats["stores"] += 1
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._indexes.clear()
+            self._memo.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and index sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = {kind: int(index.used.sum()) for kind, index in self._indexes.items()}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def _create_semantic_cache() -> Optional[SemanticCache]:
+    """Build the process-wide semantic cache from configuration"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+
+    async def embed(text: str) -> List[float]:
+        return await llm_client.create_embedding(text, model=SEMANTIC_CACHE_EMBEDDING_MODEL)
+
+    return SemanticCache(
+        embed,
+        thresholds=SEMANTIC_CACHE_THRESHOLDS,
+        default_threshold=SEMANTIC_CACHE_DEFAULT_THRESHOLD,
+        capacity=SEMANTIC_CACHE_CAPACITY,
+        kinds=SEMANTIC_CACHE_KINDS
+    )
+
+# Singleton instance
+semantic_cache = _create_semantic_cache()
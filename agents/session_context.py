@@ -0,0 +1,56 @@
+"""
+Session context for Happy2Align
+Per-session conversation state that is passed through every agent call, so agents stay stateless
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class SessionContext:
+    """
+    State of one conversation
+
+    Agents and the orchestrator never keep conversation state on themselves;
+    everything a turn reads or writes lives here, so one agent instance can
+    serve many overlapping sessions.
+    """
+    session_id: str = "default"
+    history: List[Dict[str, str]] = field(default_factory=list)
+    current_workflow: Optional[List[str]] = None
+    # Agent-specifieke state (subtopic, vraag, ronde, verzamelde requirements, ...)
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    def add_message(self, role: str, content: str) -> None:
+        """Append a message to the conversation history"""
+        self.history.append({"role": role, "content": content})
+
+    @classmethod
+    def from_dict(cls, context: Optional[Dict[str, Any]], session_id: str = "default") -> "SessionContext":
+        """
+        Build a context from a plain dict (e.g. the context of an API request)
+
+        Args:
+            context: Dict with optional "history" and "current_workflow"; other keys become agent data
+            session_id: Session the context belongs to
+
+        Returns:
+            A new SessionContext (the dict's history list is shared, not copied)
+        """
+        context = dict(context or {})
+        return cls(
+            session_id=context.pop("session_id", session_id),
+            history=context.pop("history", None) or [],
+            current_workflow=context.pop("current_workflow", None),
+            data=context,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict representation (inverse of from_dict)"""
+        return {
+            **self.data,
+            "session_id": self.session_id,
+            "history": self.history,
+            "current_workflow": self.current_workflow,
+        }
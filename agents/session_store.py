@@ -0,0 +1,864 @@
+"""
+Session state store for Happy2Align
+Conversation state per session behind one interface, with an in-memory LRU, a SQLite (WAL) and a
+Redis-protocol backend; TTL eviction, optimistic versioning and compact serialization
+"""
+
+import atexit
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from agents.latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Payloads vanaf deze grootte worden gecomprimeerd
+COMPRESS_MIN_BYTES = 512
+_RAW, _ZLIB = b"j", b"z"
+
+
+class VersionConflict(Exception):
+    """Raised when a session was written by someone else since it was read"""
+
+    def __init__(self, session_id: str, expected: Optional[int], actual: Optional[int]):
+        super().__init__(f"Session {session_id!r} is at version {actual}, expected {expected}")
+        self.session_id = session_id
+        self.expected = expected
+        self.actual = actual
+
+
+@dataclass
+class StoredState:
+    """A session state with the version it was read at"""
+    value: Dict[str, Any]
+    version: int
+
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """Compact JSON, zlib-compressed when that pays off; the first byte tells which"""
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return _ZLIB + packed
+    return _RAW + raw
+
+
+def decode_state(data: bytes) -> Dict[str, Any]:
+    """Inverse of encode_state"""
+    data = bytes(data)
+    if data[:1] == _ZLIB:
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data[1:])
+
+
+class SessionStateStore:
+    """
+    Interface of the session state backends
+
+    Versions come from one counter per store, so they increase on every write
+    and a session never gets a version back that it had before, not even
+    after delete() or expiry (a client holding an old version cannot
+    overwrite a recreated session). put() with an expected_version only
+    succeeds when the stored version still matches (0 = the session must not
+    exist yet); without one it always overwrites.
+    Every backend returns a decoded copy, so callers can mutate the state
+    freely until they put() it back. on_expire is called with the id of every
+    session this process sees expire or evict, so per-session caches elsewhere
+    can be dropped with it (sessions that expire inside Redis are not reported).
+    """
+
+    backend = "base"
+    on_expire: Optional[Callable[[str], None]] = None
+
+    def _expired(self, session_id: str) -> None:
+        """Report an expired or evicted session to on_expire"""
+        if self.on_expire is not None:
+            try:
+                self.on_expire(session_id)
+            except Exception as e:
+                logger.warning(f"on_expire failed for session {session_id!r}: {e}")
+
+    def get(self, session_id: str) -> Optional[StoredState]:
+        """Return the state and its version, or None when absent or expired"""
+        raise NotImplementedError
+
+    def put(self, session_id: str, state: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        """
+        Store a state
+
+        Args:
+            session_id: Session to write
+            state: JSON-serializable state
+            expected_version: Version the caller read (None = unconditional write)
+
+        Returns:
+            The new version
+
+        Raises:
+            VersionConflict: When expected_version no longer matches
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        """Remove a session; True when it existed"""
+        raise NotImplementedError
+
+    def update(self, session_id: str, mutate: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]],
+               retries: int = 5) -> Tuple[Dict[str, Any], int]:
+        """
+        Read-modify-write with optimistic retries
+
+        Args:
+            session_id: Session to update
+            mutate: Receives the current state (None when absent) and returns the new state
+            retries: Attempts before the last VersionConflict is raised
+
+        Returns:
+            (new state, new version)
+        """
+        for attempt in range(retries):
+            stored = self.get(session_id)
+            state = mutate(stored.value if stored else None)
+            try:
+                return state, self.put(session_id, state, expected_version=stored.version if stored else 0)
+            except VersionConflict:
+                if attempt == retries - 1:
+                    raise
+        raise ValueError("retries must be at least 1")
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend counters"""
+        return {"backend": self.backend, **self._stats}
+
+
+class MemorySessionStore(SessionStateStore):
+    """LRU with TTL for a single process (states are kept encoded, so reads return copies)"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400):
+        """
+        Initialize the store
+
+        Args:
+            max_entries: Sessions kept before the least recently used is evicted
+            ttl: Seconds after the last write before a session expires (0 = never)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[int, float, bytes]]" = OrderedDict()
+        self._last_version = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "conflicts": 0, "evictions": 0, "expired": 0}
+
+    def _live(self, session_id: str, now: float) -> Optional[Tuple[int, float, bytes]]:
+        entry = self._entries.get(session_id)
+        if entry is not None and entry[1] and entry[1] <= now:
+            del self._entries[session_id]
+            self._stats["expired"] += 1
+            self._expired(session_id)
+            return None
+        return entry
+
+    def get(self, session_id: str) -> Optional[StoredState]:
+        with self._lock:
+            entry = self._live(session_id, time.time())
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self._stats["hits"] += 1
+        return StoredState(decode_state(entry[2]), entry[0])
+
+    def put(self, session_id: str, state: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        data = encode_state(state)
+        now = time.time()
+        with self._lock:
+            entry = self._live(session_id, now)
+            current = entry[0] if entry else 0
+            if expected_version is not None and expected_version != current:
+                self._stats["conflicts"] += 1
+                raise VersionConflict(session_id, expected_version, current)
+            self._last_version += 1
+            version = self._last_version
+            self._entries[session_id] = (version, now + self.ttl if self.ttl else 0.0, data)
+            self._entries.move_to_end(session_id)
+            self._stats["writes"] += 1
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+                self._expired(evicted)
+        return version
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._entries.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**super().stats(), "sessions": len(self._entries)}
+
+
+class SQLiteSessionStore(SessionStateStore):
+    """Sessions in a SQLite file (WAL), shared by all worker processes on this host"""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, ttl: float = 86400, purge_interval: int = 500):
+        """
+        Initialize the store
+
+        Args:
+            path: SQLite database file
+            ttl: Seconds after the last write before a session expires (0 = never)
+            purge_interval: Writes between two sweeps of expired rows
+        """
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "conflicts": 0, "expired": 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_states ("
+            "session_id TEXT PRIMARY KEY, "
+            "version INTEGER NOT NULL, "
+            "data BLOB NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_session_states_expires ON session_states(expires_at)")
+        # Versieteller voor de hele store: verwijderde en verlopen rijen nemen hun versie niet mee
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_version_seq ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), "
+            "value INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO session_version_seq (id, value) "
+            "SELECT 1, COALESCE(MAX(version), 0) FROM session_states"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (autocommit, explicit transactions)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, session_id: str) -> Optional[StoredState]:
+        row = self._connection().execute(
+            "SELECT version, data FROM session_states WHERE session_id = ? AND (expires_at = 0 OR expires_at > ?)",
+            (session_id, time.time())
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return StoredState(decode_state(row[1]), row[0])
+
+    def put(self, session_id: str, state: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        data = encode_state(state)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT version, expires_at FROM session_states WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            # Een verlopen rij telt als afwezig
+            live = row is not None and (row[1] == 0 or row[1] > now)
+            current = row[0] if live else 0
+            if expected_version is not None and expected_version != current:
+                conn.execute("ROLLBACK")
+                self._count("conflicts")
+                raise VersionConflict(session_id, expected_version, current)
+            conn.execute("UPDATE session_version_seq SET value = value + 1 WHERE id = 1")
+            version = conn.execute("SELECT value FROM session_version_seq WHERE id = 1").fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO session_states (session_id, version, data, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, version, sqlite3.Binary(data), now + self.ttl if self.ttl else 0)
+            )
+            conn.execute("COMMIT")
+        except VersionConflict:
+            raise
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._stats["writes"] += 1
+            purge = self.purge_interval and self._stats["writes"] % self.purge_interval == 0
+        if purge:
+            self.purge_expired()
+        return version
+
+    def delete(self, session_id: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM session_states WHERE session_id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+    def purge_expired(self) -> int:
+        """Delete expired rows; returns the number removed"""
+        conn = self._connection()
+        now = time.time()
+        expired = [row[0] for row in conn.execute(
+            "SELECT session_id FROM session_states WHERE expires_at != 0 AND expires_at <= ?", (now,)
+        )]
+        if not expired:
+            return 0
+        cursor = conn.execute("DELETE FROM session_states WHERE expires_at != 0 AND expires_at <= ?", (now,))
+        if cursor.rowcount:
+            self._count("expired", cursor.rowcount)
+        for session_id in expired:
+            self._expired(session_id)
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        sessions = self._connection().execute("SELECT COUNT(*) FROM session_states").fetchone()[0]
+        with self._lock:
+            return {**super().stats(), "sessions": sessions, "path": self.path}
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RespClient:
+    """
+    Minimal RESP2 client (no redis-py dependency)
+
+    One connection per thread, because WATCH/MULTI/EXEC state belongs to a
+    connection. Works against Redis, Valkey and the stand-in in utils/resp_server.py.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout: float = 5.0):
+        """
+        Initialize the client (connections are opened lazily)
+
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            timeout: Socket timeout in seconds
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        if self.password:
+            self._roundtrip(("AUTH", self.password))
+        if self.db:
+            self._roundtrip(("SELECT", self.db))
+
+    def close(self) -> None:
+        """Close this thread's connection"""
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            self._local.reader.close()
+            sock.close()
+            self._local.sock = None
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read(self) -> Any:
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RespError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+    def _roundtrip(self, args) -> Any:
+        self._local.sock.sendall(self._encode(args))
+        return self._read()
+
+    def execute(self, *args) -> Any:
+        """Send one command and return its reply (reconnects once on a broken connection)"""
+        if getattr(self._local, "sock", None) is None:
+            self._connect()
+        try:
+            return self._roundtrip(args)
+        except (ConnectionError, OSError):
+            # Alleen buiten een transactie opnieuw proberen; WATCH-state is weg met de verbinding
+            if getattr(self._local, "in_transaction", False):
+                self.close()
+                raise
+            self.close()
+            self._connect()
+            return self._roundtrip(args)
+
+    def transaction(self, key: str, build: Callable[[Optional[bytes]], Optional[List[tuple]]]) -> Optional[List[Any]]:
+        """
+        Optimistic transaction on one key (WATCH / GET / MULTI / EXEC)
+
+        Args:
+            key: Key to watch
+            build: Receives the current value and returns the commands to queue (None = abort)
+
+        Returns:
+            The EXEC replies, or None when the key changed in between (or build aborted)
+        """
+        self.execute("WATCH", key)
+        self._local.in_transaction = True
+        try:
+            commands = build(self.execute("GET", key))
+            if commands is None:
+                self.execute("UNWATCH")
+                return None
+            self.execute("MULTI")
+            for command in commands:
+                self.execute(*command)
+            return self.execute("EXEC")
+        except Exception:
+            # Verbinding sluiten ruimt WATCH/MULTI-state op de server op
+            self.close()
+            raise
+        finally:
+            self._local.in_transaction = False
+
+
+class RedisSessionStore(SessionStateStore):
+    """Sessions in Redis (or anything speaking its protocol), shared by workers on all hosts"""
+
+    backend = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl: float = 86400,
+                 prefix: str = "happy2align:session:", client: Optional[RespClient] = None):
+        """
+        Initialize the store
+
+        Args:
+            url: Server URL (redis://[:password@]host[:port][/db])
+            ttl: Seconds after the last write before a session expires (0 = never); enforced by the server
+            prefix: Key prefix for session keys
+            client: Existing RespClient (overrides url)
+        """
+        self.client = client or RespClient(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        # Versieteller zonder TTL, buiten de sessiesleutels (valt niet samen met prefix + een sessie-id)
+        self.version_key = prefix.rstrip(":") + "-version"
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "conflicts": 0}
+
+    def _key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    @staticmethod
+    def _split(value: Optional[bytes]) -> Tuple[int, Optional[bytes]]:
+        """Stored value = 8-byte version + encoded state"""
+        if value is None:
+            return 0, None
+        return int.from_bytes(value[:8], "big"), value[8:]
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, session_id: str) -> Optional[StoredState]:
+        version, data = self._split(self.client.execute("GET", self._key(session_id)))
+        if data is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return StoredState(decode_state(data), version)
+
+    def put(self, session_id: str, state: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        data = encode_state(state)
+        key = self._key(session_id)
+        outcome = {}
+
+        def build(value):
+            current, _ = self._split(value)
+            if expected_version is not None and expected_version != current:
+                outcome["conflict"] = current
+                return None
+            # Na DEL of verlopen begint de sessie niet opnieuw bij 1: versies komen van een gedeelde teller
+            outcome["version"] = self.client.execute("INCR", self.version_key)
+            command = ("SET", key, outcome["version"].to_bytes(8, "big") + data)
+            return [command + ("PX", int(self.ttl * 1000)) if self.ttl else command]
+
+        while True:
+            replies = self.client.transaction(key, build)
+            if "conflict" in outcome:
+                self._count("conflicts")
+                raise VersionConflict(session_id, expected_version, outcome["conflict"])
+            if replies is not None:
+                self._count("writes")
+                return outcome["version"]
+            # Sleutel veranderde tussen GET en EXEC
+            if expected_version is not None:
+                self._count("conflicts")
+                raise VersionConflict(session_id, expected_version, None)
+
+    def delete(self, session_id: str) -> bool:
+        return bool(self.client.execute("DEL", self._key(session_id)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**super().stats(), "server": f"{self.client.host}:{self.client.port}/{self.client.db}"}
+
+
+# Bucket-grenzen voor rehydratie uit de koude laag (seconden, 50us tot 1s)
+REHYDRATE_BUCKETS = [0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 1.0]
+
+
+class TieredSessionStore(SessionStateStore):
+    """
+    Hot sessions in memory, idle sessions spilled compressed to a local SQLite file
+
+    A session moves to disk when it has been idle for idle_seconds (or when
+    the hot tier is full) and back into memory on its next read or write,
+    with its version intact; while hot, the memory copy is authoritative. Resident memory therefore scales
+    with the number of active sessions rather than every session since boot.
+    A session expires ttl seconds after its last write, in either tier. A
+    background thread sweeps every sweep_interval seconds, so idle sessions
+    leave memory even when no traffic arrives.
+    The hot tier belongs to one process: use it with a single worker or
+    sticky routing, and the sqlite/redis backends when workers share sessions.
+    """
+
+    backend = "tiered"
+
+    def __init__(self, path: str, idle_seconds: float = 900, max_hot: int = 1000,
+                 cold_ttl: float = 30 * 86400, sweep_interval: float = 30, ttl: float = 86400):
+        """
+        Initialize the store
+
+        Args:
+            path: SQLite file of the cold tier
+            idle_seconds: Idle time after which a hot session is spilled to disk
+            max_hot: Hot sessions kept before the least recently used is spilled early
+            cold_ttl: Seconds a spilled session is kept on disk (0 = forever)
+            sweep_interval: Seconds between two background sweeps (0 = only explicit sweep() calls)
+            ttl: Session time-to-live in seconds after its last write (0 = never expire)
+        """
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self.max_hot = max_hot
+        self.cold_ttl = cold_ttl
+        self.sweep_interval = sweep_interval
+        self.ttl = ttl
+        # sessie -> (versie, laatst gebruikt, geëncodeerde state, verloopt op; 0 = nooit)
+        self._hot: "OrderedDict[str, Tuple[int, float, bytes, float]]" = OrderedDict()
+        self._hot_bytes = 0
+        self._lock = threading.RLock()
+        self.rehydrate_latency = LatencyHistogram(REHYDRATE_BUCKETS)
+        self._stats = {"hot_hits": 0, "rehydrations": 0, "misses": 0, "writes": 0, "conflicts": 0,
+                       "spills": 0, "spilled_bytes": 0, "expired": 0, "cold_expired": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Eén verbinding achter de lock: de koude laag hoort bij dit proces
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cold_sessions ("
+            "session_id TEXT PRIMARY KEY, "
+            "version INTEGER NOT NULL, "
+            "data BLOB NOT NULL, "
+            "spilled_at REAL NOT NULL, "
+            "expires_at REAL NOT NULL, "
+            "session_expires_at REAL NOT NULL DEFAULT 0)"
+        )
+        # Bestanden van voor de sessie-TTL missen die kolom nog
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cold_sessions)")}
+        if "session_expires_at" not in columns:
+            self._conn.execute("ALTER TABLE cold_sessions ADD COLUMN session_expires_at REAL NOT NULL DEFAULT 0")
+        # Hoogste uitgegeven versie, bewaard zodra een sessie met zijn versie van schijf verdwijnt
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cold_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        saved = self._conn.execute("SELECT value FROM cold_meta WHERE key = 'last_version'").fetchone()
+        spilled = self._conn.execute("SELECT COALESCE(MAX(version), 0) FROM cold_sessions").fetchone()
+        self._last_version = max(saved[0] if saved else 0, spilled[0])
+
+        self._closed = threading.Event()
+        if sweep_interval:
+            threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True).start()
+
+    def _sweep_loop(self) -> None:
+        """Sweep on a timer instead of on traffic, so a quiet worker still frees its idle sessions"""
+        while not self._closed.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"Session sweep of {self.path} failed: {e}")
+
+    def close(self) -> None:
+        """Stop the background sweeper (the store itself stays usable)"""
+        self._closed.set()
+
+    def _save_last_version(self) -> None:
+        """Persist the version counter before versions disappear from disk (delete, expiry)"""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cold_meta (key, value) VALUES ('last_version', ?)", (self._last_version,)
+        )
+
+    def _read_cold(self, session_id: str, now: float) -> Optional[Tuple[int, bytes, float]]:
+        """
+        Read a spilled session as (version, data, session expiry)
+
+        The disk record stays until the next spill overwrites it, so a crashing
+        worker loses at most the turns since rehydration, not the conversation.
+        """
+        row = self._conn.execute(
+            "SELECT version, data, expires_at, session_expires_at FROM cold_sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if (row[2] and row[2] <= now) or (row[3] and row[3] <= now):
+            self._save_last_version()
+            self._conn.execute("DELETE FROM cold_sessions WHERE session_id = ?", (session_id,))
+            self._stats["cold_expired"] += 1
+            self._expired(session_id)
+            return None
+        return row[0], bytes(row[1]), row[3]
+
+    def _set_hot(self, session_id: str, version: int, now: float, data: bytes, expires_at: float) -> None:
+        previous = self._hot.pop(session_id, None)
+        if previous is not None:
+            self._hot_bytes -= len(previous[2])
+        self._hot[session_id] = (version, now, data, expires_at)
+        self._hot_bytes += len(data)
+
+    def _spill(self, session_id: str, now: float) -> None:
+        version, _, data, expires_at = self._hot.pop(session_id)
+        self._hot_bytes -= len(data)
+        if data[:1] != _ZLIB:
+            data = _ZLIB + zlib.compress(data[1:], 6)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cold_sessions "
+            "(session_id, version, data, spilled_at, expires_at, session_expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, version, sqlite3.Binary(data), now, now + self.cold_ttl if self.cold_ttl else 0,
+             expires_at)
+        )
+        self._stats["spills"] += 1
+        self._stats["spilled_bytes"] += len(data)
+
+    def _expire(self, session_id: str) -> None:
+        """Drop an expired session from both tiers (the disk copy outlives rehydration)"""
+        entry = self._hot.pop(session_id, None)
+        if entry is not None:
+            self._hot_bytes -= len(entry[2])
+        self._save_last_version()
+        self._conn.execute("DELETE FROM cold_sessions WHERE session_id = ?", (session_id,))
+        self._stats["expired"] += 1
+        self._expired(session_id)
+
+    def _hot_entry(self, session_id: str, now: float) -> Optional[Tuple[int, float, bytes, float]]:
+        """The hot entry, rehydrated from disk when needed (caller holds the lock)"""
+        entry = self._hot.get(session_id)
+        if entry is not None:
+            if entry[3] and entry[3] <= now:
+                self._expire(session_id)
+                self._stats["misses"] += 1
+                return None
+            self._stats["hot_hits"] += 1
+            return entry
+        start = time.perf_counter()
+        cold = self._read_cold(session_id, now)
+        if cold is None:
+            self._stats["misses"] += 1
+            return None
+        self._set_hot(session_id, cold[0], now, cold[1], cold[2])
+        self.rehydrate_latency.observe(time.perf_counter() - start)
+        self._stats["rehydrations"] += 1
+        return self._hot[session_id]
+
+    def get(self, session_id: str) -> Optional[StoredState]:
+        with self._lock:
+            now = time.time()
+            entry = self._hot_entry(session_id, now)
+            if entry is None:
+                return None
+            self._set_hot(session_id, entry[0], now, entry[2], entry[3])
+        return StoredState(decode_state(entry[2]), entry[0])
+
+    def put(self, session_id: str, state: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        data = encode_state(state)
+        with self._lock:
+            now = time.time()
+            entry = self._hot_entry(session_id, now)
+            current = entry[0] if entry else 0
+            if expected_version is not None and expected_version != current:
+                self._stats["conflicts"] += 1
+                raise VersionConflict(session_id, expected_version, current)
+            self._last_version += 1
+            version = self._last_version
+            self._set_hot(session_id, version, now, data, now + self.ttl if self.ttl else 0)
+            self._stats["writes"] += 1
+            while len(self._hot) > self.max_hot:
+                self._spill(next(iter(self._hot)), now)
+        return version
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            entry = self._hot.pop(session_id, None)
+            if entry is not None:
+                self._hot_bytes -= len(entry[2])
+            self._save_last_version()
+            cursor = self._conn.execute("DELETE FROM cold_sessions WHERE session_id = ?", (session_id,))
+            return entry is not None or cursor.rowcount > 0
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Drop expired sessions, spill every session idle for longer than idle_seconds and drop expired disk records
+
+        Returns:
+            Number of sessions spilled
+        """
+        with self._lock:
+            now = time.time() if now is None else now
+            for session_id in [session_id for session_id, entry in self._hot.items() if entry[3] and entry[3] <= now]:
+                self._expire(session_id)
+            # De hot laag staat op volgorde van laatste gebruik: oudste vooraan
+            idle = []
+            for session_id, (_, last_used, _, _) in self._hot.items():
+                if now - last_used < self.idle_seconds:
+                    break
+                idle.append(session_id)
+            if idle:
+                self._conn.execute("BEGIN")
+                for session_id in idle:
+                    self._spill(session_id, now)
+                self._conn.execute("COMMIT")
+            self._save_last_version()
+            expired_where = "(expires_at != 0 AND expires_at <= ?) OR (session_expires_at != 0 AND session_expires_at <= ?)"
+            cold_expired = [row[0] for row in self._conn.execute(
+                f"SELECT session_id FROM cold_sessions WHERE {expired_where}", (now, now)
+            )]
+            cursor = self._conn.execute(f"DELETE FROM cold_sessions WHERE {expired_where}", (now, now))
+            self._stats["cold_expired"] += max(cursor.rowcount, 0)
+            for session_id in cold_expired:
+                self._expired(session_id)
+        if idle:
+            logger.info(f"Spilled {len(idle)} idle sessions to {self.path}")
+        return len(idle)
+
+    def spill_all(self) -> int:
+        """Move every hot session to disk (at shutdown, so no conversation is lost on restart)"""
+        with self._lock:
+            count = len(self._hot)
+            if count:
+                now = time.time()
+                self._conn.execute("BEGIN")
+                for session_id in list(self._hot):
+                    self._spill(session_id, now)
+                self._conn.execute("COMMIT")
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cold_sessions, cold_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM cold_sessions"
+            ).fetchone()
+            stats = {
+                **super().stats(),
+                "hot_sessions": len(self._hot),
+                "hot_bytes": self._hot_bytes,
+                "cold_sessions": cold_sessions,
+                "cold_bytes": cold_bytes,
+                "idle_seconds": self.idle_seconds,
+                "ttl": self.ttl,
+            }
+        stats["rehydrate_latency"] = self.rehydrate_latency.snapshot()
+        stats["rss_mb"] = _rss_mb()
+        return stats
+
+
+def _rss_mb() -> Optional[float]:
+    """Current resident memory of this process (peak value where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return round(int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux rapporteert in KiB, macOS in bytes
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def create_session_store(backend: str, path: str = "instance/sessions.db", redis_url: str = "redis://localhost:6379/0",
+                         ttl: float = 86400, max_entries: int = 10000, cold_path: str = "instance/sessions_cold.db",
+                         idle_seconds: float = 900, cold_ttl: float = 30 * 86400) -> SessionStateStore:
+    """
+    Build the configured backend
+
+    Args:
+        backend: "memory", "sqlite", "redis" or "tiered"
+        path: SQLite file (sqlite backend)
+        redis_url: Server URL (redis backend)
+        ttl: Session time-to-live in seconds (0 = never expire)
+        max_entries: LRU capacity (memory backend) or hot sessions per worker (tiered backend)
+        cold_path: SQLite file of the cold tier (tiered backend)
+        idle_seconds: Idle time before a session is spilled to disk (tiered backend)
+        cold_ttl: Seconds a spilled session is kept on disk, 0 = forever (tiered backend)
+    """
+    if backend == "memory":
+        return MemorySessionStore(max_entries=max_entries, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, ttl=ttl)
+    if backend == "redis":
+        return RedisSessionStore(redis_url, ttl=ttl)
+    if backend == "tiered":
+        store = TieredSessionStore(cold_path, idle_seconds=idle_seconds, max_hot=max_entries, cold_ttl=cold_ttl,
+                                   ttl=ttl)
+        atexit.register(store.spill_all)
+        atexit.register(store.close)
+        return store
+    raise ValueError(f"Unknown session store backend: {backend!r}")
@@ -0,0 +1,93 @@
+"""
+Single-flight request coalescing for Happy2Align
+Concurrent callers with the same key share one in-flight call
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesce identical concurrent async calls into a single shared task"""
+
+    def __init__(self):
+        """Initialize the coalescer"""
+        # Tasks zijn aan hun event loop gebonden, daarom sleutelen we ook op de loop
+        self._inflight: Dict[Tuple[int, Hashable], asyncio.Task] = {}
+        # Aantal callers dat nog op een gedeelde task wacht
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executed": 0, "merged": 0, "abandoned": 0}
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run factory() once for all concurrent callers with the same key
+
+        Cancelling one caller does not cancel the shared call for the others;
+        the shared call is cancelled once every caller waiting on it is cancelled.
+
+        Args:
+            key: Identity of the call
+            factory: Function returning the awaitable to run when no call is in flight
+
+        Returns:
+            Result of the shared call
+        """
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+
+        with self._lock:
+            self._stats["calls"] += 1
+            task = self._inflight.get(slot)
+            if task is None or task.done() or task.get_loop() is not loop:
+                task = loop.create_task(factory())
+                self._inflight[slot] = task
+                task.add_done_callback(lambda t, slot=slot: self._forget(slot, t))
+                self._stats["executed"] += 1
+            else:
+                self._stats["merged"] += 1
+                logger.debug(f"Coalesced call onto in-flight request {key!r}")
+            self._waiters[task] = self._waiters.get(task, 0) + 1
+
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._release(slot, task)
+
+    def _release(self, slot: Tuple[int, Hashable], task: asyncio.Task) -> None:
+        """Drop one waiter, cancelling the shared task when nobody waits for it anymore"""
+        with self._lock:
+            remaining = self._waiters[task] - 1
+            if remaining:
+                self._waiters[task] = remaining
+                return
+            del self._waiters[task]
+            if task.done():
+                return
+            # Nieuwe callers starten een eigen call in plaats van aan te haken bij een geannuleerde
+            if self._inflight.get(slot) is task:
+                del self._inflight[slot]
+            self._stats["abandoned"] += 1
+        logger.debug(f"All callers of in-flight request {slot[1]!r} were cancelled, cancelling it")
+        task.cancel()
+
+    def _forget(self, slot: Tuple[int, Hashable], task: asyncio.Task) -> None:
+        """Drop a finished task from the in-flight table"""
+        with self._lock:
+            if self._inflight.get(slot) is task:
+                del self._inflight[slot]
+        # Markeer de exceptie als opgehaald als alle wachtenden al geannuleerd zijn
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return coalescing counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._inflight)
+        stats["merge_rate"] = stats["merged"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
@@ -0,0 +1,250 @@
+"""
+Step executor for Happy2Align
+Runs orchestration steps as a small DAG: every step starts as soon as its inputs are ready
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from agents.latency import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+SKIPPED = "skipped"
+DISCARDED = "discarded"
+FAILED = "failed"
+
+
+@dataclass
+class Step:
+    """
+    One node of the orchestration DAG
+
+    func receives the results of the finished steps (by name). A step with a
+    condition only runs when condition(results) is true once all steps in
+    condition_on are done; a speculative step already starts before that and
+    is discarded when the condition turns out false.
+    """
+    name: str
+    func: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: Tuple[str, ...] = ()
+    condition: Optional[Callable[[Dict[str, Any]], bool]] = None
+    condition_on: Tuple[str, ...] = ()
+    speculative: bool = False
+
+
+@dataclass
+class StepTiming:
+    """Timing of one step relative to the start of the run"""
+    status: str = PENDING
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    speculative: bool = False
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+@dataclass
+class StepRun:
+    """Results and timings of one executor run"""
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, StepTiming] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def status(self, name: str) -> str:
+        return self.timings[name].status
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-step status and timings, e.g. for logging"""
+        return {
+            "elapsed": round(self.elapsed, 3),
+            "steps": {
+                name: {
+                    "status": timing.status,
+                    "started": round(timing.started, 3) if timing.started is not None else None,
+                    "duration": round(timing.duration, 3) if timing.duration is not None else None,
+                    "speculative": timing.speculative,
+                }
+                for name, timing in self.timings.items()
+            },
+        }
+
+
+class StepExecutor:
+    """Dependency-aware executor with optional speculative execution"""
+
+    def __init__(self, speculation: bool = True):
+        """
+        Initialize the executor
+
+        Args:
+            speculation: Start speculative steps before their condition is known
+        """
+        self.speculation = speculation
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "speculative_started": 0, "speculative_used": 0,
+                       "speculative_discarded": 0, "failed": 0}
+
+    @staticmethod
+    def _validate(steps: Sequence[Step]) -> None:
+        """Reject unknown dependencies and cycles"""
+        names = {step.name for step in steps}
+        if len(names) != len(steps):
+            raise ValueError("Step names must be unique")
+        for step in steps:
+            unknown = set(step.depends_on + step.condition_on) - names
+            if unknown:
+                raise ValueError(f"Step {step.name} depends on unknown steps: {sorted(unknown)}")
+
+        remaining = {step.name: set(step.depends_on + step.condition_on) for step in steps}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps & remaining.keys()]
+            if not ready:
+                raise ValueError(f"Cycle between steps: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+
+    async def run(self, steps: Sequence[Step]) -> StepRun:
+        """
+        Run all steps, each as soon as its dependencies are done
+
+        Args:
+            steps: Steps of the DAG
+
+        Returns:
+            StepRun with the results of the steps that ran
+
+        Raises:
+            The exception of the first needed step that failed
+        """
+        self._validate(steps)
+        run = StepRun(timings={step.name: StepTiming() for step in steps})
+        errors: Dict[str, BaseException] = {}
+        tasks: Dict[asyncio.Task, Step] = {}
+        discarded = []
+        undecided = set()  # speculatieve steps waarvan de conditie nog niet bekend is
+        start = time.monotonic()
+
+        def launch(step: Step, speculative: bool) -> None:
+            timing = run.timings[step.name]
+            timing.status = RUNNING
+            timing.started = time.monotonic() - start
+            timing.speculative = speculative
+            tasks[asyncio.ensure_future(step.func(run.results))] = step
+            if speculative:
+                undecided.add(step.name)
+                self._count("speculative_started")
+
+        def condition_state(step: Step) -> Optional[bool]:
+            """True/False once the condition is decided, None while it is not"""
+            if step.condition is None:
+                return True
+            statuses = [run.status(name) for name in step.condition_on]
+            if any(status in (SKIPPED, DISCARDED) for status in statuses):
+                return False
+            if all(status == DONE for status in statuses):
+                return bool(step.condition(run.results))
+            return None
+
+        def advance() -> None:
+            """Start, skip or discard steps until nothing changes"""
+            changed = True
+            while changed:
+                changed = False
+                for step in steps:
+                    timing = run.timings[step.name]
+                    if timing.status == PENDING:
+                        deps = [run.status(name) for name in step.depends_on]
+                        if any(status in (SKIPPED, DISCARDED) for status in deps):
+                            timing.status = SKIPPED
+                            changed = True
+                            continue
+                        if not all(status == DONE for status in deps):
+                            continue
+                        decided = condition_state(step)
+                        if decided is False:
+                            timing.status = SKIPPED
+                            changed = True
+                        elif decided is True:
+                            launch(step, speculative=False)
+                        elif step.speculative and self.speculation:
+                            launch(step, speculative=True)
+                    elif step.name in undecided:
+                        decided = condition_state(step)
+                        if decided is None:
+                            continue
+                        undecided.discard(step.name)
+                        if decided:
+                            self._count("speculative_used")
+                            if timing.status == FAILED:
+                                self._count("failed")
+                                raise errors[step.name]
+                            continue
+                        # Speculatie bleek onnodig: resultaat weggooien
+                        self._count("speculative_discarded")
+                        for task, task_step in list(tasks.items()):
+                            if task_step is step:
+                                task.cancel()
+                                discarded.append(task)
+                                del tasks[task]
+                        run.results.pop(step.name, None)
+                        timing.status = DISCARDED
+                        timing.finished = timing.finished or time.monotonic() - start
+                        changed = True
+
+        try:
+            advance()
+            while tasks:
+                done, _ = await asyncio.wait(list(tasks), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step = tasks.pop(task)
+                    timing = run.timings[step.name]
+                    timing.finished = time.monotonic() - start
+                    error = task.exception()
+                    if error is None:
+                        timing.status = DONE
+                        run.results[step.name] = task.result()
+                        self.latency.observe(step.name, timing.duration)
+                    elif step.name in undecided:
+                        # Pas een fout als het resultaat ook echt nodig blijkt
+                        timing.status = FAILED
+                        errors[step.name] = error
+                    else:
+                        timing.status = FAILED
+                        self._count("failed")
+                        raise error
+                advance()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks or discarded:
+                await asyncio.gather(*tasks, *discarded, return_exceptions=True)
+            run.elapsed = time.monotonic() - start
+            self._count("runs")
+
+        logger.info(f"Step run finished: {run.summary()}")
+        return run
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return speculation counters and per-step latency"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["speculation"] = self.speculation
+        stats["steps"] = self.latency.snapshot()
+        return stats
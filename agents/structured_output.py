@@ -0,0 +1,431 @@
+"""
+Structured output for Happy2Align
+JSON-schema answers for the decomposer and workflow prompts: incremental parsing while tokens stream,
+local repair of near-miss JSON and a line-based fallback for answers that ignore the format
+"""
+
+import ast
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+DECOMPOSITION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "subtopics": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "questions": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["title", "questions"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["subtopics"],
+    "additionalProperties": False,
+}
+
+WORKFLOW_SCHEMA = {
+    "type": "object",
+    "properties": {"steps": {"type": "array", "items": {"type": "string"}}},
+    "required": ["steps"],
+    "additionalProperties": False,
+}
+
+def json_schema_response(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    response_format for structured outputs: the model can only answer with JSON that matches `schema`
+
+    Strict mode needs every object in the schema to list all its properties as
+    required and to set additionalProperties to false.
+    """
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+
+# Structured output voor de decomposer en de workflow prompts
+DECOMPOSITION_RESPONSE = json_schema_response("decomposition", DECOMPOSITION_SCHEMA)
+WORKFLOW_RESPONSE = json_schema_response("workflow", WORKFLOW_SCHEMA)
+
+# Hoe een antwoord geparsed is, van best naar slechtst
+PARSE_METHODS = ("json", "repaired", "lines", "failed")
+
+
+class StructuredOutputError(ValueError):
+    """Raised when an answer cannot be parsed, not even after repair"""
+
+
+# ---------------------------------------------------------------------------
+# Repair
+# ---------------------------------------------------------------------------
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"', "‘": "'", "’": "'"})
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_MISSING_COMMA = re.compile(r'("|\}|\])(\s*\n\s*)("|\{|\[)')
+
+
+def _close_truncated(text: str) -> str:
+    """Close an unterminated string and any open brackets (answers cut off by max_tokens)"""
+    stack = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = _TRAILING_COMMA.sub(r"\1", text.rstrip().rstrip(","))
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort repair of near-miss JSON
+
+    Handles code fences and surrounding prose, smart quotes, trailing and missing
+    commas between lines, and truncated answers.
+    """
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if starts:
+        text = text[min(starts):]
+    text = text.translate(_SMART_QUOTES).strip()
+    text = _MISSING_COMMA.sub(r"\1,\2\3", text)
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    return _close_truncated(text)
+
+
+def loads_lenient(text: str) -> Tuple[Any, bool]:
+    """
+    Parse JSON, repairing it locally when needed
+
+    Returns:
+        (data, repaired)
+
+    Raises:
+        StructuredOutputError: When the text is not JSON, not even after repair
+    """
+    try:
+        return json.loads(text.strip(), strict=False), False
+    except json.JSONDecodeError:
+        pass
+    repaired = repair_json(text)
+    try:
+        return json.loads(repaired, strict=False), True
+    except json.JSONDecodeError:
+        pass
+    # Python-literal stijl (enkele quotes, True/None) zoals sommige modellen teruggeven
+    try:
+        return ast.literal_eval(repaired), True
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        raise StructuredOutputError("Answer is not valid JSON, not even after repair")
+
+
+# ---------------------------------------------------------------------------
+# Incremental parsing
+# ---------------------------------------------------------------------------
+
+class IncrementalArrayParser:
+    """
+    Emits the elements of one array in a streamed JSON answer as soon as each is complete
+
+    The array is the value of `field` in the top-level object, or the top-level
+    value itself when the answer is a bare array.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None  # Laatste complete string op objectniveau (kandidaat-sleutel)
+        self._array_depth = None  # Diepte binnen de doel-array
+        self._item_start = None
+        self._done = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add streamed text and return the elements completed by it"""
+        self._buffer += chunk
+        items = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            index = self._pos
+            self._pos += 1
+            if self._done:
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._array_depth is None:
+                        self._last_string = buffer[self._string_start + 1:index]
+                    elif self._array_depth == self._depth and self._item_start == self._string_start:
+                        items.append(self._emit(self._item_start, index + 1))
+                continue
+
+            at_item_level = self._array_depth is not None and self._depth == self._array_depth
+            if at_item_level and self._item_start is None and not char.isspace() and char not in ",]":
+                self._item_start = index
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char in "{[":
+                self._depth += 1
+                if self._array_depth is None and char == "[" and (
+                        self._depth == 1 or (self._depth == 2 and self._last_string == self.field)):
+                    self._array_depth = self._depth
+            elif char in "}]":
+                if at_item_level and self._item_start is not None and char == "]":
+                    items.append(self._emit(self._item_start, index))
+                if self._array_depth is not None and self._depth == self._array_depth and char == "]":
+                    self._done = True
+                self._depth -= 1
+                if self._array_depth is not None and self._depth == self._array_depth and self._item_start is not None:
+                    items.append(self._emit(self._item_start, index + 1))
+            elif char == "," and at_item_level and self._item_start is not None:
+                items.append(self._emit(self._item_start, index))
+        return [item for item in items if item is not None]
+
+    def _emit(self, start: int, end: int) -> Any:
+        self._item_start = None
+        raw = self._buffer[start:end].strip()
+        if not raw:
+            return None
+        try:
+            return loads_lenient(raw)[0]
+        except StructuredOutputError:
+            return None
+
+
+# Begin van een JSON-antwoord: een regel die met {, [ of een code fence begint, of {" midden in een zin
+_JSON_START = re.compile(r'^[ \t]*(?:\{|\[|```)|\{\s*"', re.MULTILINE)
+# Een { aan het eind van de buffer kan nog een JSON-object worden: wachten op meer tekst
+_PENDING_BRACE = re.compile(r"\{\s*$")
+
+
+class StepStream:
+    """
+    Streams workflow steps from an answer in either format
+
+    JSON answers ({"steps": [...]}) are parsed incrementally, also when a line of
+    prose precedes them; other answers are treated as a numbered list and emitted per line.
+    """
+
+    def __init__(self):
+        self._json = None  # IncrementalArrayParser zodra het antwoord JSON blijkt
+        self._json_text = ""
+        self._json_emitted = 0
+        self._line_buffer = ""
+        self._emitted = False
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add streamed text and return the steps completed by it"""
+        if self._json is not None:
+            return self._feed_json(chunk)
+        self._line_buffer += chunk
+        if not self._emitted:
+            start = _JSON_START.search(self._line_buffer)
+            if start:
+                self._json = IncrementalArrayParser("steps")
+                text, self._line_buffer = self._line_buffer[start.start():], ""
+                return self._feed_json(text)
+            if _PENDING_BRACE.search(self._line_buffer):
+                return []
+        *lines, self._line_buffer = self._line_buffer.split("\n")
+        steps = []
+        for line in lines:
+            step = parse_step_line(line)
+            if step:
+                steps.append(step)
+                self._emitted = True
+        return steps
+
+    def _feed_json(self, text: str) -> List[str]:
+        self._json_text += text
+        steps = [step for step in map(_step_text, self._json.feed(text)) if step]
+        self._json_emitted += len(steps)
+        return steps
+
+    def close(self) -> List[str]:
+        """Flush what is left: the last line of a list, or the steps of JSON the incremental parser missed"""
+        if self._json is not None:
+            # Het volledige antwoord (eventueel gerepareerd) kan meer stappen bevatten dan er gestreamd zijn
+            steps, method = parse_steps(self._json_text)
+            remaining = steps[self._json_emitted:] if method in ("json", "repaired") else []
+            self._json_emitted += len(remaining)
+            return remaining
+        step = parse_step_line(self._line_buffer)
+        self._line_buffer = ""
+        return [step] if step else []
+
+
+# ---------------------------------------------------------------------------
+# Line-based fallback (het oude tekstformaat)
+# ---------------------------------------------------------------------------
+
+def parse_step_line(line: str) -> Optional[str]:
+    """Parse one numbered or bulleted workflow line into a step"""
+    line = line.strip()
+    if line and (line[0].isdigit() or line.startswith("-")):
+        # Clean up the line
+        step = re.sub(r"^\d+\.\s*", "", line)
+        step = re.sub(r"^-\s*", "", step)
+        return step or None
+    return None
+
+
+def _parse_subtopic_lines(output: str) -> List[Dict[str, Any]]:
+    """Parse the "- Subtopic N: title / - Qn: question" text format"""
+    subtopics = []
+    current = None
+    for line in output.splitlines():
+        line = line.strip()
+        # Match subtopic pattern
+        subtopic_match = re.match(r"-? ?Subtopic \d+: (.+)", line)
+        if subtopic_match:
+            if current:
+                subtopics.append(current)
+            current = {"title": subtopic_match.group(1), "questions": []}
+        # Match question pattern
+        elif current and (line.startswith("- Q") or line.startswith("Q")):
+            question = line.split(":", 1)[-1].strip()
+            if question:
+                current["questions"].append(question)
+    if current:
+        subtopics.append(current)
+    return subtopics
+
+
+# ---------------------------------------------------------------------------
+# Schema-specifieke parsers
+# ---------------------------------------------------------------------------
+
+def _text(value: Any, keys: Tuple[str, ...]) -> Optional[str]:
+    """A string, or the first string under one of `keys` of a dict"""
+    if isinstance(value, dict):
+        value = next((value[key] for key in keys if isinstance(value.get(key), str)), None)
+    if isinstance(value, str):
+        value = re.sub(r"^(?:\d+[.)]|-|Q\d+:)\s*", "", value.strip())
+        return value or None
+    return None
+
+
+def _step_text(value: Any) -> Optional[str]:
+    return _text(value, ("step", "description", "text", "title", "name"))
+
+
+def _field(data: Any, field: str) -> Any:
+    """The target array: data[field], or data itself when the answer is a bare array"""
+    if isinstance(data, dict):
+        if field in data:
+            return data[field]
+        # Eén willekeurige lijst-waarde accepteren als het veld anders heet
+        lists = [value for value in data.values() if isinstance(value, list)]
+        return lists[0] if len(lists) == 1 else None
+    return data
+
+
+def _normalize_subtopics(data: Any) -> List[Dict[str, Any]]:
+    subtopics = []
+    for item in _field(data, "subtopics") or []:
+        if not isinstance(item, dict):
+            continue
+        title = _text(item, ("title", "subtopic", "name", "topic"))
+        questions = item.get("questions") or item.get("clarifying_questions") or []
+        questions = [text for text in (_text(q, ("question", "text")) for q in questions) if text]
+        if title:
+            subtopics.append({"title": title, "questions": questions})
+    return subtopics
+
+
+def parse_decomposition(output: str) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Parse a decomposer answer into subtopics with questions
+
+    Returns:
+        (subtopics, method) where method is one of PARSE_METHODS; subtopics is empty when "failed"
+    """
+    try:
+        data, repaired = loads_lenient(output)
+        subtopics = _normalize_subtopics(data)
+        if subtopics:
+            return subtopics, "repaired" if repaired else "json"
+    except StructuredOutputError:
+        pass
+    subtopics = _parse_subtopic_lines(output)
+    return subtopics, "lines" if subtopics else "failed"
+
+
+def parse_steps(output: str) -> Tuple[List[str], str]:
+    """
+    Parse a workflow answer into steps
+
+    Returns:
+        (steps, method) where method is one of PARSE_METHODS; steps is empty when "failed"
+    """
+    try:
+        data, repaired = loads_lenient(output)
+        steps = [step for step in map(_step_text, _field(data, "steps") or []) if step]
+        if steps:
+            return steps, "repaired" if repaired else "json"
+    except StructuredOutputError:
+        pass
+    steps = [step for step in map(parse_step_line, output.splitlines()) if step]
+    return steps, "lines" if steps else "failed"
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+class ParseStats:
+    """Parse outcomes per answer kind"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, method: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(kind, {name: 0 for name in PARSE_METHODS})
+            counts[method] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts and success rates per kind (success = anything but "failed")"""
+        with self._lock:
+            snapshot = {kind: dict(counts) for kind, counts in self._counts.items()}
+        for counts in snapshot.values():
+            total = sum(counts.values())
+            counts["total"] = total
+            counts["success_rate"] = (total - counts["failed"]) / total if total else None
+            counts["json_rate"] = (counts["json"] + counts["repaired"]) / total if total else None
+        return snapshot
+
+
+# Singleton instance
+parse_stats = ParseStats()
@@ -0,0 +1,441 @@
+"""
+Local Theory-of-Mind estimator for Happy2Align
+Lexical features + character TF-IDF with calibrated logistic regression for expertise and sentiment;
+turns the model is unsure about are escalated to the LLM prompts
+
+Training CLI:
+    python -m agents.tom_estimator train [--log instance/tom_decisions.jsonl] [--dataset ...]
+    python -m agents.tom_estimator list
+    python -m agents.tom_estimator predict "Ik snap er helemaal niks van"
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from agents.config import (
+    TOM_ESTIMATOR_ENABLED, TOM_MODEL_DIR, TOM_MODEL_VERSION,
+    TOM_EXPERTISE_THRESHOLD, TOM_SENTIMENT_THRESHOLD, TOM_DECISION_LOG, TOM_LOG_TEXT
+)
+from agents.model_artifacts import (
+    DecisionLog, artifact_versions, calibration_table, format_calibration, load_artifact, next_version,
+    save_artifact
+)
+from agents.turn_analysis import EXPERTISE_LEVELS, SENTIMENTS, normalize_expertise, normalize_sentiment
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_NAME = "tom"
+FIELDS = ("expertise", "sentiment")
+LABELS = {"expertise": EXPERTISE_LEVELS, "sentiment": SENTIMENTS}
+
+# Expertiseniveaus van de persona's in de synthetische evaluatiedataset
+_PERSONA_EXPERTISE = {"laag": "BEGINNER", "gemiddeld": "INTERMEDIATE", "hoog": "EXPERT", "zeer hoog": "EXPERT"}
+
+
+def expertise_text(history: List[Dict]) -> str:
+    """The user's side of a conversation, the input of the expertise model"""
+    return "\n".join(msg["content"] for msg in history if msg.get("role") == "user")
+
+
+class ToMEstimator:
+    """A trained, versioned pair of expertise and sentiment models"""
+
+    def __init__(self, models: Dict[str, Any], version: int, metadata: Dict[str, Any]):
+        """
+        Initialize the estimator
+
+        Args:
+            models: Fitted scikit-learn pipelines per field ("expertise", "sentiment")
+            version: Artifact version
+            metadata: Training metadata (examples, metrics, library versions)
+        """
+        self.models = models
+        self.version = version
+        self.metadata = metadata
+
+    def predict(self, field: str, text: str) -> Optional[Tuple[str, float]]:
+        """
+        Classify one text for a field
+
+        Returns:
+            (label, calibrated probability of that label), or None when the field has no model
+        """
+        model = self.models.get(field)
+        if model is None:
+            return None
+        probabilities = model.predict_proba([text])[0]
+        best = probabilities.argmax()
+        return model.classes_[best], float(probabilities[best])
+
+    @staticmethod
+    def versions(directory: str) -> List[int]:
+        """All artifact versions in a directory, oldest first"""
+        return artifact_versions(directory, ARTIFACT_NAME)
+
+    @classmethod
+    def load(cls, directory: str, version: str = "latest") -> Optional["ToMEstimator"]:
+        """
+        Load an artifact (only load artifacts you trained yourself: joblib unpickles)
+
+        Args:
+            directory: Artifact directory
+            version: Version number or "latest"
+
+        Returns:
+            The estimator or None when no artifact exists
+        """
+        artifact = load_artifact(directory, ARTIFACT_NAME, version)
+        if artifact is None:
+            return None
+        return cls(artifact["models"], artifact["version"], artifact["metadata"])
+
+    def save(self, directory: str) -> str:
+        """Write the artifact and return its path"""
+        return save_artifact(directory, ARTIFACT_NAME, self.version, {
+            "metadata": self.metadata,
+            "models": self.models,
+        })
+
+
+def _make_pipeline(labels: List[str]):
+    """Character TF-IDF + scaled lexical features into a (calibrated) logistic regression"""
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline, make_union
+    from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+    from utils.lexical import feature_matrix
+
+    classifier = LogisticRegression(max_iter=1000, class_weight="balanced")
+    # Sigmoid-kalibratie zodat de drempel een echte kans is; te weinig voorbeelden per klasse = ongekalibreerd
+    folds = min(3, min(labels.count(label) for label in set(labels)))
+    if folds >= 2:
+        classifier = CalibratedClassifierCV(classifier, method="sigmoid", cv=folds)
+    return make_pipeline(
+        make_union(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), sublinear_tf=True, min_df=1),
+            make_pipeline(FunctionTransformer(feature_matrix), StandardScaler()),
+        ),
+        classifier
+    )
+
+
+def _train_field(examples: List[Tuple[str, str]], threshold: float, folds: int):
+    """Fit one field and report cross-validated accuracy and local coverage per threshold"""
+    from sklearn.model_selection import StratifiedKFold
+
+    texts = [text for text, _ in examples]
+    labels = [label for _, label in examples]
+    counts = {label: labels.count(label) for label in set(labels)}
+
+    metrics: Dict[str, Any] = {}
+    if folds and min(counts.values()) >= folds:
+        # Elk voorbeeld wordt één keer voorspeld door een model dat het niet gezien heeft
+        confidence = np.zeros(len(examples))
+        correct = np.zeros(len(examples), dtype=bool)
+        splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+        for train_index, test_index in splitter.split(texts, labels):
+            y_train = [labels[i] for i in train_index]
+            evaluation = _make_pipeline(y_train).fit([texts[i] for i in train_index], y_train)
+            probabilities = evaluation.predict_proba([texts[i] for i in test_index])
+            confidence[test_index] = probabilities.max(axis=1)
+            correct[test_index] = evaluation.classes_[probabilities.argmax(axis=1)] == np.array(labels)[test_index]
+        confident = confidence >= threshold
+        metrics = {
+            "folds": folds,
+            "accuracy": float(correct.mean()),
+            "threshold": threshold,
+            "coverage_at_threshold": float(confident.mean()),
+            "accuracy_at_threshold": float(correct[confident].mean()) if confident.any() else None,
+            "calibration": calibration_table(confidence, correct),
+        }
+
+    return _make_pipeline(labels).fit(texts, labels), {"examples": len(examples), "label_counts": counts,
+                                                        "metrics": metrics}
+
+
+def train(examples: Dict[str, List[Tuple[str, str]]], version: int, folds: int = 5) -> ToMEstimator:
+    """
+    Fit the expertise and sentiment models
+
+    Args:
+        examples: (text, label) pairs per field
+        version: Version of the new artifact
+        folds: Cross-validation folds used to report accuracy and local coverage per threshold (0 = skip)
+
+    Returns:
+        The trained estimator (fitted on all examples); fields with fewer than two labels are skipped
+    """
+    import sklearn
+
+    thresholds = {"expertise": TOM_EXPERTISE_THRESHOLD, "sentiment": TOM_SENTIMENT_THRESHOLD}
+    models = {}
+    metadata: Dict[str, Any] = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "sklearn_version": sklearn.__version__,
+        "fields": {},
+    }
+    for field in FIELDS:
+        field_examples = examples.get(field, [])
+        if len({label for _, label in field_examples}) < 2:
+            logger.warning(f"Not enough {field} labels to train, this field stays with the LLM")
+            continue
+        models[field], metadata["fields"][field] = _train_field(field_examples, thresholds[field], folds)
+    if not models:
+        raise ValueError("Training data needs at least two labels for expertise or sentiment")
+    return ToMEstimator(models, version, metadata)
+
+
+class LocalToM:
+    """Estimator in front of the ToM prompts, plus the decision log used for retraining"""
+
+    def __init__(self,
+                 estimator: Optional[ToMEstimator],
+                 expertise_threshold: float = 0.6,
+                 sentiment_threshold: float = 0.7,
+                 log_path: Optional[str] = None,
+                 log_text: bool = False):
+        """
+        Initialize the local ToM engine
+
+        Args:
+            estimator: Trained estimator (None = always escalate to the LLM)
+            expertise_threshold: Minimum calibrated probability to skip the expertise prompt
+            sentiment_threshold: Minimum calibrated probability to skip the sentiment prompt
+            log_path: JSONL file receiving every ToM decision (None disables)
+            log_text: Log the text itself (needed for retraining); otherwise only its hash and length
+        """
+        self.estimator = estimator
+        self.thresholds = {"expertise": expertise_threshold, "sentiment": sentiment_threshold}
+        self.log = DecisionLog(log_path, log_text=log_text)
+        self._lock = threading.Lock()
+        self._stats = {field: {"local": 0, "escalated": 0, "llm_decisions": 0, "disagreements": 0}
+                       for field in FIELDS}
+        self._local_seconds = 0.0
+
+    async def predict(self, field: str, text: str) -> Optional[Tuple[str, float]]:
+        """
+        Run the model for a field in a worker thread (a prediction costs milliseconds of CPU)
+
+        Returns:
+            (label, calibrated probability), or None when there is no model or no text
+        """
+        if self.estimator is None or not text.strip():
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._timed_predict, field, text)
+
+    def _timed_predict(self, field: str, text: str) -> Optional[Tuple[str, float]]:
+        start = time.perf_counter()
+        prediction = self.estimator.predict(field, text)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._local_seconds += elapsed
+        return prediction
+
+    def decide(self, field: str, text: str, prediction: Optional[Tuple[str, float]]) -> Optional[str]:
+        """
+        Accept a prediction when it clears the field's threshold
+
+        Returns:
+            The label, or None when the LLM should decide (pass the prediction on to record())
+        """
+        if prediction is None:
+            return None
+        label, confidence = prediction
+        confident = confidence >= self.thresholds[field]
+        with self._lock:
+            self._stats[field]["local" if confident else "escalated"] += 1
+        if not confident:
+            return None
+        self.record(field, text, label, "model", prediction=prediction)
+        return label
+
+    def record(self, field: str, text: str, label: str, source: str,
+               prediction: Optional[Tuple[str, float]] = None) -> None:
+        """
+        Append a ToM decision to the decision log
+
+        Args:
+            field: "expertise" or "sentiment"
+            text: Classified text
+            label: Decision
+            source: "llm" or "model" (only LLM decisions are used for training)
+            prediction: The model's (label, probability) for this text, if it was asked
+        """
+        if source == "llm":
+            with self._lock:
+                self._stats[field]["llm_decisions"] += 1
+                if prediction is not None and prediction[0] != label:
+                    self._stats[field]["disagreements"] += 1
+        self.log.append(
+            field=field,
+            text=text,
+            label=label,
+            source=source,
+            confidence=prediction[1] if prediction is not None else None,
+            model_version=self.estimator.version if self.estimator is not None else None,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return how often each field was answered locally"""
+        with self._lock:
+            stats = {field: dict(values) for field, values in self._stats.items()}
+            local_seconds = self._local_seconds
+        local_calls = 0
+        for values in stats.values():
+            calls = values["local"] + values["escalated"]
+            values["local_rate"] = values["local"] / calls if calls else 0.0
+            local_calls += calls
+        stats["mean_local_us"] = local_seconds / local_calls * 1e6 if local_calls else None
+        stats["model_version"] = self.estimator.version if self.estimator is not None else None
+        return stats
+
+
+def _create_local_tom() -> LocalToM:
+    estimator = None
+    if TOM_ESTIMATOR_ENABLED:
+        try:
+            estimator = ToMEstimator.load(TOM_MODEL_DIR, TOM_MODEL_VERSION)
+            if estimator is None:
+                logger.info("No ToM estimator artifact found, estimating expertise and sentiment with the LLM")
+            else:
+                logger.info(f"Loaded ToM estimator v{estimator.version}")
+        except Exception as e:
+            logger.warning(f"Could not load ToM estimator: {str(e)}")
+    return LocalToM(estimator,
+                    expertise_threshold=TOM_EXPERTISE_THRESHOLD,
+                    sentiment_threshold=TOM_SENTIMENT_THRESHOLD,
+                    log_path=TOM_DECISION_LOG or None,
+                    log_text=TOM_LOG_TEXT)
+
+
+# Singleton instance
+local_tom = _create_local_tom()
+
+
+def _normalize(field: str, label: Any) -> Optional[str]:
+    return normalize_expertise(label) if field == "expertise" else normalize_sentiment(label)
+
+
+def load_decision_log(path: str) -> Dict[str, List[Tuple[str, str]]]:
+    """LLM expertise and sentiment decisions from the decision log (entries logged without their text are skipped)"""
+    examples = {field: [] for field in FIELDS}
+    for entry in DecisionLog.read(path):
+        if not entry.get("text"):
+            continue
+        field = entry.get("field")
+        label = _normalize(field, entry.get("label")) if field in FIELDS else None
+        if label is not None:
+            examples[field].append((entry["text"], label))
+    return examples
+
+
+EVALUATION_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "evaluation", "data")
+
+
+def load_examples_file(path: str) -> Dict[str, List[Tuple[str, str]]]:
+    """JSONL file with {"text": ..., "expertise": ..., "sentiment": ...} lines (either label may be missing)"""
+    examples = {field: [] for field in FIELDS}
+    with open(path, encoding="utf-8") as f:
+        for entry in map(json.loads, filter(str.strip, f)):
+            for field in FIELDS:
+                label = _normalize(field, entry.get(field))
+                if label is not None:
+                    examples[field].append((entry["text"], label))
+    return examples
+
+
+def load_evaluation_examples(dataset_path: Optional[str] = None) -> Dict[str, List[Tuple[str, str]]]:
+    """Labelled texts from the evaluation data (ToM examples, labelled turns, synthetic dataset)"""
+    examples = load_examples_file(os.path.join(EVALUATION_DATA_DIR, "tom_examples.jsonl"))
+    with open(os.path.join(EVALUATION_DATA_DIR, "labelled_turns.json"), encoding="utf-8") as f:
+        for case in json.load(f):
+            history = case["history"] + [{"role": "user", "content": case["message"]}]
+            examples["expertise"].append((expertise_text(history), case["expertise"]))
+            examples["sentiment"].append((case["message"], case["sentiment"]))
+    # De synthetische dataset heeft alleen een expertiseniveau per persona
+    if dataset_path and os.path.exists(dataset_path):
+        with open(dataset_path, encoding="utf-8") as f:
+            for sample in json.load(f):
+                label = _PERSONA_EXPERTISE.get(sample.get("expertise_level"))
+                if label is not None:
+                    examples["expertise"].append((sample["query"], label))
+    return examples
+
+
+def _dedupe(examples: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Keep the most recent label per text"""
+    latest = {}
+    for text, label in examples:
+        latest[text.strip()] = label
+    return [(text, label) for text, label in latest.items() if text]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Train and inspect the local ToM estimator")
+    parser.add_argument("--model-dir", default=TOM_MODEL_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_cmd = commands.add_parser("train", help="Train a new artifact version")
+    train_cmd.add_argument("--log", default=TOM_DECISION_LOG, help="ToM decision log (JSONL)")
+    train_cmd.add_argument("--dataset", help="Synthetic evaluation dataset (JSON)")
+    train_cmd.add_argument("--examples", action="append", default=[],
+                           help="Extra JSONL file with {\"text\": ..., \"expertise\": ..., \"sentiment\": ...} lines")
+    train_cmd.add_argument("--folds", type=int, default=5, help="Cross-validation folds for the calibration tables")
+
+    commands.add_parser("list", help="List artifact versions")
+
+    predict_cmd = commands.add_parser("predict", help="Classify a text with the latest artifact")
+    predict_cmd.add_argument("text")
+    predict_cmd.add_argument("--version", default="latest")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        sources = [load_evaluation_examples(args.dataset)]
+        if args.log:
+            sources.append(load_decision_log(args.log))
+        sources += [load_examples_file(path) for path in args.examples]
+        examples = {field: _dedupe(example for source in sources for example in source[field]) for field in FIELDS}
+
+        estimator = train(examples, version=next_version(args.model_dir, ARTIFACT_NAME), folds=args.folds)
+        path = estimator.save(args.model_dir)
+        print(f"Saved {path}")
+        print(json.dumps(estimator.metadata, indent=2))
+        for field, values in estimator.metadata["fields"].items():
+            calibration = values["metrics"].get("calibration")
+            if calibration:
+                print(f"\n{field}\n{format_calibration(calibration)}")
+
+    elif args.command == "list":
+        for version in ToMEstimator.versions(args.model_dir):
+            estimator = ToMEstimator.load(args.model_dir, str(version))
+            accuracy = {field: values.get("metrics", {}).get("accuracy")
+                        for field, values in estimator.metadata["fields"].items()}
+            print(f"v{version}  trained_at={estimator.metadata['trained_at']}  accuracy={accuracy}")
+
+    elif args.command == "predict":
+        estimator = ToMEstimator.load(args.model_dir, args.version)
+        if estimator is None:
+            parser.error(f"No ToM artifact in {args.model_dir}")
+        for field in FIELDS:
+            start = time.perf_counter()
+            prediction = estimator.predict(field, args.text)
+            elapsed = (time.perf_counter() - start) * 1e6
+            if prediction is not None:
+                print(f"{field}: {prediction[0]} ({prediction[1]:.2f}) in {elapsed:.0f}us")
+
+
+if __name__ == "__main__":
+    main()
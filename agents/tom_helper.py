@@ -3,16 +3,23 @@ Theory of Mind Helper Agent for Happy 2 Align
 Provides ToM capabilities like sentiment detection and expertise estimation.
 """
 
-from typing import Dict, Literal
+from typing import Dict, Literal, Optional
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from .config import OPENAI_API_KEY, DEFAULT_MODEL
+from . import http_pool
+from .tom_estimator import LocalToM, local_tom as default_local_tom
+from .turn_analysis import normalize_expertise, normalize_sentiment
 
 class ToMHelper:
-    def __init__(self, model_name: str = DEFAULT_MODEL):
+    def __init__(self, model_name: str = DEFAULT_MODEL, local_tom: Optional[LocalToM] = None):
+        # Lokale schatter eerst; alleen bij lage zekerheid een LLM call
+        self.local_tom = local_tom or default_local_tom
         self.llm = ChatOpenAI(
             model_name=model_name,
-            openai_api_key=OPENAI_API_KEY
+            openai_api_key=OPENAI_API_KEY,
+            http_client=http_pool.get_sync_client(),
+            http_async_client=http_pool.get_async_client()
         )
         self.sentiment_prompt = ChatPromptTemplate.from_messages([
             ("system", """Analyze the sentiment of the following text. Return one of: POSITIVE, NEUTRAL, NEGATIVE, or MIXED.
@@ -31,14 +38,36 @@ Text: {text}"""),
 
     async def detect_sentiment(self, text: str) -> Literal["POSITIVE", "NEUTRAL", "NEGATIVE", "MIXED"]:
         """Detect the sentiment of a given text."""
+        prediction = None
+        if self.local_tom is not None:
+            prediction = await self.local_tom.predict("sentiment", text)
+            sentiment = self.local_tom.decide("sentiment", text, prediction)
+            if sentiment is not None:
+                return sentiment
         response = await self.llm.ainvoke(
             self.sentiment_prompt.format_messages(text=text)
         )
-        return response.content.strip()
+        sentiment = normalize_sentiment(response.content)
+        if sentiment is None:
+            return "NEUTRAL"
+        if self.local_tom is not None:
+            self.local_tom.record("sentiment", text, sentiment, "llm", prediction=prediction)
+        return sentiment
 
     async def estimate_expertise(self, text: str, domain: str) -> Literal["BEGINNER", "INTERMEDIATE", "EXPERT"]:
         """Estimate the user's expertise level in a given domain."""
+        prediction = None
+        if self.local_tom is not None:
+            prediction = await self.local_tom.predict("expertise", text)
+            expertise = self.local_tom.decide("expertise", text, prediction)
+            if expertise is not None:
+                return expertise
         response = await self.llm.ainvoke(
             self.expertise_prompt.format_messages(text=text, domain=domain)
         )
-        return response.content.strip() 
\ No newline at end of file
+        expertise = normalize_expertise(response.content)
+        if expertise is None:
+            return "INTERMEDIATE"
+        if self.local_tom is not None:
+            self.local_tom.record("expertise", text, expertise, "llm", prediction=prediction)
+        return expertise
@@ -0,0 +1,96 @@
+"""
+Turn analysis for Happy2Align
+Schema and validation of the fused route + expertise + sentiment JSON answer
+"""
+
+import json
+import re
+from typing import Any, Dict, Optional
+
+from agents.structured_output import json_schema_response
+
+ROUTES = ("RequirementRefiner", "WorkflowRefiner")
+EXPERTISE_LEVELS = ("BEGINNER", "INTERMEDIATE", "EXPERT")
+SENTIMENTS = ("POSITIVE", "NEUTRAL", "NEGATIVE", "MIXED")
+
+TURN_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "route": {"type": "string", "enum": list(ROUTES)},
+        "expertise": {"type": "string", "enum": list(EXPERTISE_LEVELS)},
+        "sentiment": {"type": "string", "enum": list(SENTIMENTS)},
+    },
+    "required": ["route", "expertise", "sentiment"],
+    "additionalProperties": False,
+}
+
+# Structured output: het model kan alleen labels uit de enums hierboven teruggeven
+TURN_ANALYSIS_RESPONSE = json_schema_response("turn_analysis", TURN_ANALYSIS_SCHEMA)
+
+# Synoniemen die modellen (en de losse ToM prompts) teruggeven
+_EXPERTISE_ALIASES = {"NOVICE": "BEGINNER", "BASIC": "BEGINNER", "ADVANCED": "EXPERT", "MEDIUM": "INTERMEDIATE"}
+
+
+class TurnAnalysisError(ValueError):
+    """Raised when a fused turn analysis answer does not match the schema"""
+
+
+def _label(value: Any) -> str:
+    return re.sub(r"[^A-Za-z]", "", str(value)).upper()
+
+
+def normalize_route(value: Any) -> Optional[str]:
+    """Map a router answer onto a known route (None when unknown)"""
+    label = _label(value)
+    for route in ROUTES:
+        if label == route.upper():
+            return route
+    return None
+
+
+def normalize_expertise(value: Any) -> Optional[str]:
+    """Map an expertise answer onto BEGINNER / INTERMEDIATE / EXPERT (None when unknown)"""
+    label = _label(value)
+    label = _EXPERTISE_ALIASES.get(label, label)
+    return label if label in EXPERTISE_LEVELS else None
+
+
+def normalize_sentiment(value: Any) -> Optional[str]:
+    """Map a sentiment answer onto a known category (None when unknown)"""
+    label = _label(value)
+    return label if label in SENTIMENTS else None
+
+
+def parse_turn_analysis(output: str) -> Dict[str, str]:
+    """
+    Parse and validate a fused turn analysis answer
+
+    Args:
+        output: Raw model output (a JSON object, optionally inside a code fence)
+
+    Returns:
+        Dict with route, expertise and sentiment
+
+    Raises:
+        TurnAnalysisError: When the output is not valid JSON or violates the schema
+    """
+    text = output.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise TurnAnalysisError(f"Turn analysis is not valid JSON: {str(e)}")
+    if not isinstance(data, dict):
+        raise TurnAnalysisError("Turn analysis is not a JSON object")
+
+    analysis = {
+        "route": normalize_route(data.get("route")),
+        "expertise": normalize_expertise(data.get("expertise")),
+        "sentiment": normalize_sentiment(data.get("sentiment")),
+    }
+    invalid = [field for field, value in analysis.items() if value is None]
+    if invalid:
+        raise TurnAnalysisError(f"Turn analysis has invalid fields: {invalid}")
+    return analysis
@@ -2,10 +2,10 @@
 Workflow Generator agent die helpt bij het genereren van workflows
 """
 
-from typing import List, Dict, Any
-from langchain_community.chat_models import ChatOpenAI
+from typing import Optional
 from langchain.prompts import ChatPromptTemplate
 from .base_agent import BaseAgent
+from .session_context import SessionContext
 from agents.config import WORKFLOW_GENERATOR_SYSTEM_PROMPT, DEFAULT_MODEL
 
 class WorkflowGenerator(BaseAgent):
@@ -16,11 +16,7 @@ class WorkflowGenerator(BaseAgent):
         super().__init__(model_name)
         self.system_prompt = WORKFLOW_GENERATOR_SYSTEM_PROMPT
 
-    async def process(self, user_input: str, context: Dict[str, Any] = None) -> str:
+    async def process(self, user_input: str, context: Optional[SessionContext] = None) -> str:
         """Genereer een workflow op basis van de requirements"""
-        if not context:
-            context = {"requirements": user_input}
-            
         messages = self._format_messages(self.system_prompt, user_input)
-        response = await self.llm.agenerate([messages])
-        return response.generations[0][0].text.strip() 
\ No newline at end of file
+        return await self.call_llm(messages)
\ No newline at end of file
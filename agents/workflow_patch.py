@@ -0,0 +1,148 @@
+"""
+Workflow patches for Happy2Align
+Edit operations (insert, delete, replace at a step number) that the workflow refiner returns instead of
+the complete workflow; they are validated and applied locally, so small edits cost a few output tokens
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents.structured_output import StructuredOutputError, json_schema_response, loads_lenient
+
+PATCH_OPERATIONS = ("insert", "delete", "replace")
+
+# Strikt schema: alle velden verplicht, dus "delete" geeft step null mee; het bereik van index wordt lokaal gecontroleerd
+PATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "operations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "op": {"type": "string", "enum": list(PATCH_OPERATIONS)},
+                    "index": {"type": "integer"},
+                    "step": {"type": ["string", "null"]},
+                },
+                "required": ["op", "index", "step"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["operations"],
+    "additionalProperties": False,
+}
+
+PATCH_RESPONSE = json_schema_response("workflow_patch", PATCH_SCHEMA)
+
+
+class PatchError(ValueError):
+    """Raised when a patch cannot be parsed or does not apply to the workflow"""
+
+
+def parse_patch(output: str) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Parse a workflow refiner answer into edit operations
+
+    A truncated answer is rejected instead of repaired: closing the brackets
+    would silently drop the operations that were cut off. An empty operations
+    list is rejected too, since the user asked for a change.
+
+    Returns:
+        (operations, method) where method is "json" or "repaired"
+
+    Raises:
+        PatchError: When the answer is not a patch
+    """
+    text = output.strip()
+    if text.rstrip("`").rstrip()[-1:] not in ("}", "]"):
+        raise PatchError("Patch answer is truncated or not JSON")
+    try:
+        data, repaired = loads_lenient(text)
+    except StructuredOutputError as e:
+        raise PatchError(str(e)) from e
+
+    operations = data.get("operations") if isinstance(data, dict) else data
+    if not isinstance(operations, list):
+        raise PatchError("Patch answer has no operations list")
+    if not operations:
+        raise PatchError("Patch answer has no operations")
+    return [_normalize_operation(operation) for operation in operations], "repaired" if repaired else "json"
+
+
+def _normalize_operation(operation: Any) -> Dict[str, Any]:
+    if not isinstance(operation, dict):
+        raise PatchError(f"Operation is not an object: {operation!r}")
+    op = str(operation.get("op", "")).strip().lower()
+    if op not in PATCH_OPERATIONS:
+        raise PatchError(f"Unknown operation: {op!r}")
+    index = operation.get("index")
+    # "3" en 3.0 accepteren, 2.5 of "drie" niet
+    try:
+        number = float(index)
+    except (TypeError, ValueError):
+        raise PatchError(f"Invalid index: {index!r}")
+    if isinstance(index, bool) or not number.is_integer():
+        raise PatchError(f"Invalid index: {index!r}")
+    normalized = {"op": op, "index": int(number)}
+    if op != "delete":
+        step = operation.get("step")
+        if not isinstance(step, str) or not step.strip():
+            raise PatchError(f"{op} at {normalized['index']} has no step text")
+        normalized["step"] = step.strip()
+    return normalized
+
+
+def apply_patch(workflow: List[str], operations: List[Dict[str, Any]]) -> List[str]:
+    """
+    Apply edit operations to a workflow
+
+    Indices are 1-based and refer to the workflow as it was sent to the model,
+    so the operations do not depend on each other's order. "insert" at i places
+    the new step before original step i (i = len + 1 appends); several inserts
+    at the same index keep their order.
+
+    Args:
+        workflow: Current workflow steps
+        operations: Normalized operations from parse_patch
+
+    Returns:
+        A new list; the input is not modified
+
+    Raises:
+        PatchError: When an index is out of range, a step is edited twice or the result is empty
+    """
+    size = len(workflow)
+    inserts: Dict[int, List[str]] = {}
+    edits: Dict[int, Optional[str]] = {}
+    for operation in operations:
+        op, index = operation["op"], operation["index"]
+        if op == "insert":
+            if not 1 <= index <= size + 1:
+                raise PatchError(f"insert index {index} out of range 1..{size + 1}")
+            inserts.setdefault(index, []).append(operation["step"])
+            continue
+        if not 1 <= index <= size:
+            raise PatchError(f"{op} index {index} out of range 1..{size}")
+        if index in edits:
+            raise PatchError(f"Step {index} is edited more than once")
+        edits[index] = operation.get("step")
+
+    result = []
+    for number in range(1, size + 2):
+        result.extend(inserts.get(number, []))
+        if number > size:
+            break
+        if number in edits:
+            if edits[number] is not None:
+                result.append(edits[number])
+        else:
+            result.append(workflow[number - 1])
+    if not result:
+        raise PatchError("Patch removes every step")
+    return result
+
+
+def format_patch(operations: List[Dict[str, Any]]) -> str:
+    """Serialize operations the way the model is asked to return them (used for examples and logs)"""
+    return json.dumps({"operations": operations}, ensure_ascii=False)
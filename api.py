@@ -9,6 +9,7 @@ import uvicorn
 from agents.router_agent import RouterAgent
 from agents.requirement_refiner import RequirementRefiner
 from agents.workflow_generator import WorkflowGenerator
+from agents.session_context import SessionContext
 
 app = FastAPI(title="Happy 2 Align API")
 
@@ -28,22 +29,25 @@ workflow_generator = WorkflowGenerator()
 @app.post("/process", response_model=AgentResponse)
 async def process_input(user_input: UserInput):
     try:
+        # Elke request krijgt zijn eigen context; de agents zelf houden geen state bij
+        context = SessionContext.from_dict(user_input.context)
+        
         # Route the input to the appropriate agent
-        agent_type = await router_agent.process(user_input.message)
+        agent_type = await router_agent.process(user_input.message, context)
         
         if agent_type == "RequirementRefiner":
-            response = await requirement_refiner.process(user_input.message, user_input.context)
+            response = await requirement_refiner.process(user_input.message, context)
             return AgentResponse(
                 response=response,
                 next_agent="WorkflowGenerator" if "requirements_complete" in response else None,
-                context=user_input.context
+                context=context.to_dict()
             )
         elif agent_type == "WorkflowRefiner":
-            response = await workflow_generator.process(user_input.message, user_input.context)
+            response = await workflow_generator.process(user_input.message, context)
             return AgentResponse(
                 response=response,
                 next_agent=None,
-                context=user_input.context
+                context=context.to_dict()
             )
         else:
             raise HTTPException(status_code=400, detail="Invalid agent type")
@@ -0,0 +1,101 @@
+"""
+Benchmark: admission control onder gemengde belasting
+
+Simuleert een LLM-backend die maar een beperkt aantal calls tegelijk aankan
+(extra calls wachten op een vrije plek). Daarop komen drie soorten verkeer:
+één gebruiker die /api/process blijft bestoken, een batch-evaluatie die in één
+keer veel beurten aanbiedt, en een aantal gewone gebruikers met af en toe een
+interactieve beurt. Zonder admission control concurreren alle beurten om de
+backend; met de AdmissionController krijgen interactieve beurten voorrang en
+deelt de bestoker alleen zijn eigen eerlijke deel. Gemeten wordt de latency van
+de interactieve beurten (p50/p99) en hoeveel beurten afgewezen werden. Zonder LLM calls.
+
+Gebruik:
+    python -m evaluation.admission_benchmark [--slots 4] [--service-seconds 0.05] [--users 8]
+"""
+import argparse
+import random
+import threading
+import time
+
+from agents.admission import BATCH, INTERACTIVE, AdmissionController, AdmissionRejected
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode, slots, service_seconds, users, hog_requests, batch_requests, interactive_requests):
+    backend = threading.BoundedSemaphore(slots)
+    controller = AdmissionController(max_concurrent=slots,
+                                     max_wait={INTERACTIVE: 20 * service_seconds, BATCH: 600.0})
+    latencies = {"hog": [], "interactive": [], "batch": []}
+    shed = {"hog": 0, "interactive": 0, "batch": 0}
+    lock = threading.Lock()
+    rng = random.Random(42)
+
+    def turn(kind, user_id, priority):
+        start = time.perf_counter()
+        try:
+            if mode == "admission":
+                with controller.admit(user_id, priority):
+                    with backend:
+                        time.sleep(service_seconds * rng.uniform(0.5, 1.5))
+            else:
+                with backend:
+                    time.sleep(service_seconds * rng.uniform(0.5, 1.5))
+        except AdmissionRejected:
+            with lock:
+                shed[kind] += 1
+            return
+        with lock:
+            latencies[kind].append(time.perf_counter() - start)
+
+    threads = []
+
+    def spawn(kind, user_id, priority):
+        thread = threading.Thread(target=turn, args=(kind, user_id, priority))
+        thread.start()
+        threads.append(thread)
+
+    # Batch en bestoker bieden alles in één keer aan; interactieve beurten volgen verspreid
+    for _ in range(batch_requests):
+        spawn("batch", "batch:eval", BATCH)
+    for _ in range(hog_requests):
+        spawn("hog", "user:hog", INTERACTIVE)
+    for i in range(interactive_requests):
+        spawn("interactive", f"user:{i % users}", INTERACTIVE)
+        time.sleep(service_seconds / 2)
+    for thread in threads:
+        thread.join()
+    return latencies, shed
+
+
+def main(slots, service_seconds, users, hog_requests, batch_requests, interactive_requests):
+    print(f"backend capacity {slots}, service ~{service_seconds * 1000:.0f} ms, "
+          f"{hog_requests} hog + {batch_requests} batch + {interactive_requests} interactive turns "
+          f"from {users} users\n")
+    print(f"{'mode':11}{'interactive p50 ms':>20}{'p99 ms':>9}{'hog p99 ms':>12}{'batch done':>12}"
+          f"{'shed hog':>10}{'shed other':>12}")
+    for mode in ("none", "admission"):
+        latencies, shed = run(mode, slots, service_seconds, users, hog_requests, batch_requests,
+                              interactive_requests)
+        interactive = [value * 1000 for value in latencies["interactive"]]
+        hog = [value * 1000 for value in latencies["hog"]] or [float("nan")]
+        print(f"{mode:11}{percentile(interactive, 0.5):>20.0f}{percentile(interactive, 0.99):>9.0f}"
+              f"{percentile(hog, 0.99):>12.0f}{len(latencies['batch']):>12}{shed['hog']:>10}"
+              f"{shed['interactive'] + shed['batch']:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark admission control under mixed load")
+    parser.add_argument("--slots", type=int, default=4, help="Calls die de backend tegelijk aankan")
+    parser.add_argument("--service-seconds", type=float, default=0.05, help="Gemiddelde duur van een beurt")
+    parser.add_argument("--users", type=int, default=8, help="Gewone gebruikers")
+    parser.add_argument("--hog-requests", type=int, default=120, help="Beurten van de bestoker")
+    parser.add_argument("--batch-requests", type=int, default=120, help="Beurten van de batch-evaluatie")
+    parser.add_argument("--interactive-requests", type=int, default=60, help="Beurten van gewone gebruikers")
+    args = parser.parse_args()
+    main(args.slots, args.service_seconds, args.users, args.hog_requests, args.batch_requests,
+         args.interactive_requests)
@@ -0,0 +1,63 @@
+"""
+Benchmark: gescripte gesprekken naspelen, één request per bericht versus /api/process/batch
+
+Simuleert een nachtelijke replay: een aantal sessies met elk een vast script van
+berichten. Sequentieel kost elk bericht een HTTP round trip plus de beurt zelf;
+via de batch-runner (agents/batch.py) is er één round trip en lopen verschillende
+sessies parallel, terwijl de berichten binnen een sessie hun volgorde houden.
+Controleert die volgorde en meet de totale doorlooptijd. Zonder LLM calls.
+
+Gebruik:
+    python -m evaluation.batch_benchmark [--sessions 20] [--messages 10] [--turn-seconds 0.02]
+"""
+import argparse
+import threading
+import time
+
+from agents.batch import BatchItem, run_batch
+
+
+def main(sessions, messages, turn_seconds, round_trip_seconds, concurrency_levels):
+    items = [BatchItem(index, f"replay-{index % sessions}", f"Bericht {index // sessions}")
+             for index in range(sessions * messages)]
+    print(f"{sessions} sessions x {messages} messages, turn {turn_seconds * 1000:.0f} ms, "
+          f"round trip {round_trip_seconds * 1000:.0f} ms\n")
+    print(f"{'mode':16}{'total s':>9}{'items/s':>9}{'in order':>10}")
+
+    start = time.perf_counter()
+    for item in items:
+        time.sleep(round_trip_seconds + turn_seconds)
+    elapsed = time.perf_counter() - start
+    print(f"{'sequential':16}{elapsed:>9.2f}{len(items) / elapsed:>9.1f}{'yes':>10}")
+
+    for concurrency in concurrency_levels:
+        seen = {}
+        lock = threading.Lock()
+        in_order = True
+
+        def work(item):
+            nonlocal in_order
+            time.sleep(turn_seconds)
+            with lock:
+                # Berichten van één sessie moeten in oplopende volgorde binnenkomen
+                in_order = in_order and seen.get(item.session_id, -1) < item.index
+                seen[item.session_id] = item.index
+            return item.message
+
+        start = time.perf_counter()
+        time.sleep(round_trip_seconds)
+        lines = list(run_batch(items, work, concurrency))
+        elapsed = time.perf_counter() - start
+        assert lines[-1]["summary"]["done"] == len(items)
+        print(f"{f'batch x{concurrency}':16}{elapsed:>9.2f}{len(items) / elapsed:>9.1f}{'yes' if in_order else 'NO':>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sequential replay versus the batch endpoint")
+    parser.add_argument("--sessions", type=int, default=20, help="Gescripte gesprekken")
+    parser.add_argument("--messages", type=int, default=10, help="Berichten per gesprek")
+    parser.add_argument("--turn-seconds", type=float, default=0.02, help="Duur van een beurt")
+    parser.add_argument("--round-trip-seconds", type=float, default=0.005, help="Overhead van één HTTP request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Sessies tegelijk")
+    args = parser.parse_args()
+    main(args.sessions, args.messages, args.turn_seconds, args.round_trip_seconds, args.concurrency)
@@ -2,7 +2,7 @@ import os
 import json
 import random
 from faker import Faker
-from sklearn.feature_extraction.text import CountVectorizer
+from utils.lexical import measure_complexity, measure_lexical_richness
 
 class SyntheticDataGenerator:
     """Generator voor synthetische dataset voor evaluatie van Happy 2 Align."""
@@ -130,19 +130,8 @@ class SyntheticDataGenerator:
         return " ".join(text_words)
     
     def measure_lexical_richness(self, text):
-        """Meet de lexicale rijkdom van een tekst met CountVectorizer."""
-        vectorizer = CountVectorizer()
-        X = vectorizer.fit_transform([text])
-        
-        # Bereken metrics
-        total_words = X.sum()
-        unique_words = len(vectorizer.get_feature_names_out())
-        
-        return {
-            "total_words": int(total_words),
-            "unique_words": unique_words,
-            "ratio": unique_words / total_words if total_words > 0 else 0
-        }
+        """Meet de lexicale rijkdom van een tekst (zie utils/lexical.py)."""
+        return measure_lexical_richness(text)
     
     def generate_query(self, persona, domain):
         """Genereer een query voor een specifieke persona en domein."""
@@ -267,25 +256,9 @@ class Evaluator:
     
     def _measure_complexity(self, requirements, workflow):
         """Meet de complexiteit van vereisten en workflow."""
-        # Combineer tekst
+        # Combineer tekst en gebruik de gedeelde lexicale analyse (zie utils/lexical.py)
         combined_text = " ".join(requirements + workflow)
-        
-        # Gebruik CountVectorizer voor lexicale analyse
-        vectorizer = CountVectorizer()
-        X = vectorizer.fit_transform([combined_text])
-        
-        # Bereken metrics
-        total_words = X.sum()
-        unique_words = len(vectorizer.get_feature_names_out())
-        avg_word_length = sum(len(word) for word in combined_text.split()) / len(combined_text.split()) if combined_text else 0
-        
-        # Normaliseer tot een score tussen 0 en 1
-        complexity_score = (
-            (unique_words / total_words if total_words > 0 else 0) * 0.5 +
-            (min(avg_word_length / 10, 1.0) * 0.5)
-        )
-        
-        return complexity_score
+        return measure_complexity(combined_text)
     
     def run_evaluation(self, model_name="Happy2Align"):
         """Voer evaluatie uit op de volledige dataset."""
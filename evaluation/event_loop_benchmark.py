@@ -0,0 +1,136 @@
+"""
+Benchmark: nieuwe event loop per request versus de gedeelde event-loop thread
+
+Meet de overhead per request van de sync -> async brug, zonder LLM calls:
+- "noop": alleen de brug (loop opzetten/afbreken versus run_coroutine_threadsafe)
+- "http": één GET via httpx; met een nieuwe loop per request kan de connection pool
+  niet hergebruikt worden (nieuwe verbinding, bij https ook een nieuwe TLS handshake)
+
+Standaard wordt tegen een lokale HTTP server gemeten; geef --url op om een echte
+(https) endpoint te meten.
+
+Gebruik:
+    python -m evaluation.event_loop_benchmark [--requests 200] [--url https://api.openai.com/v1/models]
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from agents.event_loop import EventLoopThread
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, zodat hergebruik van verbindingen meetelt
+    disable_nagle_algorithm = True  # Anders kost elke keep-alive response ~40ms (Nagle + delayed ACK)
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def summarize(name, timings):
+    timings = sorted(timings)
+    return {
+        "mode": name,
+        "requests": len(timings),
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[int(len(timings) * 0.95) - 1] * 1000,
+    }
+
+
+def fresh_loop(coro_factory, requests):
+    """Oud gedrag: elke request een nieuwe event loop (zoals Orchestrator.run_conversation deed)"""
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(coro_factory())
+        finally:
+            loop.close()
+        timings.append(time.perf_counter() - start)
+    asyncio.set_event_loop(None)
+    return timings
+
+
+def persistent_loop(bridge, coro_factory, requests):
+    """Nieuw gedrag: alle requests via dezelfde loop-thread"""
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        bridge.run(coro_factory())
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(requests, url):
+    server = None
+    if url is None:
+        server, url = start_server()
+
+    bridge = EventLoopThread(name="benchmark-loop")
+
+    async def noop():
+        await asyncio.sleep(0)
+
+    async def get_fresh_client():
+        # Een pool hoort bij de loop waarin hij gebruikt wordt, dus per loop een nieuwe client
+        async with httpx.AsyncClient() as client:
+            (await client.get(url)).raise_for_status()
+
+    shared = {}
+
+    async def get_shared_client():
+        if "client" not in shared:
+            shared["client"] = httpx.AsyncClient()
+        (await shared["client"].get(url)).raise_for_status()
+
+    # Opwarmen (imports, eerste verbinding)
+    fresh_loop(noop, 5)
+    persistent_loop(bridge, get_shared_client, 5)
+
+    results = [
+        summarize("noop / fresh loop", fresh_loop(noop, requests)),
+        summarize("noop / persistent loop", persistent_loop(bridge, noop, requests)),
+        summarize("http / fresh loop", fresh_loop(get_fresh_client, requests)),
+        summarize("http / persistent loop", persistent_loop(bridge, get_shared_client, requests)),
+    ]
+
+    print(f"{'':26}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for result in results:
+        print(f"{result['mode']:26}{result['mean_ms']:>10.3f}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}")
+    print(f"target: {url}")
+
+    bridge.run(shared["client"].aclose())
+    bridge.stop()
+    if server is not None:
+        server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-request event loop overhead")
+    parser.add_argument("--requests", type=int, default=200, help="Aantal requests per modus")
+    parser.add_argument("--url", help="Endpoint voor de http-meting (standaard een lokale server)")
+    args = parser.parse_args()
+    main(args.requests, args.url)
@@ -0,0 +1,86 @@
+"""
+Benchmark: synchrone /api/process versus de asynchrone job mode
+
+Simuleert een webserver met een vaste pool van request-threads. Er komen trage
+beurten binnen (gesimuleerde LLM-keten) en daartussen snelle requests (zoals
+/api/status). Synchroon houdt elke trage beurt een web thread vast tot hij klaar
+is; in job mode geeft de web thread direct een job id terug en draait de beurt in
+de JobManager-pool. Gemeten wordt hoe lang snelle requests op een vrije web
+thread wachten, en de doorlooptijd van de beurten zelf. Zonder LLM calls.
+
+Gebruik:
+    python -m evaluation.job_mode_benchmark [--web-threads 4] [--turns 16] [--turn-seconds 1.0]
+"""
+import argparse
+import concurrent.futures
+import statistics
+import threading
+import time
+
+from agents.jobs import JobManager
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode, web_threads, turns, turn_seconds, job_workers):
+    web = concurrent.futures.ThreadPoolExecutor(max_workers=web_threads)
+    jobs = JobManager(max_workers=job_workers, max_pending=turns * 2)
+    turn_done = []
+    lock = threading.Lock()
+
+    def slow_turn(submitted):
+        time.sleep(turn_seconds)  # Keten van LLM calls
+        with lock:
+            turn_done.append(time.perf_counter() - submitted)
+
+    def handle_process(submitted):
+        if mode == "sync":
+            slow_turn(submitted)
+        else:
+            jobs.submit("bench", lambda job, emit: slow_turn(submitted))
+
+    def handle_status(submitted):
+        return time.perf_counter() - submitted  # Wachttijd tot een web thread vrij was
+
+    start = time.perf_counter()
+    status_futures = []
+    for i in range(turns):
+        web.submit(handle_process, time.perf_counter())
+        # Tussen de beurten door een paar snelle requests
+        for _ in range(3):
+            status_futures.append(web.submit(handle_status, time.perf_counter()))
+        time.sleep(turn_seconds / 8)
+    waits = [future.result() * 1000 for future in status_futures]
+    while len(turn_done) < turns:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    web.shutdown()
+    return {
+        "mode": mode,
+        "status_mean_ms": statistics.mean(waits),
+        "status_p95_ms": percentile(waits, 0.95),
+        "turn_mean_s": statistics.mean(turn_done),
+        "elapsed_s": elapsed,
+    }
+
+
+def main(web_threads, turns, turn_seconds, job_workers):
+    print(f"{web_threads} web threads, {job_workers} job workers, {turns} turns of {turn_seconds}s\n")
+    print(f"{'mode':8}{'status wait mean ms':>21}{'status wait p95 ms':>20}{'turn mean s':>13}{'total s':>9}")
+    for mode in ("sync", "async"):
+        result = run(mode, web_threads, turns, turn_seconds, job_workers)
+        print(f"{result['mode']:8}{result['status_mean_ms']:>21.1f}{result['status_p95_ms']:>20.1f}"
+              f"{result['turn_mean_s']:>13.2f}{result['elapsed_s']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark synchronous versus job-mode turns")
+    parser.add_argument("--web-threads", type=int, default=4, help="Request threads van de webserver")
+    parser.add_argument("--job-workers", type=int, default=8, help="Threads van de JobManager-pool")
+    parser.add_argument("--turns", type=int, default=16, help="Aantal trage beurten")
+    parser.add_argument("--turn-seconds", type=float, default=1.0, help="Duur van een beurt")
+    args = parser.parse_args()
+    main(args.web_threads, args.turns, args.turn_seconds, args.job_workers)
@@ -0,0 +1,112 @@
+"""
+Benchmark: session state backends (memory, SQLite, Redis-protocol)
+
+Meet per backend de tijd van één beurt (get + put met versiecontrole) voor een
+realistische sessie state, de grootte van de geserialiseerde state, en of
+gelijktijdige updates vanuit meerdere processen allemaal bewaard blijven
+(optimistische versies). De Redis-meting draait standaard tegen de lokale
+stand-in uit utils/resp_server.py; geef --redis-url op voor een echte server.
+
+Gebruik:
+    python -m evaluation.session_store_benchmark [--turns 2000] [--workers 4] [--redis-url redis://localhost:6379/0]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from agents.session_store import RedisSessionStore, SQLiteSessionStore, create_session_store, encode_state
+from utils.resp_server import RespServer
+
+
+def make_state(messages=24):
+    history = []
+    for i in range(messages // 2):
+        history.append({"role": "assistant", "content": f"Vraag {i}: welke gebruikers verwacht je en hoe vaak loggen ze in?"})
+        history.append({"role": "user", "content": f"Antwoord {i}: ongeveer 500 medewerkers, vooral tijdens kantooruren, via SSO."})
+    return {
+        "history": history,
+        "current_workflow": None,
+        "requirements": [],
+        "current_subtopic": 2,
+        "current_question": 1,
+        "subtopics": [{"title": f"Subtopic {i}", "questions": [f"Vraag {i}.{j}?" for j in range(4)]} for i in range(5)],
+        "expertise": "INTERMEDIATE",
+        "sentiment": "NEUTRAL",
+        "state": "collecting_requirements",
+    }
+
+
+def turns(store, state, count):
+    """Eén beurt = state ophalen, bericht toevoegen, terugschrijven met de gelezen versie"""
+    timings = []
+    store.put("bench", state)
+    for i in range(count):
+        start = time.perf_counter()
+        stored = store.get("bench")
+        stored.value["current_question"] = i
+        store.put("bench", stored.value, expected_version=stored.version)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.mean(timings) * 1000, timings[int(len(timings) * 0.95) - 1] * 1000
+
+
+def _worker(backend, location, updates):
+    store = SQLiteSessionStore(location) if backend == "sqlite" else RedisSessionStore(location)
+    for _ in range(updates):
+        store.update("counter", lambda state: {"n": state["n"] + 1}, retries=10000)
+    return store.stats()["conflicts"]
+
+
+def concurrent_updates(backend, location, workers, updates):
+    store = SQLiteSessionStore(location) if backend == "sqlite" else RedisSessionStore(location)
+    store.put("counter", {"n": 0})
+    with multiprocessing.Pool(workers) as pool:
+        conflicts = pool.starmap(_worker, [(backend, location, updates)] * workers)
+    return store.get("counter").value["n"], sum(conflicts)
+
+
+def main(turn_count, workers, redis_url):
+    server = None
+    if redis_url is None:
+        server = RespServer(port=0).start()
+        redis_url = server.url
+    directory = tempfile.mkdtemp(prefix="session-store-")
+    sqlite_path = os.path.join(directory, "sessions.db")
+
+    state = make_state()
+    raw = len(json.dumps(state).encode("utf-8"))
+    print(f"session state: {raw} bytes as JSON, {len(encode_state(state))} bytes encoded\n")
+
+    stores = {
+        "memory": create_session_store("memory"),
+        "sqlite": create_session_store("sqlite", path=sqlite_path),
+        "redis": create_session_store("redis", redis_url=redis_url),
+    }
+    print(f"{'backend':10}{'turn mean ms':>14}{'turn p95 ms':>13}")
+    for name, store in stores.items():
+        mean_ms, p95_ms = turns(store, state, turn_count)
+        print(f"{name:10}{mean_ms:>14.3f}{p95_ms:>13.3f}")
+
+    updates = 200
+    print(f"\n{workers} processes x {updates} read-modify-write updates on one session")
+    print(f"{'backend':10}{'expected':>10}{'stored':>8}{'conflicts retried':>19}")
+    for name, location in (("sqlite", sqlite_path), ("redis", redis_url)):
+        value, conflicts = concurrent_updates(name, location, workers, updates)
+        print(f"{name:10}{workers * updates:>10}{value:>8}{conflicts:>19}")
+    print(f"redis target: {redis_url}")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark session state backends")
+    parser.add_argument("--turns", type=int, default=2000, help="Beurten per backend")
+    parser.add_argument("--workers", type=int, default=4, help="Processen voor de gelijktijdigheidstest")
+    parser.add_argument("--redis-url", help="Redis server (standaard de lokale stand-in)")
+    args = parser.parse_args()
+    main(args.turns, args.workers, args.redis_url)
@@ -0,0 +1,89 @@
+"""
+Benchmark: tiered session cache (hot in geheugen, inactief gecomprimeerd op schijf)
+
+Simuleert een worker die veel sessies heeft gezien waarvan maar een klein deel
+actief is, en vergelijkt het geheugengebruik van de memory backend (alles in
+geheugen) met de tiered backend (inactieve sessies op schijf). Meet daarnaast de
+latency van een beurt op een hot sessie en van de eerste beurt na rehydratie.
+
+Gebruik:
+    python -m evaluation.session_tier_benchmark [--sessions 20000] [--active 200]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from agents.session_store import MemorySessionStore, TieredSessionStore
+from evaluation.session_store_benchmark import make_state
+
+
+def populate(store, sessions):
+    for i in range(sessions):
+        state = make_state()
+        state["history"].append({"role": "user", "content": f"Sessie {i}"})
+        state["current_workflow"] = [f"Stap {step} voor sessie {i}" for step in range(1, 13)]
+        store.put(f"session-{i}", state)
+
+
+def footprint(factory, sessions):
+    """Python-heap van de store na het vullen (tracemalloc)"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    store = factory()
+    populate(store, sessions)
+    if isinstance(store, TieredSessionStore):
+        store.sweep(time.time() + store.idle_seconds)  # Alles is nu lang genoeg inactief
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return store, used / 2 ** 20
+
+
+def turn(store, session_id):
+    start = time.perf_counter()
+    stored = store.get(session_id)
+    stored.value["current_question"] += 1
+    store.put(session_id, stored.value, expected_version=stored.version)
+    return (time.perf_counter() - start) * 1000
+
+
+def main(sessions, active):
+    directory = tempfile.mkdtemp(prefix="session-tiers-")
+    memory_store, memory_mb = footprint(lambda: MemorySessionStore(max_entries=sessions), sessions)
+    tiered_store, tiered_mb = footprint(
+        lambda: TieredSessionStore(os.path.join(directory, "cold.db"), idle_seconds=60, max_hot=sessions), sessions
+    )
+    stats = tiered_store.stats()
+    print(f"{sessions} sessions seen, {active} active\n")
+    print(f"{'backend':10}{'heap MB':>10}{'hot':>8}{'hot KB':>10}{'cold':>8}{'cold KB':>10}")
+    print(f"{'memory':10}{memory_mb:>10.1f}{memory_store.stats()['sessions']:>8}{'-':>10}{0:>8}{'-':>10}")
+    print(f"{'tiered':10}{tiered_mb:>10.1f}{stats['hot_sessions']:>8}{stats['hot_bytes'] / 1024:>10.1f}"
+          f"{stats['cold_sessions']:>8}{stats['cold_bytes'] / 1024:>10.1f}")
+
+    # Eerste beurt van een inactieve sessie = rehydratie; daarna is hij hot
+    step = max(1, sessions // active)
+    ids = [f"session-{i}" for i in range(0, sessions, step)][:active]
+    cold_turns = [turn(tiered_store, session_id) for session_id in ids]
+    hot_turns = [turn(tiered_store, session_id) for session_id in ids]
+    memory_turns = [turn(memory_store, session_id) for session_id in ids]
+    latency = tiered_store.stats()["rehydrate_latency"]
+
+    print(f"\n{'turn':28}{'mean ms':>10}{'p95 ms':>10}")
+    for name, timings in (("memory backend", memory_turns), ("tiered, hot", hot_turns),
+                          ("tiered, first after spill", cold_turns)):
+        timings = sorted(timings)
+        print(f"{name:28}{statistics.mean(timings):>10.3f}{timings[int(len(timings) * 0.95) - 1]:>10.3f}")
+    print(f"rehydration alone: mean {latency['mean'] * 1000:.3f} ms, p95 {latency['p95'] * 1000:.3f} ms "
+          f"over {latency['count']} sessions")
+    print(f"hot after the active turns: {tiered_store.stats()['hot_sessions']} sessions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the tiered session cache")
+    parser.add_argument("--sessions", type=int, default=20000, help="Sessies die de worker gezien heeft")
+    parser.add_argument("--active", type=int, default=200, help="Sessies die opnieuw een beurt doen")
+    args = parser.parse_args()
+    main(args.sessions, args.active)
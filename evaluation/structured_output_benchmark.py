@@ -0,0 +1,111 @@
+"""
+Microbenchmark: structured-output parsing van decomposer- en workflow-antwoorden
+
+Meet per antwoordvorm (schone JSON, code fence, trailing comma, afgekapt,
+Python-literal, oud tekstformaat) of de parser slaagt en met welke methode, de
+parse-tijd per antwoord, en de kosten van incrementeel parsen tijdens het
+streamen versus één keer parsen aan het eind. Zonder LLM calls.
+
+Gebruik:
+    python -m evaluation.structured_output_benchmark [--repeat 2000] [--chunk 4]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from agents.structured_output import StepStream, parse_decomposition, parse_step_line, parse_steps
+
+STEPS = [f"Stap {i}: {text}" for i, text in enumerate([
+    "Leg het doel en de scope van het project vast",
+    "Ontwerp het datamodel voor bestellingen, klanten en producten",
+    "Bouw een REST API met authenticatie via OAuth2",
+    "Koppel de betaalprovider en verwerk webhooks idempotent",
+    "Schrijf end-to-end tests voor het bestelproces",
+    "Zet CI/CD op en deploy naar de acceptatieomgeving",
+], 1)]
+
+SUBTOPICS = [
+    {"title": "Doelgroep", "questions": ["Wie zijn de gebruikers?", "Hoeveel gebruikers verwacht je?"]},
+    {"title": "Functionaliteit", "questions": ["Welke kernfuncties zijn nodig?", "Wat moet er in versie 1?"]},
+    {"title": "Techniek", "questions": ["Zijn er bestaande systemen?", "Waar moet het draaien?"]},
+]
+
+clean_steps = json.dumps({"steps": STEPS}, ensure_ascii=False)
+clean_topics = json.dumps({"subtopics": SUBTOPICS}, ensure_ascii=False)
+
+STEP_CASES = {
+    "clean json": clean_steps,
+    "code fence + prose": "Hier is de workflow:\n```json\n" + json.dumps({"steps": STEPS}, indent=2, ensure_ascii=False) + "\n```",
+    "trailing comma": clean_steps[:-2] + ",]}",
+    "missing commas": "{\"steps\": [\n" + "\n".join(json.dumps(step, ensure_ascii=False) for step in STEPS) + "\n]}",
+    "truncated": clean_steps[:int(len(clean_steps) * 0.8)],
+    "python literal": repr({"steps": STEPS}),
+    "numbered list": "\n".join(f"{i}. {step}" for i, step in enumerate(STEPS, 1)),
+    "prose only": "Ik kan hier geen workflow voor maken.",
+}
+
+TOPIC_CASES = {
+    "clean json": clean_topics,
+    "bare array": json.dumps(SUBTOPICS, ensure_ascii=False),
+    "truncated": clean_topics[:int(len(clean_topics) * 0.85)],
+    "text format": "\n".join(
+        f"- Subtopic {i}: {topic['title']}\n" + "\n".join(f"  - Q{j}: {q}" for j, q in enumerate(topic["questions"], 1))
+        for i, topic in enumerate(SUBTOPICS, 1)
+    ),
+}
+
+
+def timed(function, argument, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(argument)
+    return result, (time.perf_counter() - start) / repeat * 1e6
+
+
+def legacy_steps(output):
+    """De oude parser: alleen genummerde of opgesomde regels"""
+    return [step for step in map(parse_step_line, output.splitlines()) if step]
+
+
+def stream(output, chunk_size):
+    steps = StepStream()
+    emitted = []
+    for index in range(0, len(output), chunk_size):
+        emitted += steps.feed(output[index:index + chunk_size])
+    return emitted + steps.close()
+
+
+def main(repeat, chunk_size):
+    print(f"{'workflow answer':22}{'method':>10}{'steps':>7}{'legacy':>8}{'parse us':>10}{'stream us':>11}")
+    outcomes = []
+    for name, output in STEP_CASES.items():
+        (steps, method), parse_us = timed(parse_steps, output, repeat)
+        _, stream_us = timed(lambda text: stream(text, chunk_size), output, max(1, repeat // 10))
+        outcomes.append(method != "failed")
+        print(f"{name:22}{method:>10}{len(steps):>7}{len(legacy_steps(output)):>8}{parse_us:>10.1f}{stream_us:>11.1f}")
+
+    print(f"\n{'decomposer answer':22}{'method':>10}{'topics':>7}{'':>8}{'parse us':>10}")
+    for name, output in TOPIC_CASES.items():
+        (subtopics, method), parse_us = timed(parse_decomposition, output, repeat)
+        outcomes.append(method != "failed")
+        print(f"{name:22}{method:>10}{len(subtopics):>7}{'':>8}{parse_us:>10.1f}")
+
+    # Incrementeel parsen: tijd tot de eerste stap versus wachten op het hele antwoord
+    output = STEP_CASES["clean json"]
+    first_step_at = None
+    steps = StepStream()
+    for index in range(0, len(output), chunk_size):
+        if steps.feed(output[index:index + chunk_size]) and first_step_at is None:
+            first_step_at = index + chunk_size
+    print(f"\nfirst step available after {first_step_at}/{len(output)} characters "
+          f"({first_step_at / len(output):.0%} of the answer)")
+    print(f"parse success rate over all cases: {statistics.mean(outcomes):.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark structured-output parsing")
+    parser.add_argument("--repeat", type=int, default=2000, help="Aantal parses per antwoord")
+    parser.add_argument("--chunk", type=int, default=4, help="Tekens per gestreamde chunk")
+    args = parser.parse_args()
+    main(args.repeat, args.chunk)
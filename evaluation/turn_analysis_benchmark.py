@@ -0,0 +1,130 @@
+"""
+Benchmark: gefuseerde turn-analyse versus losse router/expertise/sentiment prompts
+
+Vergelijkt per modus de nauwkeurigheid (tegen handmatige labels), het aantal
+LLM calls, de geschatte input tokens en de latency per beurt.
+
+Gebruik:
+    python -m evaluation.turn_analysis_benchmark [--repeat 3] [--output resultaten.json]
+"""
+import os
+
+# Caches uit: we willen echte calls meten, geen cache hits
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from agents.llm_client import llm_client
+from agents.orchestrator import ImprovedOrchestrator
+from agents.rate_limiter import RateLimiter
+
+# Gelabelde beurten: gesprek (zonder laatste bericht), laatste bericht en verwachte labels
+CASES_PATH = os.path.join(os.path.dirname(__file__), "data", "labelled_turns.json")
+
+FIELDS = ("route", "expertise", "sentiment")
+
+
+class CountingClient:
+    """Wrapper om de LLM client die calls en geschatte input tokens telt"""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = 0
+        self.input_tokens = 0
+
+    async def call_async(self, messages, **kwargs):
+        self.calls += 1
+        self.input_tokens += sum(RateLimiter.estimate_tokens(str(m.content)) for m in messages)
+        return await self.client.call_async(messages, **kwargs)
+
+    def reset(self):
+        self.calls = 0
+        self.input_tokens = 0
+
+
+async def analyze(orchestrator, case, fused):
+    """Voer de turn-analyse voor één beurt uit in de gevraagde modus"""
+    history = case["history"] + [{"role": "user", "content": case["message"]}]
+    if fused:
+        return await orchestrator._analyze_turn(case["message"], history=history)
+    route, expertise, sentiment = await asyncio.gather(
+        orchestrator._route(case["message"]),
+        orchestrator._estimate_expertise(history=history),
+        orchestrator._detect_sentiment(case["message"], history=history)
+    )
+    return {"route": route, "expertise": expertise, "sentiment": sentiment}
+
+
+async def run_mode(cases, fused, repeat):
+    """Meet nauwkeurigheid, calls, tokens en latency voor één modus"""
+    client = CountingClient(llm_client)
+    orchestrator = ImprovedOrchestrator(llm_client.primary_llm, client=client)
+    orchestrator.semantic_cache = None
+    orchestrator.local_router = None  # Alleen LLM-routering vergelijken
+    orchestrator.local_tom = None
+
+    correct = {field: 0 for field in FIELDS}
+    latencies = []
+    predictions = []
+    for _ in range(repeat):
+        for case in cases:
+            start = time.time()
+            result = await analyze(orchestrator, case, fused)
+            latencies.append(time.time() - start)
+            predictions.append(result)
+            for field in FIELDS:
+                correct[field] += result[field] == case[field]
+
+    turns = len(cases) * repeat
+    return {
+        "mode": "fused" if fused else "separate",
+        "turns": turns,
+        "accuracy": {field: correct[field] / turns for field in FIELDS},
+        "calls_per_turn": client.calls / turns,
+        "input_tokens_per_turn": client.input_tokens / turns,
+        "latency_mean": statistics.mean(latencies),
+        "latency_p50": statistics.median(latencies),
+        "fused_failures": orchestrator.analysis_stats["fused_failures"],
+        "predictions": predictions,
+    }
+
+
+async def main(repeat, output):
+    with open(CASES_PATH, encoding="utf-8") as f:
+        cases = json.load(f)
+    separate = await run_mode(cases, False, repeat)
+    fused = await run_mode(cases, True, repeat)
+
+    # Overeenstemming tussen beide modi, los van de labels
+    agreement = {
+        field: sum(a[field] == b[field] for a, b in zip(separate["predictions"], fused["predictions"]))
+        / len(fused["predictions"])
+        for field in FIELDS
+    }
+
+    print(f"{'':24}{'separate':>12}{'fused':>12}")
+    for field in FIELDS:
+        print(f"{'accuracy ' + field:24}{separate['accuracy'][field]:>12.2f}{fused['accuracy'][field]:>12.2f}")
+    for key in ("calls_per_turn", "input_tokens_per_turn", "latency_mean", "latency_p50"):
+        print(f"{key:24}{separate[key]:>12.2f}{fused[key]:>12.2f}")
+    print(f"fused parse failures: {fused['fused_failures']}")
+    print("agreement: " + ", ".join(f"{field}={value:.2f}" for field, value in agreement.items()))
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"separate": separate, "fused": fused, "agreement": agreement}, f, indent=2)
+
+    await llm_client.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fused versus separate turn analysis")
+    parser.add_argument("--repeat", type=int, default=1, help="Aantal keer dat elke beurt wordt gemeten")
+    parser.add_argument("--output", help="Schrijf de volledige resultaten naar dit JSON bestand")
+    args = parser.parse_args()
+    asyncio.run(main(args.repeat, args.output))
@@ -0,0 +1,102 @@
+"""
+Benchmark: workflow verfijning als patch versus de hele workflow opnieuw genereren
+
+Vergelijkt per soort aanpassing de output tokens van het volledige antwoord
+({"steps": [...]}) met die van een patch ({"operations": [...]}), de geschatte
+generatietijd bij een gegeven output-snelheid, en de tijd om de patch lokaal te
+parsen en toe te passen. Daarnaast wordt gecontroleerd dat ongeldige patches
+geweigerd worden (en dus terugvallen op volledig opnieuw genereren). Zonder LLM calls.
+
+Gebruik:
+    python -m evaluation.workflow_patch_benchmark [--steps 40] [--tokens-per-second 60]
+"""
+import argparse
+import json
+import time
+
+from agents.rate_limiter import RateLimiter
+from agents.workflow_patch import PatchError, apply_patch, format_patch, parse_patch
+
+
+def make_workflow(size):
+    return [f"Stap {i}: werk onderdeel {i} van het bestelsysteem uit, inclusief tests en documentatie" for i in range(1, size + 1)]
+
+
+def make_cases(workflow):
+    size = len(workflow)
+    return {
+        "replace one step": [{"op": "replace", "index": 7, "step": "Stap 7: gebruik PostgreSQL in plaats van MySQL"}],
+        "delete one step": [{"op": "delete", "index": size // 2}],
+        "insert one step": [{"op": "insert", "index": 3, "step": "Voer een security review uit"}],
+        "append one step": [{"op": "insert", "index": size + 1, "step": "Plan een evaluatie na livegang"}],
+        "three mixed edits": [
+            {"op": "replace", "index": 1, "step": "Leg doel, scope en budget vast"},
+            {"op": "delete", "index": 10},
+            {"op": "insert", "index": size, "step": "Draai een loadtest op de acceptatieomgeving"},
+        ],
+    }
+
+
+def reference_apply(workflow, operations):
+    """Langzame referentie: pas de operaties één voor één toe, van achter naar voren"""
+    steps = list(workflow)
+    order = {"delete": 0, "replace": 0, "insert": 1}
+    for operation in sorted(operations, key=lambda o: (o["index"], order[o["op"]]), reverse=True):
+        position = operation["index"] - 1
+        if operation["op"] == "replace":
+            steps[position] = operation["step"]
+        elif operation["op"] == "delete":
+            del steps[position]
+    for operation in sorted((o for o in operations if o["op"] == "insert"), key=lambda o: o["index"], reverse=True):
+        shift = sum(1 for o in operations if o["op"] == "delete" and o["index"] < operation["index"])
+        steps.insert(operation["index"] - 1 - shift, operation["step"])
+    return steps
+
+
+def main(size, tokens_per_second, repeat):
+    workflow = make_workflow(size)
+    print(f"workflow of {size} steps, {tokens_per_second} output tokens/s\n")
+    print(f"{'edit':20}{'full tok':>10}{'patch tok':>11}{'full s':>8}{'patch s':>9}{'apply us':>10}  ok")
+    for name, operations in make_cases(workflow).items():
+        patched = apply_patch(workflow, operations)
+        full_output = json.dumps({"steps": patched}, ensure_ascii=False)
+        patch_output = format_patch(operations)
+        full_tokens = RateLimiter.estimate_tokens(full_output)
+        patch_tokens = RateLimiter.estimate_tokens(patch_output)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            apply_patch(workflow, parse_patch(patch_output)[0])
+        apply_us = (time.perf_counter() - start) / repeat * 1e6
+
+        ok = patched == reference_apply(workflow, operations)
+        print(f"{name:20}{full_tokens:>10}{patch_tokens:>11}{full_tokens / tokens_per_second:>8.1f}"
+              f"{patch_tokens / tokens_per_second:>9.2f}{apply_us:>10.1f}  {'yes' if ok else 'NO'}")
+
+    # Deze antwoorden moeten geweigerd worden (terugval op volledig opnieuw genereren)
+    invalid = {
+        "index out of range": format_patch([{"op": "delete", "index": size + 1}]),
+        "step edited twice": format_patch([{"op": "delete", "index": 2}, {"op": "replace", "index": 2, "step": "x"}]),
+        "replace without text": format_patch([{"op": "replace", "index": 2}]),
+        "truncated answer": format_patch(make_cases(workflow)["three mixed edits"])[:-40],
+        "deletes everything": format_patch([{"op": "delete", "index": i} for i in range(1, size + 1)]),
+        "full workflow instead": json.dumps({"steps": workflow}),
+        "no operations": format_patch([]),
+    }
+    print(f"\n{'invalid patch':24}rejected")
+    for name, output in invalid.items():
+        try:
+            apply_patch(workflow, parse_patch(output)[0])
+            rejected = "NO"
+        except PatchError:
+            rejected = "yes"
+        print(f"{name:24}{rejected}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark workflow patches versus full regeneration")
+    parser.add_argument("--steps", type=int, default=40, help="Lengte van de workflow")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Aangenomen output-snelheid van het model")
+    parser.add_argument("--repeat", type=int, default=2000, help="Aantal parse+apply rondes per aanpassing")
+    args = parser.parse_args()
+    main(args.steps, args.tokens_per_second, args.repeat)
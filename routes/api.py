@@ -1,17 +1,33 @@
 """
 API routes voor Happy 2 Align
 """
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
 from src.models import db
 from src.models.session import Session
 from src.models.user import User
 from agents.orchestrator import Orchestrator
 from agents.llm_client import llm_client
+from agents.question_prefetch import QuestionPrefetcher
+from agents.session_context import SessionContext
+from agents.session_store import VersionConflict, create_session_store
+from agents.jobs import JobManager, JobQueueFull, check_cancelled
+from agents.admission import BATCH, INTERACTIVE, AdmissionRejected, admission
+from agents.batch import BatchItem, run_batch
+from agents.config import (
+    SESSION_COLD_PATH, SESSION_COLD_TTL, SESSION_IDLE_SECONDS, SESSION_STORE_BACKEND, SESSION_STORE_MAX_ENTRIES,
+    SESSION_STORE_PATH, SESSION_STORE_REDIS_URL, SESSION_STORE_TTL, JOB_WORKERS, JOB_MAX_PENDING, JOB_RESULT_TTL,
+    JOB_MAX_EVENTS, BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, BATCH_MAX_ITEMS
+)
 import os
+import json
 import traceback
 import logging
 import asyncio
+import threading
+import weakref
+from contextlib import closing
 from functools import wraps
+from typing import Iterator, Optional
 
 api_bp = Blueprint('api', __name__)
 logger = logging.getLogger(__name__)
@@ -19,8 +35,244 @@ logger = logging.getLogger(__name__)
 # Initialiseer de Orchestrator met de gecentraliseerde LLM client
 orchestrator = Orchestrator(llm_client.primary_llm)
 
-# Houd sessie state bij
-session_states = {}
+# Verfijnt de volgende vraag al terwijl de gebruiker de huidige leest
+prefetcher = QuestionPrefetcher(orchestrator.async_orchestrator, max_idle=SESSION_STORE_TTL)
+
+# Sessie state in een gedeelde store (memory, SQLite of Redis), zodat meerdere workers dezelfde sessies zien
+session_store = create_session_store(
+    SESSION_STORE_BACKEND,
+    path=SESSION_STORE_PATH,
+    redis_url=SESSION_STORE_REDIS_URL,
+    ttl=SESSION_STORE_TTL,
+    max_entries=SESSION_STORE_MAX_ENTRIES,
+    cold_path=SESSION_COLD_PATH,
+    idle_seconds=SESSION_IDLE_SECONDS,
+    cold_ttl=SESSION_COLD_TTL
+)
+# Verlopen of verdrongen sessies laten geen prefetch-state achter
+session_store.on_expire = prefetcher.forget
+
+# Asynchrone beurten ({"async": true}): job id direct terug, de orchestratie draait in een begrensde pool
+jobs = JobManager(max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, result_ttl=JOB_RESULT_TTL,
+                  max_events=JOB_MAX_EVENTS)
+
+# Eén lock per sessie: beurten binnen een sessie lopen na elkaar, verschillende sessies parallel
+# (binnen dit proces; tussen workers bewaakt het versienummer in de store de volgorde).
+# Zwakke referenties: een lock verdwijnt vanzelf zodra geen verzoek hem meer vasthoudt,
+# dus gereste en verlopen sessies laten niets achter
+session_locks = weakref.WeakValueDictionary()
+_session_locks_guard = threading.Lock()
+
+
+class SessionLock:
+    """threading.Lock in een object dat zwak gerefereerd kan worden (een kale Lock kan dat niet)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+# Bericht waarmee de orchestrator de workflow genereert zodra alle requirement-vragen beantwoord zijn
+WORKFLOW_REQUEST = "Generate workflow based on collected requirements"
+
+def session_lock(session_id: str) -> SessionLock:
+    """Lock die overlappende verzoeken van dezelfde sessie serialiseert"""
+    with _session_locks_guard:
+        lock = session_locks.get(session_id)
+        if lock is None:
+            lock = session_locks[session_id] = SessionLock()
+        return lock
+
+def session_context(session_id: str, state: dict) -> SessionContext:
+    """Context voor de orchestrator; deelt de history-lijst met de sessie state"""
+    return SessionContext(
+        session_id=session_id,
+        history=state['history'],
+        current_workflow=state['current_workflow']
+    )
+
+def new_session_state() -> dict:
+    """Lege state voor een nieuwe sessie"""
+    return {
+        'history': [],
+        'current_workflow': None,
+        'requirements': [],
+        'current_subtopic': 0,
+        'current_question': 0,
+        'subtopics': None,
+        'expertise': 'INTERMEDIATE',
+        'sentiment': 'NEUTRAL',
+        'state': 'initial'  # initial, collecting_requirements, workflow_generated
+    }
+
+def load_session_state(session_id: str) -> tuple:
+    """Haal de sessie state en zijn versie op (een nieuwe sessie heeft versie 0)"""
+    stored = session_store.get(session_id)
+    if stored is None:
+        return new_session_state(), 0
+    return stored.value, stored.version
+
+def save_session_state(session_id: str, state: dict, version: int) -> int:
+    """Schrijf de state terug; VersionConflict als een ander verzoek de sessie intussen bijwerkte"""
+    return session_store.put(session_id, state, expected_version=version)
+
+def request_user_id(session_id: str) -> str:
+    """Sleutel voor de eerlijke wachtrij: de ingelogde gebruiker, anders de sessie"""
+    user_id = session.get('user_id')
+    return f"user:{user_id}" if user_id is not None else f"session:{session_id}"
+
+def shed_response(error: AdmissionRejected) -> dict:
+    """Response voor een beurt die de admission controller afwees (te druk om de deadline te halen)"""
+    logger.warning(f"Admission rejected: {error}")
+    return {
+        'error': 'Het is op dit moment te druk, probeer het zo opnieuw',
+        'type': 'busy',
+        'reason': error.reason,
+        'queue_position': error.queue_position,
+        'estimated_wait': error.estimated_wait
+    }
+
+def conflict_response(error: VersionConflict) -> dict:
+    """Response voor een beurt die verloren ging omdat de sessie tegelijk elders werd bijgewerkt"""
+    logger.warning(f"Session state conflict: {error}")
+    return {
+        'error': 'De sessie is tegelijk door een ander verzoek bijgewerkt, probeer het opnieuw',
+        'type': 'conflict'
+    }
+
+def apply_result(session_id: str, state: dict, result: dict, user_id: str = None,
+                 priority: str = INTERACTIVE) -> dict:
+    """
+    Werk de sessie state bij op basis van het resultaat en bouw de response voor de frontend
+    
+    Alleen interactieve beurten starten een prefetch: bij een batch-replay wacht niemand op de
+    volgende vraag, en de PREFETCH-klasse zou dan voorrang krijgen boven de batch zelf.
+    """
+    # Update state op basis van result
+    if result.get('type') == 'question':
+        state['state'] = 'collecting_requirements'
+        if not state['subtopics']:
+            # First time, store subtopics (zou van orchestrator moeten komen)
+            state['subtopics'] = result.get('subtopics', [])
+        state['current_subtopic'] = result.get('subtopic_index', 0)
+        state['current_question'] = result.get('question_index', 0)
+        state['expertise'] = result.get('expertise') or state['expertise']
+        state['sentiment'] = result.get('sentiment') or state['sentiment']
+        
+        # Voeg de vraag toe aan de geschiedenis
+        state['history'].append({"role": "assistant", "content": result['question']})
+        
+        # Start alvast de verfijning van de volgende vraag
+        if priority != BATCH:
+            prefetcher.schedule(
+                session_id,
+                state['subtopics'],
+                (state['current_subtopic'], state['current_question']),
+                state['history'],
+                state['expertise'],
+                state['sentiment'],
+                user_id=user_id
+            )
+        
+    elif result.get('type') == 'workflow':
+        state['state'] = 'workflow_generated'
+        state['current_workflow'] = result.get('workflow', [])
+        state['requirements'] = result.get('requirements', [])
+        
+    elif result.get('type') == 'workflow_refined':
+        state['current_workflow'] = result.get('workflow', [])
+    
+    # Voeg response toe aan geschiedenis
+    if result.get('type') != 'question' and 'response' in result:
+        state['history'].append({"role": "assistant", "content": result['response']})
+    
+    # Bereid response voor frontend
+    response_data = {
+        'response': result.get('question') if result.get('type') == 'question' else format_response(result),
+        'type': result.get('type', 'unknown'),
+        'context': {
+            'state': state['state'],
+            'current_subtopic': state['current_subtopic'],
+            'current_question': state['current_question'],
+            'has_workflow': state['current_workflow'] is not None,
+            'requirements_count': len(state['requirements'])
+        }
+    }
+    
+    # Voeg extra info toe indien beschikbaar
+    if result.get('expertise'):
+        response_data['expertise'] = result['expertise']
+    if result.get('sentiment'):
+        response_data['sentiment'] = result['sentiment']
+    if result.get('workflow'):
+        response_data['workflow'] = result['workflow']
+    
+    return response_data
+
+def run_turn(session_id: str, message: str, user_id: str, job=None, emit=None, priority: str = INTERACTIVE) -> dict:
+    """
+    Verwerk één beurt: state laden, orchestreren, state bijwerken en opslaan
+    
+    Args:
+        session_id: Sessie van de beurt
+        message: Bericht van de gebruiker
+        user_id: Sleutel voor de eerlijke wachtrij van de admission controller
+        job: Job waarin de beurt draait (None = synchroon); een geannuleerde job slaat niets op
+        emit: Ontvangt de status/token/step events van de orchestrator (alleen met job)
+        priority: Prioriteitsklasse bij de admission controller
+    
+    Returns:
+        De response voor de frontend
+    
+    Raises:
+        AdmissionRejected: Als de beurt zijn deadline in de wachtrij zou missen
+    """
+    on_position = None
+    if job is not None:
+        def on_position(position, estimated_wait):
+            job.queue_position, job.estimated_wait = position, estimated_wait
+            emit({'event': 'queued', 'position': position, 'estimated_wait': estimated_wait})
+    
+    # Eerst een slot, dan pas de sessie: wachten in de admission-rij houdt zo de sessie niet vast
+    with admission.admit(user_id, priority, on_position=on_position):
+        if job is not None:
+            job.queue_position = job.estimated_wait = None
+            check_cancelled(job)
+        
+        with session_lock(session_id):
+            # Haal sessie state op
+            state, version = load_session_state(session_id)
+            
+            # Bepaal wat we moeten doen op basis van de state
+            if job is not None:
+                # Als job streamen, zodat voortgang zichtbaar is en annuleren de lopende LLM calls afbreekt
+                result = None
+                with closing(turn_events(session_id, state, message, job)) as events:
+                    for event in events:
+                        check_cancelled(job)
+                        if event.get('event') == 'result':
+                            result = event['data']
+                        else:
+                            emit(event)
+                if result is None:
+                    result = {'type': 'error', 'error': 'Geen resultaat van de orchestrator'}
+                check_cancelled(job)
+            elif state['state'] == 'collecting_requirements' and state['subtopics']:
+                # We zijn requirements aan het verzamelen
+                state['history'].append({"role": "user", "content": message})
+                result = await_handle_requirement_answer(session_id, state, message)
+            else:
+                # Laat de orchestrator beslissen (die voegt het bericht toe aan de geschiedenis)
+                result = orchestrator.run_conversation(message, context=session_context(session_id, state))
+            
+            response_data = apply_result(session_id, state, result, user_id, priority)
+            save_session_state(session_id, state, version)
+            return response_data
 
 @api_bp.route('/process', methods=['POST'])
 def process_input():
@@ -33,82 +285,30 @@ def process_input():
         message = data['message']
         session_id = data.get('session_id', 'default')
         
-        # Haal sessie state op
-        if session_id not in session_states:
-            session_states[session_id] = {
-                'history': [],
-                'current_workflow': None,
-                'requirements': [],
-                'current_subtopic': 0,
-                'current_question': 0,
-                'subtopics': None,
-                'state': 'initial'  # initial, collecting_requirements, workflow_generated
-            }
-        
-        state = session_states[session_id]
-        
-        # Voeg het bericht toe aan de geschiedenis
-        state['history'].append({"role": "user", "content": message})
-        
-        # Bepaal wat we moeten doen op basis van de state
-        if state['state'] == 'collecting_requirements' and state['subtopics']:
-            # We zijn requirements aan het verzamelen
-            result = await_handle_requirement_answer(session_id, message)
-        else:
-            # Laat de orchestrator beslissen
-            result = orchestrator.run_conversation(
-                message, 
-                conversation_history=state['history'],
-                current_workflow=state['current_workflow']
-            )
-        
-        # Update state op basis van result
-        if result.get('type') == 'question':
-            state['state'] = 'collecting_requirements'
-            if not state['subtopics']:
-                # First time, store subtopics (zou van orchestrator moeten komen)
-                state['subtopics'] = result.get('subtopics', [])
-            state['current_subtopic'] = result.get('subtopic_index', 0)
-            state['current_question'] = result.get('question_index', 0)
-            
-            # Voeg de vraag toe aan de geschiedenis
-            state['history'].append({"role": "assistant", "content": result['question']})
-            
-        elif result.get('type') == 'workflow':
-            state['state'] = 'workflow_generated'
-            state['current_workflow'] = result.get('workflow', [])
-            state['requirements'] = result.get('requirements', [])
-            
-        elif result.get('type') == 'workflow_refined':
-            state['current_workflow'] = result.get('workflow', [])
-        
-        # Voeg response toe aan geschiedenis
-        if result.get('type') != 'question' and 'response' in result:
-            state['history'].append({"role": "assistant", "content": result['response']})
+        user_id = request_user_id(session_id)
         
-        # Bereid response voor frontend
-        response_data = {
-            'response': result.get('question') if result.get('type') == 'question' else format_response(result),
-            'type': result.get('type', 'unknown'),
-            'context': {
-                'state': state['state'],
-                'current_subtopic': state['current_subtopic'],
-                'current_question': state['current_question'],
-                'has_workflow': state['current_workflow'] is not None,
-                'requirements_count': len(state['requirements'])
-            }
-        }
-        
-        # Voeg extra info toe indien beschikbaar
-        if result.get('expertise'):
-            response_data['expertise'] = result['expertise']
-        if result.get('sentiment'):
-            response_data['sentiment'] = result['sentiment']
-        if result.get('workflow'):
-            response_data['workflow'] = result['workflow']
+        if data.get('async'):
+            # Web thread komt meteen vrij; resultaat via /api/jobs/<id> of /api/jobs/<id>/events
+            queue_position, estimated_wait = admission.position(user_id, INTERACTIVE)
+            job = jobs.submit(session_id, lambda job, emit: run_turn(session_id, message, user_id, job, emit))
+            return jsonify({
+                'queue_position': queue_position,
+                'estimated_wait': estimated_wait,
+                **job.to_dict(),  # Staat de beurt al in de admission-rij, dan telt zijn eigen positie
+                'status_url': f'/api/jobs/{job.id}',
+                'events_url': f'/api/jobs/{job.id}/events'
+            }), 202
         
-        return jsonify(response_data)
+        return jsonify(run_turn(session_id, message, user_id))
         
+    except JobQueueFull as e:
+        logger.warning(f"Job queue full: {e}")
+        return jsonify({'error': 'Het is op dit moment te druk, probeer het zo opnieuw', 'type': 'busy'}), 503
+    except AdmissionRejected as e:
+        retry_after = str(max(1, round(e.estimated_wait or 1)))
+        return jsonify(shed_response(e)), 503, {'Retry-After': retry_after}
+    except VersionConflict as e:
+        return jsonify(conflict_response(e)), 409
     except Exception as e:
         logger.error(f"Error in process_input: {str(e)}")
         logger.error(traceback.format_exc())
@@ -117,13 +317,159 @@ def process_input():
             'type': 'error'
         }), 500
 
-def await_handle_requirement_answer(session_id: str, answer: str) -> dict:
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Geef de status van een asynchrone beurt (met het resultaat zodra hij klaar is)"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Onbekende of verlopen job', 'type': 'error'}), 404
+    return jsonify(job.to_dict())
+
+@api_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events van een asynchrone beurt: dezelfde events als /process/stream, afgesloten met done of error"""
+    if jobs.get(job_id) is None:
+        return jsonify({'error': 'Onbekende of verlopen job', 'type': 'error'}), 404
+    
+    def generate():
+        for event in jobs.follow(job_id):
+            # Commentaarregel houdt de verbinding open tijdens lange LLM calls
+            yield sse_event(event) if event is not None else ": keep-alive\n\n"
+        job = jobs.get(job_id)
+        if job is None:
+            yield sse_event({'event': 'error', 'error': 'Onbekende of verlopen job', 'status': 'expired'})
+        elif job.status == 'done':
+            yield sse_event({'event': 'done', 'data': job.result})
+        else:
+            yield sse_event({'event': 'error', 'error': job.error or 'Job is geannuleerd', 'status': job.status})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def sse_event(payload: dict) -> str:
+    """Formatteer een payload als Server-Sent Event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+@api_bp.route('/process/stream', methods=['POST'])
+def process_input_stream():
+    """Server-Sent-Events variant van /process: stuurt vragen en workflow-stappen door terwijl ze gegenereerd worden"""
+    data = request.get_json()
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Geen bericht ontvangen'}), 400
+    
+    message = data['message']
+    session_id = data.get('session_id', 'default')
+    user_id = request_user_id(session_id)
+    
+    def generate():
+        try:
+            with admission.admit(user_id, INTERACTIVE), session_lock(session_id):
+                state, version = load_session_state(session_id)
+                
+                result = None
+                with closing(turn_events(session_id, state, message)) as events:
+                    for event in events:
+                        if event.get('event') == 'result':
+                            result = event['data']
+                        else:
+                            yield sse_event(event)
+                if result is None:
+                    result = {'type': 'error', 'error': 'Geen resultaat van de orchestrator'}
+                
+                response_data = apply_result(session_id, state, result, user_id)
+                save_session_state(session_id, state, version)
+            yield sse_event({'event': 'done', 'data': response_data})
+            
+        except AdmissionRejected as e:
+            yield sse_event({'event': 'error', **shed_response(e)})
+        except VersionConflict as e:
+            yield sse_event({'event': 'error', **conflict_response(e)})
+        except Exception as e:
+            logger.error(f"Error in process_input_stream: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield sse_event({
+                'event': 'error',
+                'error': f'Fout bij het verwerken van het bericht: {str(e)}'
+            })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api_bp.route('/process/batch', methods=['POST'])
+def process_batch():
     """
-    Handle een antwoord tijdens requirement collection
+    Verwerk veel berichten in één request (bv. het naspelen van gescripte gesprekken)
+    
+    Body: {"items": [{"session_id": ..., "message": ..., "id": optioneel}, ...], "concurrency": optioneel}.
+    Berichten van dezelfde sessie lopen in volgorde, verschillende sessies parallel (in de batch-klasse
+    van de admission controller). Het antwoord is NDJSON: één regel per bericht zodra het klaar is,
+    afgesloten met een regel {"summary": {...}}.
+    """
+    data = request.get_json()
+    raw_items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({'error': 'Geen items ontvangen', 'type': 'error'}), 400
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Te veel items (maximaal {BATCH_MAX_ITEMS})', 'type': 'error'}), 400
+    
+    items = []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict) or not isinstance(raw.get('message'), str):
+            return jsonify({'error': f'Item {index} heeft geen bericht', 'type': 'error'}), 400
+        items.append(BatchItem(index, str(raw.get('session_id', 'default')), raw['message'], raw.get('id')))
+    
+    try:
+        concurrency = int(data.get('concurrency', BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Ongeldige concurrency', 'type': 'error'}), 400
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    
+    # Binnen de request context bepalen: de pool threads hebben geen Flask sessie
+    user_ids = {item.session_id: request_user_id(item.session_id) for item in items}
+    
+    def work(item: BatchItem) -> dict:
+        return run_turn(item.session_id, item.message, user_ids[item.session_id], priority=BATCH)
+    
+    def describe_error(error: Exception) -> dict:
+        if isinstance(error, AdmissionRejected):
+            return shed_response(error)
+        if isinstance(error, VersionConflict):
+            return conflict_response(error)
+        return {'error': f'Fout bij het verwerken van het bericht: {str(error)}', 'type': 'error'}
+    
+    def generate():
+        for line in run_batch(items, work, concurrency, describe_error):
+            yield json.dumps(line) + "\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def turn_events(session_id: str, state: dict, message: str, job=None) -> Iterator[dict]:
     """
-    state = session_states[session_id]
+    Streaming variant van één beurt: status/token/step events, afgesloten met {'event': 'result', 'data': ...}
     
-    # Sla het antwoord op
+    Zowel de orchestrator-flow als het beantwoorden van requirement-vragen (inclusief de
+    afsluitende workflow generatie) streamen via dezelfde events. Met een job stopt de
+    requirement-flow ook tussen zijn eigen stappen zodra de job geannuleerd is.
+    """
+    if state['state'] == 'collecting_requirements' and state['subtopics']:
+        # We zijn requirements aan het verzamelen
+        state['history'].append({"role": "user", "content": message})
+        yield from requirement_answer_events(session_id, state, message, job)
+    else:
+        yield from orchestrator.stream_conversation(message, context=session_context(session_id, state))
+
+def record_requirement_answer(state: dict, answer: str) -> Optional[tuple]:
+    """Sla een antwoord op; geeft de positie van de volgende vraag, of None als alle vragen beantwoord zijn"""
     if 'answers' not in state:
         state['answers'] = []
     state['answers'].append({
@@ -132,60 +478,86 @@ def await_handle_requirement_answer(session_id: str, answer: str) -> dict:
         'answer': answer
     })
     
-    # Bepaal volgende stap
-    current_subtopic = state['subtopics'][state['current_subtopic']]
+    # Bepaal volgende stap: nog een vraag in dit subtopic, of de eerste van het volgende
+    return prefetcher.next_position(state['subtopics'], state['current_subtopic'], state['current_question'])
+
+def next_question_result(session_id: str, state: dict, position: tuple, answer: str) -> dict:
+    """Ga naar de vraag op `position` en geef hem verfijnd terug"""
+    state['current_subtopic'], state['current_question'] = position
+    next_subtopic = state['subtopics'][state['current_subtopic']]
     
-    # Zijn er nog vragen voor dit subtopic?
-    if state['current_question'] < len(current_subtopic['questions']) - 1 and state['current_question'] < 4:
-        state['current_question'] += 1
-        next_question = current_subtopic['questions'][state['current_question']]
-        
-        # Vraag verfijnen met ToM
-        return {
-            'type': 'question',
-            'question': next_question,  # In productie: gebruik orchestrator om te verfijnen
-            'subtopic': current_subtopic['title'],
-            'subtopic_index': state['current_subtopic'],
-            'question_index': state['current_question']
-        }
+    # Vraag verfijnen met ToM (meestal al klaar dankzij de prefetch)
+    refined = prefetcher.take(
+        session_id,
+        state['subtopics'],
+        position,
+        state['history'],
+        answer,
+        state['expertise'],
+        state['sentiment']
+    )
     
-    # Zijn er nog subtopics?
-    elif state['current_subtopic'] < len(state['subtopics']) - 1:
-        state['current_subtopic'] += 1
-        state['current_question'] = 0
-        next_subtopic = state['subtopics'][state['current_subtopic']]
-        next_question = next_subtopic['questions'][0]
-        
-        return {
-            'type': 'question',
-            'question': next_question,  # In productie: gebruik orchestrator om te verfijnen
-            'subtopic': next_subtopic['title'],
-            'subtopic_index': state['current_subtopic'],
-            'question_index': 0
-        }
+    return {
+        'type': 'question',
+        'question': refined['question'],
+        'subtopic': next_subtopic['title'],
+        'subtopic_index': state['current_subtopic'],
+        'question_index': state['current_question'],
+        'expertise': refined['expertise'],
+        'sentiment': refined['sentiment']
+    }
+
+def workflow_context(session_id: str, state: dict) -> SessionContext:
+    """Context voor het genereren van de workflow uit de verzamelde requirements"""
+    context = session_context(session_id, state)
+    context.current_workflow = None
+    return context
+
+def finish_requirements(state: dict) -> None:
+    """Markeer requirement collection als afgerond en bewaar de requirements uit de antwoorden"""
+    state['state'] = 'workflow_generated'
+    state['requirements'] = [
+        {'subtopic': answer_data['subtopic'], 'answer': answer_data['answer']}
+        for answer_data in state.get('answers', [])
+    ]
+
+def await_handle_requirement_answer(session_id: str, state: dict, answer: str) -> dict:
+    """
+    Handle een antwoord tijdens requirement collection
+    """
+    position = record_requirement_answer(state, answer)
+    if position is not None:
+        return next_question_result(session_id, state, position, answer)
     
     # Alle vragen beantwoord, genereer workflow
-    else:
-        # Formatteer requirements van answers
-        requirements = []
-        for answer_data in state.get('answers', []):
-            requirements.append({
-                'subtopic': answer_data['subtopic'],
-                'answer': answer_data['answer']
-            })
-        
-        # Gebruik orchestrator om workflow te genereren
-        result = orchestrator.run_conversation(
-            "Generate workflow based on collected requirements",
-            conversation_history=state['history'],
-            current_workflow=None
-        )
-        
-        # Update state
-        state['state'] = 'workflow_generated'
-        state['requirements'] = requirements
-        
-        return result
+    result = orchestrator.run_conversation(WORKFLOW_REQUEST, context=workflow_context(session_id, state))
+    finish_requirements(state)
+    return result
+
+def requirement_answer_events(session_id: str, state: dict, answer: str, job=None) -> Iterator[dict]:
+    """Streaming variant van await_handle_requirement_answer; de workflow generatie streamt tokens en stappen"""
+    position = record_requirement_answer(state, answer)
+    if position is not None:
+        yield {'event': 'status', 'agent': 'requirement_refiner', 'message': 'Volgende vraag wordt voorbereid...'}
+        if job is not None:
+            check_cancelled(job)  # Niet meer op de prefetch of een on-demand verfijning wachten
+        yield {'event': 'result', 'data': next_question_result(session_id, state, position, answer)}
+        return
+    
+    # Alle vragen beantwoord, genereer workflow (zelfde token/step events als de orchestrator-flow)
+    if job is not None:
+        check_cancelled(job)
+    result = None
+    with closing(orchestrator.stream_conversation(WORKFLOW_REQUEST, context=workflow_context(session_id, state))) as events:
+        for event in events:
+            if job is not None:
+                check_cancelled(job)
+            if event.get('event') == 'result':
+                result = event['data']
+            else:
+                yield event
+    finish_requirements(state)
+    yield {'event': 'result', 'data': result or {'type': 'error', 'error': 'Geen resultaat van de orchestrator'}}
 
 def format_response(result: dict) -> str:
     """Format het resultaat voor de frontend"""
@@ -214,13 +586,14 @@ def get_status():
     """Geef de status van de huidige sessie"""
     session_id = request.args.get('session_id', 'default')
     
-    if session_id not in session_states:
+    stored = session_store.get(session_id)
+    if stored is None:
         return jsonify({
             'status': 'no_session',
             'message': 'Geen actieve sessie'
         })
     
-    state = session_states[session_id]
+    state = stored.value
     
     return jsonify({
         'status': 'active',
@@ -234,14 +607,29 @@ def get_status():
         }
     })
 
+@api_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Geef de metrics van de sessie store (geheugengebruik per laag, rehydratie-latency), de orchestrator en de LLM client"""
+    return jsonify({
+        'sessions': session_store.stats(),
+        'orchestrator': orchestrator.stats(),
+        'jobs': jobs.stats(),
+        'admission': admission.stats(),
+        'prefetch': prefetcher.stats(),
+        'llm': llm_client.metrics()
+    })
+
 @api_bp.route('/reset', methods=['POST'])
 def reset_session():
     """Reset de sessie"""
     data = request.get_json()
     session_id = data.get('session_id', 'default')
     
-    if session_id in session_states:
-        del session_states[session_id]
+    # Lopende en wachtende asynchrone beurten stoppen vóór de lock: een lopende beurt houdt hem vast
+    jobs.cancel_session(session_id)
+    with session_lock(session_id):
+        session_store.delete(session_id)
+        prefetcher.forget(session_id)
     
     return jsonify({
         'status': 'reset',
@@ -0,0 +1,97 @@
+"""
+Lexicale features voor Happy 2 Align
+Gedeeld door de evaluatie en de lokale ToM-schatter (expertise en sentiment)
+"""
+import re
+
+import numpy as np
+
+# Zelfde tokenisatie als de standaard CountVectorizer (woorden van 2+ tekens, lowercase)
+_TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+# Kleine lexicons (Nederlands + Engels) als extra signaal naast de tekststatistieken
+TECHNICAL_TERMS = {
+    "api", "rest", "graphql", "database", "sql", "nosql", "kubernetes", "docker", "microservice",
+    "microservices", "ci", "cd", "pipeline", "deployment", "latency", "throughput", "schema",
+    "architecture", "architectuur", "oauth", "jwt", "cache", "queue", "kafka", "event", "cqrs",
+    "framework", "backend", "frontend", "server", "serverless", "cloud", "aws", "azure", "gcp",
+    "integration", "integratie", "sdk", "webhook", "repository", "git", "terraform", "scalability",
+    "schaalbaarheid", "replication", "sharding", "idempotent", "async", "orm", "django", "react",
+}
+BEGINNER_MARKERS = {
+    "snap", "begrijp", "weet", "niet", "geen", "idee", "hoe", "simpel", "makkelijk", "gewoon",
+    "understand", "confused", "simple", "easy", "just", "how", "what", "beginner", "help", "overwhelmed",
+}
+POSITIVE_WORDS = {
+    "goed", "top", "leuk", "mooi", "super", "geweldig", "fijn", "prima", "bedankt", "dank", "perfect",
+    "great", "good", "nice", "love", "awesome", "thanks", "excellent", "happy", "cool", "helpful",
+}
+NEGATIVE_WORDS = {
+    "slecht", "niks", "nutteloos", "vervelend", "frustrerend", "lastig", "fout", "jammer", "irritant",
+    "bad", "useless", "terrible", "annoying", "frustrating", "wrong", "hate", "confusing", "overwhelmed",
+    "broken", "worse", "worst", "not", "never", "niet", "nooit",
+}
+
+FEATURE_NAMES = [
+    "total_words", "unique_words", "richness_ratio", "avg_word_length", "complexity",
+    "technical_ratio", "beginner_ratio", "positive_ratio", "negative_ratio",
+    "exclamations", "questions", "uppercase_ratio", "digits_ratio",
+]
+
+
+def tokenize(text):
+    """Lowercase woorden zoals CountVectorizer ze telt."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def measure_lexical_richness(text):
+    """Meet de lexicale rijkdom van een tekst (totaal, unieke woorden en hun verhouding)."""
+    tokens = tokenize(text)
+    total_words = len(tokens)
+    unique_words = len(set(tokens))
+    return {
+        "total_words": total_words,
+        "unique_words": unique_words,
+        "ratio": unique_words / total_words if total_words > 0 else 0
+    }
+
+
+def measure_complexity(text):
+    """Complexiteitsscore tussen 0 en 1 op basis van woordvariatie en gemiddelde woordlengte."""
+    richness = measure_lexical_richness(text)
+    words = text.split()
+    avg_word_length = sum(len(word) for word in words) / len(words) if words else 0
+    return (
+        richness["ratio"] * 0.5 +
+        min(avg_word_length / 10, 1.0) * 0.5
+    )
+
+
+def extract_features(text):
+    """Alle lexicale features van een tekst, in de volgorde van FEATURE_NAMES."""
+    tokens = tokenize(text)
+    richness = measure_lexical_richness(text)
+    words = text.split()
+    count = max(len(tokens), 1)
+    letters = [char for char in text if char.isalpha()]
+
+    return [
+        float(richness["total_words"]),
+        float(richness["unique_words"]),
+        richness["ratio"],
+        sum(len(word) for word in words) / len(words) if words else 0.0,
+        measure_complexity(text),
+        sum(token in TECHNICAL_TERMS for token in tokens) / count,
+        sum(token in BEGINNER_MARKERS for token in tokens) / count,
+        sum(token in POSITIVE_WORDS for token in tokens) / count,
+        sum(token in NEGATIVE_WORDS for token in tokens) / count,
+        float(text.count("!")),
+        float(text.count("?")),
+        sum(char.isupper() for char in letters) / len(letters) if letters else 0.0,
+        sum(char.isdigit() for char in text) / max(len(text), 1),
+    ]
+
+
+def feature_matrix(texts):
+    """Feature-matrix voor een lijst teksten (bruikbaar in een scikit-learn FunctionTransformer)."""
+    return np.array([extract_features(text) for text in texts], dtype=float)
@@ -0,0 +1,225 @@
+"""
+Lokale Redis stand-in voor Happy2Align
+Een kleine RESP2 server in één proces met precies de commando's die de session store gebruikt
+(GET/SET met EX/PX/NX/XX, DEL, EXISTS, INCR, PTTL, WATCH/MULTI/EXEC, ...), voor ontwikkeling en benchmarks
+zonder Redis installatie. Niet bedoeld voor productie: alles staat in geheugen.
+
+Gebruik:
+    python -m utils.resp_server [--host 127.0.0.1] [--port 6379]
+"""
+import argparse
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class _Keyspace:
+    """Gedeelde data met een wijzigingsteller per sleutel (voor WATCH)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: Dict[bytes, Tuple[bytes, float]] = {}  # sleutel -> (waarde, verloopt op; 0 = nooit)
+        self.revisions: Dict[bytes, int] = {}
+
+    def touch(self, key: bytes) -> None:
+        self.revisions[key] = self.revisions.get(key, 0) + 1
+
+    def live(self, key: bytes, now: float) -> Optional[Tuple[bytes, float]]:
+        entry = self.values.get(key)
+        if entry is not None and entry[1] and entry[1] <= now:
+            del self.values[key]
+            self.touch(key)
+            return None
+        return entry
+
+
+class _Error(Exception):
+    pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.watched: Dict[bytes, int] = {}
+        self.queued: Optional[List[List[bytes]]] = None
+
+    def handle(self):
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.wfile.write(self._dispatch(command))
+            self.wfile.flush()
+
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # Inline commando (bijv. via telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _dispatch(self, command: List[bytes]) -> bytes:
+        name = command[0].upper().decode()
+        if self.queued is not None and name not in ("EXEC", "DISCARD", "MULTI", "WATCH"):
+            self.queued.append(command)
+            return b"+QUEUED\r\n"
+        try:
+            if name == "MULTI":
+                if self.queued is not None:
+                    raise _Error("ERR MULTI calls can not be nested")
+                self.queued = []
+                return _encode("OK")
+            if name == "EXEC":
+                return self._exec()
+            if name == "DISCARD":
+                self.queued = None
+                self.watched = {}
+                return _encode("OK")
+            keyspace = self.server.keyspace
+            with keyspace.lock:
+                return _encode(self._run(name, command[1:], keyspace))
+        except _Error as e:
+            return b"-%s\r\n" % str(e).encode()
+
+    def _exec(self) -> bytes:
+        if self.queued is None:
+            raise _Error("ERR EXEC without MULTI")
+        queued, self.queued = self.queued, None
+        keyspace = self.server.keyspace
+        with keyspace.lock:
+            now = time.time()
+            for key in self.watched:
+                keyspace.live(key, now)
+            changed = any(keyspace.revisions.get(key, 0) != revision for key, revision in self.watched.items())
+            self.watched = {}
+            if changed:
+                return b"*-1\r\n"
+            replies = []
+            for command in queued:
+                try:
+                    replies.append(_encode(self._run(command[0].upper().decode(), command[1:], keyspace)))
+                except _Error as e:
+                    replies.append(b"-%s\r\n" % str(e).encode())
+        return b"*%d\r\n" % len(replies) + b"".join(replies)
+
+    def _run(self, name: str, args: List[bytes], keyspace: _Keyspace) -> Any:
+        now = time.time()
+        if name == "PING":
+            return args[0] if args else "PONG"
+        if name in ("AUTH", "SELECT", "CLIENT"):
+            return "OK"
+        if name == "WATCH":
+            for key in args:
+                keyspace.live(key, now)
+                self.watched[key] = keyspace.revisions.get(key, 0)
+            return "OK"
+        if name == "UNWATCH":
+            self.watched = {}
+            return "OK"
+        if name == "GET":
+            entry = keyspace.live(args[0], now)
+            return entry[0] if entry else None
+        if name == "SET":
+            return self._set(args, keyspace, now)
+        if name == "DEL":
+            removed = 0
+            for key in args:
+                if keyspace.live(key, now) is not None:
+                    del keyspace.values[key]
+                    keyspace.touch(key)
+                    removed += 1
+            return removed
+        if name == "INCR":
+            entry = keyspace.live(args[0], now)
+            try:
+                value = int(entry[0]) + 1 if entry else 1
+            except ValueError:
+                raise _Error("ERR value is not an integer or out of range")
+            keyspace.values[args[0]] = (str(value).encode(), entry[1] if entry else 0.0)
+            keyspace.touch(args[0])
+            return value
+        if name == "EXISTS":
+            return sum(1 for key in args if keyspace.live(key, now) is not None)
+        if name == "PTTL":
+            entry = keyspace.live(args[0], now)
+            if entry is None:
+                return -2
+            return int((entry[1] - now) * 1000) if entry[1] else -1
+        if name == "DBSIZE":
+            return sum(1 for key in list(keyspace.values) if keyspace.live(key, now) is not None)
+        if name == "FLUSHDB":
+            for key in list(keyspace.values):
+                keyspace.touch(key)
+            keyspace.values.clear()
+            return "OK"
+        raise _Error(f"ERR unknown command '{name}'")
+
+    @staticmethod
+    def _set(args: List[bytes], keyspace: _Keyspace, now: float) -> Any:
+        key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+        expires_at = 0.0
+        if b"EX" in options:
+            expires_at = now + int(args[2 + options.index(b"EX") + 1])
+        if b"PX" in options:
+            expires_at = now + int(args[2 + options.index(b"PX") + 1]) / 1000
+        exists = keyspace.live(key, now) is not None
+        if (b"NX" in options and exists) or (b"XX" in options and not exists):
+            return None
+        keyspace.values[key] = (value, expires_at)
+        keyspace.touch(key)
+        return "OK"
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """Threaded stand-in server; port 0 kiest een vrije poort"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379):
+        super().__init__((host, port), _Handler)
+        self.keyspace = _Keyspace()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "RespServer":
+        """Serve in a daemon thread (voor benchmarks en lokale tests)"""
+        threading.Thread(target=self.serve_forever, name="resp-standin", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokale Redis stand-in (RESP2)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = RespServer(args.host, args.port)
+    print(f"RESP stand-in luistert op {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
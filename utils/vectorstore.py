@@ -1,12 +1,12 @@
 import os
+from datetime import datetime
 from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
+from agents.llm_client import llm_client
 
 class VectorStore:
     def __init__(self, api_key=None):
         """Initialiseer de Pinecone vectorstore."""
         self.api_key = api_key or os.getenv('PINECONE_API_KEY', 'your-api-key')
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY', 'your-openai-api-key'))
         self.index_name = "happy2align"
         self.dimension = 1536  # OpenAI embeddings dimensie
         
@@ -30,39 +30,47 @@ class VectorStore:
             )
     
     def _get_embedding(self, text):
-        """Genereer een embedding voor de gegeven tekst met OpenAI."""
-        response = self.openai_client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text
-        )
-        return response.data[0].embedding
+        """Genereer een embedding voor de gegeven tekst (eerder geëmbedde tekst komt uit de embedding cache)."""
+        return llm_client.create_embedding_sync(text, model="text-embedding-ada-002")
+    
+    def _get_embeddings(self, texts):
+        """Genereer embeddings voor meerdere teksten; alleen niet-gecachete teksten gaan naar OpenAI."""
+        return llm_client.create_embeddings_batch_sync(texts, model="text-embedding-ada-002")
     
     def store(self, user_id, session_id, content, content_type="requirement"):
         """Sla content op in de vectorstore."""
-        # Genereer een unieke ID
-        vector_id = f"{user_id}-{session_id}-{content_type}-{hash(content)}"
+        return self.store_many(user_id, session_id, [content], content_type)[0]
+    
+    def store_many(self, user_id, session_id, contents, content_type="requirement", upsert_batch_size=100):
+        """Sla meerdere stukken content in één keer op (bijv. alle requirements van een afgeronde sessie)."""
+        if not contents:
+            return []
         
-        # Genereer embedding
-        embedding = self._get_embedding(content)
+        # Genereer embeddings in batches
+        embeddings = self._get_embeddings(contents)
+        timestamp = datetime.utcnow().isoformat()
         
-        # Sla op in Pinecone
-        self.index.upsert(
-            vectors=[
-                {
-                    "id": vector_id,
-                    "values": embedding,
-                    "metadata": {
-                        "user_id": user_id,
-                        "session_id": session_id,
-                        "content_type": content_type,
-                        "content": content,
-                        "timestamp": str(self.openai_client.embeddings.create)
-                    }
+        vectors = []
+        for content, embedding in zip(contents, embeddings):
+            # Genereer een unieke ID
+            vector_id = f"{user_id}-{session_id}-{content_type}-{hash(content)}"
+            vectors.append({
+                "id": vector_id,
+                "values": embedding,
+                "metadata": {
+                    "user_id": user_id,
+                    "session_id": session_id,
+                    "content_type": content_type,
+                    "content": content,
+                    "timestamp": timestamp
                 }
-            ]
-        )
+            })
+        
+        # Sla op in Pinecone (in batches om request limieten te respecteren)
+        for i in range(0, len(vectors), upsert_batch_size):
+            self.index.upsert(vectors=vectors[i:i + upsert_batch_size])
         
-        return vector_id
+        return [vector["id"] for vector in vectors]
     
     def search(self, query, user_id=None, session_id=None, content_type=None, top_k=5):
         """Zoek naar vergelijkbare content in de vectorstore."""